@@ -1,15 +1,43 @@
-from datetime import datetime, timezone
-import aiohttp
-from fastapi import APIRouter, Request, Query
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from asyncio_redis import Pool
+from fastapi import APIRouter, Request, Query, Response
+from pydantic_core import to_json
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.middlewares.db_session import get_db_session
 from app.db.organization.repo import OrganizationRepo
-from app.db.report.repo import ReportRepo
+from app.db.report.repo import ReportRepo, get_report_available_since
+from app.exceptions import BfoOrganizationNotFoundException
 from app.helpers.bfo_api import (
     search_organization_by_inn,
     get_details_by_organization_id,
 )
+from app.helpers.hot_cache import report_hot_cache
+from app.helpers.negative_cache import (
+    organization_no_reports_cache,
+    organization_not_found_cache,
+)
+from app.helpers.organization_cache import organization_cache
+from app.helpers.redis import (
+    acquire_refresh_lock,
+    is_refresh_lock_owner,
+    release_refresh_lock,
+    wait_refresh_lock_released,
+)
+from app.helpers.response_cache import report_response_cache, response_ttl_seconds
+from app.helpers.single_flight import (
+    organization_single_flight,
+    refresh_single_flight,
+)
+from app.logger import logger
+from app.schemas.db.organization import Organization
 from app.schemas.query_params import GetReportParams
-from app.schemas.responses import GetReportResponse
+from app.schemas.responses import (
+    GET_REPORT_RESPONSE_INFO_FIELDS,
+    GetReportResponse,
+)
 from app.settings import settings
 
 
@@ -17,6 +45,313 @@ router_v1 = APIRouter(prefix="/api/v1/report", tags=["v1"])
 router_v2 = APIRouter(prefix="/api/v2/report", tags=["v2"])
 
 
+async def invalidate_report_responses(redis: Pool, organization_id: int) -> None:
+    """
+    Инвалидация закэшированных ответов организации (после фиксации изменений в БД)
+
+    :param redis: Подключение к redis
+    :param organization_id: id организации
+    """
+    version = await report_response_cache.invalidate(redis, organization_id)
+    if settings.REPORT_HOT_CACHE_ENABLED:
+        report_hot_cache.invalidate(organization_id, version)
+
+
+async def create_organization_from_bfo(
+    request: Request, db_session: AsyncSession, inn: str
+) -> Organization:
+    """
+    Поиск организации в БФО и создание записи в БД
+
+    Выполняется через organization_single_flight, поэтому одновременные
+    запросы с одним ИНН делают один запрос к БФО. Изменения фиксируются сразу,
+    чтобы ожидающие запросы видели организацию в своих сессиях.
+    ИНН, которые БФО не нашёл, запоминаются в organization_not_found_cache
+
+    :param request: Запрос
+    :param db_session: Сессия БД текущего запроса
+    :param inn: ИНН организации
+
+    :return: Модель организации
+    """
+    redis = request.app.state.redis
+    organization_repo = OrganizationRepo(db_session)
+    # организацию мог создать запрос, завершившийся до нас
+    organization = await organization_repo.get_organization_by_inn(inn)
+    if organization is not None:
+        return organization
+    if await organization_not_found_cache.contains(redis, inn):
+        raise BfoOrganizationNotFoundException(inn)
+    try:
+        organization_result = await search_organization_by_inn(
+            redis, request.app.state.bfo_session, inn
+        )
+    except BfoOrganizationNotFoundException:
+        await organization_not_found_cache.add(redis, inn)
+        raise
+    organization = await organization_repo.create_organization(
+        organization_result.id,
+        inn,
+        organization_result.model_dump(exclude={"id"}),
+    )
+    await db_session.commit()
+    # upsert мог изменить данные организации, закэшированные другими воркерами
+    await organization_cache.invalidate(redis, inn)
+    organization_cache.set(organization)
+    await invalidate_report_responses(redis, organization.id)
+    return organization
+
+
+async def refresh_organization_reports(
+    request: Request, db_session: AsyncSession, organization_id: int
+) -> None:
+    """
+    Обновление отчётов организации из БФО
+
+    Выполняется через refresh_single_flight (ключ - id организации) под
+    блокировкой в redis, общей для всех воркеров. Изменения фиксируются сразу,
+    после чего ожидающие запросы (этого и других воркеров) читают свежие
+    отчёты из БД, не обращаясь к БФО. Организации без отчётов в БФО
+    запоминаются в organization_no_reports_cache
+
+    :param request: Запрос
+    :param db_session: Сессия БД текущего запроса
+    :param organization_id: id организации
+    """
+    redis = request.app.state.redis
+    if await organization_no_reports_cache.contains(redis, organization_id):
+        # недавно проверяли - в БФО нет отчётов организации
+        return
+    report_repo = ReportRepo(db_session)
+    token = await acquire_refresh_lock(redis, organization_id)
+    if token is None:
+        # отчёты обновляет другой воркер, дождёмся его и проверим результат
+        checked_at = await get_last_checked_at(report_repo, organization_id)
+        if await wait_refresh_lock_released(redis, organization_id):
+            if await organization_no_reports_cache.contains(
+                redis, organization_id
+            ) or await get_last_checked_at(report_repo, organization_id) != checked_at:
+                return
+            logger.warning(
+                f"Другой воркер не обновил отчёты организации {organization_id}, "
+                "обновляем самостоятельно"
+            )
+            token = await acquire_refresh_lock(redis, organization_id)
+        else:
+            logger.warning(
+                f"Не дождались обновления отчётов организации {organization_id}, "
+                "обновляем самостоятельно"
+            )
+    try:
+        organization_details = await get_details_by_organization_id(
+            redis, request.app.state.bfo_session, organization_id
+        )
+        if len(organization_details.reports) == 0:
+            if await is_refresh_lock_lost(redis, organization_id, token):
+                return
+            await organization_no_reports_cache.add(redis, organization_id)
+            return
+        await report_repo.update_or_create_report_from_bfo(
+            organization_id, organization_details.reports
+        )
+        # проверка непосредственно перед фиксацией: запись, сделанная после
+        # потери блокировки, могла бы перезаписать отчёты нового владельца
+        if await is_refresh_lock_lost(redis, organization_id, token):
+            await db_session.rollback()
+            return
+        await db_session.commit()
+        # после фиксации, чтобы в кэш не попал ответ со старыми отчётами
+        await invalidate_report_responses(redis, organization_id)
+    finally:
+        if token is not None:
+            await release_refresh_lock(redis, organization_id, token)
+
+
+async def get_last_checked_at(
+    report_repo: ReportRepo, organization_id: int
+) -> Optional[datetime]:
+    """Дата последней проверки отчётов организации в БФО (None - отчётов нет)"""
+    freshness = await report_repo.get_last_report_freshness_by_organization_id(
+        organization_id
+    )
+    return freshness.checked_at if freshness is not None else None
+
+
+async def is_refresh_lock_lost(
+    redis: Pool, organization_id: int, token: Optional[int]
+) -> bool:
+    """
+    Блокировка обновления истекла и, возможно, захвачена другим воркером
+    (без токена - обновление без блокировки после таймаута ожидания)
+    """
+    if token is None or await is_refresh_lock_owner(redis, organization_id, token):
+        return False
+    logger.warning(
+        f"Блокировка обновления организации {organization_id} потеряна, "
+        "отчёты не записаны"
+    )
+    return True
+
+
+def is_report_stale(checked_at: Optional[datetime]) -> bool:
+    """
+    Отчёта нет или он проверялся в БФО больше REPORT_AVAILABLE_DAYS назад
+    (то же условие, что и в запросах ReportRepo)
+    """
+    return checked_at is None or checked_at < get_report_available_since()
+
+
+async def refresh_reports(
+    request: Request, db_session: AsyncSession, organization_id: int
+) -> Optional[int]:
+    """
+    Обновление отчётов организации (объединяется с одновременными обновлениями)
+
+    :param request: Запрос
+    :param db_session: Сессия БД текущего запроса
+    :param organization_id: id организации
+
+    :return: Версия ответов организации после обновления (если включён кэш ответов)
+    """
+    await refresh_single_flight.do(
+        organization_id,
+        refresh_organization_reports,
+        request,
+        db_session,
+        organization_id,
+    )
+    return await get_report_response_version(request, organization_id)
+
+
+def is_response_cache_enabled() -> bool:
+    """Включён ли кэш ответов в redis или в памяти воркера"""
+    return settings.REPORT_RESPONSE_CACHE_ENABLED or settings.REPORT_HOT_CACHE_ENABLED
+
+
+async def get_report_response_version(
+    request: Request, organization_id: int
+) -> Optional[int]:
+    """
+    Версия ответов организации, если включён кэш ответов
+    (читается до чтения отчётов из БД)
+    """
+    if not is_response_cache_enabled():
+        return None
+    return await report_response_cache.get_version(
+        request.app.state.redis, organization_id
+    )
+
+
+async def get_cached_report_response(
+    request: Request, api: str, params: GetReportParams
+) -> Optional[Response]:
+    """
+    Ответ из кэша без обращения к БД: сначала из памяти воркера
+    (REPORT_HOT_CACHE_ENABLED), затем из redis (REPORT_RESPONSE_CACHE_ENABLED)
+    """
+    key = report_response_cache.get_key(api, params.inn, params.periods)
+    if settings.REPORT_HOT_CACHE_ENABLED:
+        body = report_hot_cache.get(key)
+        if body is not None:
+            return Response(content=body, media_type="application/json")
+    if not settings.REPORT_RESPONSE_CACHE_ENABLED:
+        return None
+    cached = await report_response_cache.get(
+        request.app.state.redis, api, params.inn, params.periods
+    )
+    if cached is None:
+        return None
+    body = cached.body.encode("utf-8")
+    if settings.REPORT_HOT_CACHE_ENABLED:
+        report_hot_cache.set(
+            key, cached.organization_id, cached.version, body, cached.ttl_seconds
+        )
+    return Response(content=body, media_type="application/json")
+
+
+async def report_body_fast(
+    report_repo: ReportRepo,
+    organization: Organization,
+    periods: Optional[List[int]],
+) -> bytes:
+    """
+    Ответ, собранный из строк БД и сериализованный один раз
+    (REPORT_FAST_SERIALIZATION), без моделей Report и валидации pydantic
+    """
+    reports_by_period = await report_repo.get_reports_for_response(
+        organization.id, periods
+    )
+    result = {"inn": organization.inn}
+    for field in GET_REPORT_RESPONSE_INFO_FIELDS:
+        result[field] = organization.info.get(field)
+    result["periods"] = [
+        {"year": period, "reports": reports}
+        for period, reports in reports_by_period.items()
+    ]
+    return to_json(result)
+
+
+async def report_response(
+    request: Request,
+    api: str,
+    params: GetReportParams,
+    report_repo: ReportRepo,
+    organization: Organization,
+    version: Optional[int],
+    checked_at: Optional[datetime],
+    result: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Ответ в выбранном режиме сериализации, сохраняемый в кэш ответов
+
+    :param request: Запрос
+    :param api: Версия API (v1, v2)
+    :param params: Параметры запроса
+    :param report_repo: Репозиторий отчётов
+    :param organization: Модель организации
+    :param version: Версия ответов организации, прочитанная до чтения отчётов
+    :param checked_at: Когда проверялся самый старый отчёт ответа (None - сейчас)
+    :param result: Ответ для валидации pydantic (если не включены
+        REPORT_DB_SERIALIZATION и REPORT_FAST_SERIALIZATION)
+
+    :return: Response или result (для валидации по response_model)
+    """
+    if settings.REPORT_DB_SERIALIZATION:
+        # ответ, собранный в БД, без валидации pydantic
+        body = (
+            await report_repo.get_report_response_json(organization.id, params.periods)
+        ).encode("utf-8")
+    elif settings.REPORT_FAST_SERIALIZATION:
+        body = await report_body_fast(report_repo, organization, params.periods)
+    elif not is_response_cache_enabled():
+        return result
+    else:
+        # в result модели Report, как и при валидации по response_model
+        body = GetReportResponse.model_validate(
+            result, from_attributes=True
+        ).model_dump_json().encode("utf-8")
+    if settings.REPORT_RESPONSE_CACHE_ENABLED:
+        await report_response_cache.set(
+            request.app.state.redis,
+            api,
+            params.inn,
+            params.periods,
+            organization.id,
+            version,
+            body,
+            checked_at,
+        )
+    if settings.REPORT_HOT_CACHE_ENABLED:
+        report_hot_cache.set(
+            report_response_cache.get_key(api, params.inn, params.periods),
+            organization.id,
+            version,
+            body,
+            response_ttl_seconds(checked_at),
+        )
+    return Response(content=body, media_type="application/json")
+
+
 @router_v1.get(
     "",
     summary="Запрос на получение БФО отчёта организации",
@@ -25,56 +360,58 @@ router_v2 = APIRouter(prefix="/api/v2/report", tags=["v2"])
     response_model=GetReportResponse,
 )
 async def get_report_handler(request: Request, params: GetReportParams = Query()):
-    organization_repo = OrganizationRepo(request.app.state.db_session)
-    report_repo = ReportRepo(request.app.state.db_session)
+    cached_response = await get_cached_report_response(request, "v1", params)
+    if cached_response is not None:
+        return cached_response
+    db_session = get_db_session(request)
+    organization_repo = OrganizationRepo(db_session)
+    report_repo = ReportRepo(db_session)
     # поиск организации в БД
     organization = await organization_repo.get_organization_by_inn(params.inn)
     result = {"inn": params.inn, "periods": []}
-    async with aiohttp.ClientSession() as session:
-        if organization is None:
-            # создать запись об организации
-            organization_result = await search_organization_by_inn(
-                request.app.state.redis, session, params.inn
-            )
-            organization = await organization_repo.create_organization(
-                organization_result.id,
-                params.inn,
-                organization_result.model_dump(exclude={"id"}),
-            )
-        # найти дату последнего отчёта для этой организации
-        last_report = await report_repo.get_last_report_by_organization_id(
+    if organization is None:
+        # создать запись об организации
+        organization = await organization_single_flight.do(
+            params.inn, create_organization_from_bfo, request, db_session, params.inn
+        )
+    version = await get_report_response_version(request, organization.id)
+    # найти дату последнего отчёта для этой организации
+    last_report = await report_repo.get_last_report_freshness_by_organization_id(
+        organization.id
+    )
+    checked_at = None if last_report is None else last_report.checked_at
+    if is_report_stale(checked_at):
+        # отчётов по организации еще не было или они старые
+        version = await refresh_reports(request, db_session, organization.id)
+        checked_at = None
+    if settings.REPORT_DB_SERIALIZATION or settings.REPORT_FAST_SERIALIZATION:
+        return await report_response(
+            request, "v1", params, report_repo, organization, version, checked_at
+        )
+    if params.periods is None:
+        # Нужен отчёт за последний год
+        reports = await report_repo.get_max_reports_by_organization_id(
             organization.id
         )
-        if (
-            last_report is None
-            or (datetime.now(timezone.utc) - last_report.updated_at).days
-            > settings.REPORT_AVAILABLE_DAYS
-        ):
-            # отчётов по организации еще не было или они старые
-            organization_details = await get_details_by_organization_id(
-                request.app.state.redis, session, organization.id
+        if len(reports) > 0:
+            result["periods"].append(
+                {"year": reports[0].report_year, "reports": reports}
             )
-            await report_repo.update_or_create_report_from_bfo(
-                organization.id, organization_details.reports
+    else:
+        # отчёты за все указанные года одним запросом
+        reports_by_period, _ = (
+            await report_repo.get_reports_by_organization_id_and_periods(
+                organization.id, params.periods
             )
-        if params.periods is None:
-            # Нужен отчёт за последний год
-            reports = await report_repo.get_max_reports_by_organization_id(
-                organization.id
+        )
+        for period in params.periods:
+            result["periods"].append(
+                {"year": period, "reports": reports_by_period[period]}
             )
-            if len(reports) > 0:
-                result["periods"].append(
-                    {"year": reports[0].report_year, "reports": reports}
-                )
-        else:
-            for period in params.periods:
-                # для каждого указанного года найдем отчёты за год
-                reports = await report_repo.get_reports_by_organization_id_and_period(
-                    organization.id, period
-                )
-                result["periods"].append({"year": period, "reports": reports})
     result.update(organization.info)
-    return result
+    return await report_response(
+        request, "v1", params, report_repo, organization, version, checked_at, result
+    )
 
 
 @router_v2.get(
@@ -85,63 +422,90 @@ async def get_report_handler(request: Request, params: GetReportParams = Query()
     response_model=GetReportResponse,
 )
 async def get_report_v2_handler(request: Request, params: GetReportParams = Query()):
-    organization_repo = OrganizationRepo(request.app.state.db_session)
-    report_repo = ReportRepo(request.app.state.db_session)
+    cached_response = await get_cached_report_response(request, "v2", params)
+    if cached_response is not None:
+        return cached_response
+    db_session = get_db_session(request)
+    organization_repo = OrganizationRepo(db_session)
+    report_repo = ReportRepo(db_session)
     # поиск организации в БД
     organization = await organization_repo.get_organization_by_inn(params.inn)
     result = {"inn": params.inn, "periods": []}
-    async with aiohttp.ClientSession() as session:
-        if organization is None:
-            # создать запись об организации
-            organization_result = await search_organization_by_inn(
-                request.app.state.redis, session, params.inn
-            )
-            organization = await organization_repo.create_organization(
-                organization_result.id,
-                params.inn,
-                organization_result.model_dump(exclude={"id"}),
-            )
-        if params.periods is None:
-            # Отправить последний отчёт
-            reports = await report_repo.get_max_reports_by_organization_id(
-                organization.id
+    if organization is None:
+        # создать запись об организации
+        organization = await organization_single_flight.do(
+            params.inn, create_organization_from_bfo, request, db_session, params.inn
+        )
+    version = await get_report_response_version(request, organization.id)
+    serialize_once = (
+        settings.REPORT_DB_SERIALIZATION or settings.REPORT_FAST_SERIALIZATION
+    )
+    if params.periods is None:
+        # Отправить последний отчёт (сначала проверяются только даты отчётов)
+        freshness = await report_repo.get_max_reports_freshness_by_organization_id(
+            organization.id
+        )
+        checked_at = freshness[0].checked_at if len(freshness) > 0 else None
+        if is_report_stale(checked_at):
+            # необходимо обновить отчёт
+            version = await refresh_reports(request, db_session, organization.id)
+            checked_at = None
+        if serialize_once:
+            return await report_response(
+                request, "v2", params, report_repo, organization, version, checked_at
             )
-            if (
-                len(reports) == 0
-                or (datetime.now(timezone.utc) - reports[0].updated_at).days
-                > settings.REPORT_AVAILABLE_DAYS
-            ):
-                # необходимо обновить отчёт
-                organization_details = await get_details_by_organization_id(
-                    request.app.state.redis, session, organization.id
-                )
-                await report_repo.update_or_create_report_from_bfo(
-                    organization.id, organization_details.reports
-                )
-                reports = await report_repo.get_max_reports_by_organization_id(
-                    organization.id
-                )
+        reports = await report_repo.get_max_reports_by_organization_id(
+            organization.id
+        )
+        if len(reports) > 0:
             result["periods"].append(
                 {"year": reports[0].report_year, "reports": reports}
             )
+    elif serialize_once:
+        # указаны конкретные периоды: проверяются только даты отчётов,
+        # листы отчётов загружаются один раз для ответа
+        checked_at_by_period = (
+            await report_repo.get_checked_at_by_organization_id_and_periods(
+                organization.id, params.periods
+            )
+        )
+        if any(
+            is_report_stale(checked_at_by_period.get(period))
+            for period in params.periods
+        ):
+            version = await refresh_reports(request, db_session, organization.id)
+            checked_at = None
         else:
-            # указаны конкретные периоды
-            non_available_periods = await report_repo.is_all_periods_available(
+            checked_at = min(checked_at_by_period[period] for period in params.periods)
+        return await report_response(
+            request, "v2", params, report_repo, organization, version, checked_at
+        )
+    else:
+        # указаны конкретные периоды: отчёты и их актуальность одним запросом
+        reports_by_period, non_available_periods = (
+            await report_repo.get_reports_by_organization_id_and_periods(
                 organization.id, params.periods
             )
-            if len(non_available_periods) > 0:
-                # есть отчёты, которые нужно обновить
-                organization_details = await get_details_by_organization_id(
-                    request.app.state.redis, session, organization.id
-                )
-                await report_repo.update_or_create_report_from_bfo(
-                    organization.id, organization_details.reports
-                )
-            for period in params.periods:
-                # для каждого указанного года найдем отчёты за год
-                reports = await report_repo.get_reports_by_organization_id_and_period(
-                    organization.id, period
+        )
+        if len(non_available_periods) > 0:
+            # есть отчёты, которые нужно обновить
+            version = await refresh_reports(request, db_session, organization.id)
+            checked_at = None
+            reports_by_period, _ = (
+                await report_repo.get_reports_by_organization_id_and_periods(
+                    organization.id, params.periods
                 )
-                result["periods"].append({"year": period, "reports": reports})
+            )
+        else:
+            checked_at = min(
+                max(report.checked_at for report in reports_by_period[period])
+                for period in params.periods
+            )
+        for period in params.periods:
+            result["periods"].append(
+                {"year": period, "reports": reports_by_period[period]}
+            )
     result.update(organization.info)
-    return result
+    return await report_response(
+        request, "v2", params, report_repo, organization, version, checked_at, result
+    )
@@ -0,0 +1,98 @@
+from fastapi import APIRouter, Request
+
+from app.db.sqlalchemy import db_pool_stats
+from app.helpers.circuit_breaker import bfo_circuit_breaker
+from app.helpers.history_writer import create_history_writer
+from app.helpers.hot_cache import report_hot_cache
+from app.helpers.negative_cache import (
+    organization_no_reports_cache,
+    organization_not_found_cache,
+)
+from app.helpers.organization_cache import organization_cache
+from app.helpers.proxy_pool import bfo_proxy_pool
+from app.helpers.redis import take_bfo_token
+from app.helpers.response_cache import report_response_cache
+from app.helpers.single_flight import (
+    organization_single_flight,
+    refresh_single_flight,
+)
+from app.schemas.responses import (
+    BfoStatsResponse,
+    DbPoolStatsResponse,
+    HistoryWriterStatsResponse,
+    ReportCacheStatsResponse,
+)
+
+
+router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+
+@router.get(
+    "/bfo",
+    summary="Состояние лимитов запросов к БФО",
+    description="Состояние circuit breaker после 429, статистика прокси с оставшимся бюджетом запросов (токены в корзине) и текущей скоростью, статистика объединения запросов, кэша отрицательных ответов и кэша ответов с отчётами",
+    status_code=200,
+    response_model=BfoStatsResponse,
+)
+async def get_bfo_stats_handler(request: Request):
+    redis = request.app.state.redis
+    proxies = []
+    for proxy in bfo_proxy_pool.proxies:
+        rate_limit = await take_bfo_token(
+            redis, cost=0, bucket_key=proxy.bucket_key, rate_key=proxy.rate_key
+        )
+        proxies.append({**proxy.stats(), "rate_limit": rate_limit})
+    return {
+        "circuit_breaker": bfo_circuit_breaker.stats(),
+        "proxies": proxies,
+        "single_flight": [
+            organization_single_flight.stats(),
+            refresh_single_flight.stats(),
+        ],
+        "negative_cache": [
+            organization_not_found_cache.stats(),
+            organization_no_reports_cache.stats(),
+        ],
+        "response_cache": report_response_cache.stats(),
+    }
+
+
+@router.get(
+    "/cache",
+    summary="Состояние кэшей ответов с отчётами",
+    description="Статистика кэша ответов в памяти воркера (размер, попадания, вытеснения), кэша ответов в redis и кэша организаций по ИНН",
+    status_code=200,
+    response_model=ReportCacheStatsResponse,
+)
+async def get_report_cache_stats_handler():
+    return {
+        "hot_cache": report_hot_cache.stats(),
+        "response_cache": report_response_cache.stats(),
+        "organization_cache": organization_cache.stats(),
+    }
+
+
+@router.get(
+    "/db",
+    summary="Состояние пула соединений с БД",
+    description="Сколько раз соединение выдавалось из пула и возвращалось в пул в текущем воркере",
+    status_code=200,
+    response_model=DbPoolStatsResponse,
+)
+async def get_db_pool_stats_handler():
+    return db_pool_stats.stats()
+
+
+@router.get(
+    "/history",
+    summary="Состояние записи истории запросов",
+    description="Длина очереди фоновой записи истории запросов, количество сохранённых, отброшенных при переполнении и не сохранённых из-за ошибок записей",
+    status_code=200,
+    response_model=HistoryWriterStatsResponse,
+)
+async def get_history_writer_stats_handler(request: Request):
+    # вне lifespan запись истории не запущена - пустая статистика по настройкам
+    history_writer = getattr(request.app.state, "history_writer", None)
+    if history_writer is None:
+        history_writer = create_history_writer()
+    return history_writer.stats()
@@ -1,31 +1,65 @@
 """Middleware for creating db_session per-request."""
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.logger import logger
 
 SUCCESS_CODES = [200, 201, 204, 307]
 
 
-class DbSessionMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        db_session = None
+def get_db_session(request: Request) -> AsyncSession:
+    """
+    Сессия БД запроса (создаётся при первом обращении)
+
+    :param request: Запрос
+
+    :return: Сессия БД, которую закроет DbSessionMiddleware
+    """
+    db_session = getattr(request.state, "db_session", None)
+    if db_session is None:
+        db_session = request.app.state.db_session_factory()
+        request.state.db_session = db_session
+    return db_session
+
+
+class DbSessionMiddleware:
+    """
+    Завершение сессии БД запроса (request.state.db_session)
+
+    Сессия создаётся лениво (get_db_session), поэтому запросы из кэша,
+    отклонённые валидацией и служебные запросы не занимают соединение из пула.
+    Изменения фиксируются (или откатываются по коду ответа) до отправки
+    заголовков ответа, поэтому клиент получает успешный ответ только после commit
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+
+        async def send_wrapper(message: Message) -> None:
+            db_session = state.get("db_session")
+            if message["type"] == "http.response.start" and db_session is not None:
+                if message["status"] in SUCCESS_CODES:
+                    await db_session.commit()
+                else:
+                    await db_session.rollback()
+            await send(message)
+
         try:
-            db_session = request.app.state.db_session_factory()
-            request.app.state.db_session = db_session
-            response: Response = await call_next(request)
-
-            if response.status_code in SUCCESS_CODES:
-                await db_session.commit()
-            else:
-                await db_session.rollback()
-            return response
+            await self.app(scope, receive, send_wrapper)
         except Exception as ex:
             logger.error(str(ex))
-            if db_session:
-                await db_session.rollback()
+            if state.get("db_session") is not None:
+                await state["db_session"].rollback()
             raise
         finally:
-            if db_session:
-                await db_session.close()
+            if state.get("db_session") is not None:
+                await state.pop("db_session").close()
@@ -1,93 +1,139 @@
 """Middleware for logging endpoint data"""
 
 from datetime import datetime
+import hashlib
 import json
-from typing import Optional
-from fastapi import Request, Response
-from fastapi.datastructures import QueryParams
-from starlette.background import BackgroundTask
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import Scope
-
-from app.db.history.repo import HistoryRepo
-from app.db.sqlalchemy import AsyncSessionFactory
+from typing import List, Optional
+from starlette.datastructures import QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.helpers.history_writer import write_history
 from app.logger import logger
+from app.schemas.db.history import HistoryRecord
 from app.settings import settings
 
 
-class EndpointLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class ResponseBodyCapture:
+    """
+    Копия тела ответа, собираемая по мере отправки клиенту
+
+    Хранится не больше max_bytes; у большего ответа остаются только размер
+    и sha256 (считается по частям, без накопления тела)
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._chunks: List[bytes] = []
+        self._hash: Optional["hashlib._Hash"] = None
+
+    @property
+    def truncated(self) -> bool:
+        return self._hash is not None
+
+    def append(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self._hash is None and self.size <= self.max_bytes:
+            self._chunks.append(chunk)
+            return
+        if self._hash is None:
+            self._hash = hashlib.sha256()
+            for captured in self._chunks:
+                self._hash.update(captured)
+            self._chunks = []
+        self._hash.update(chunk)
+
+    def body(self) -> str:
+        """Тело ответа (JSON) или сведения о не сохранённом теле"""
+        if self._hash is None:
+            return b"".join(self._chunks).decode("utf-8")
+        return json.dumps(
+            {"truncated": True, "size": self.size, "sha256": self._hash.hexdigest()}
+        )
+
+
+def make_history_record(
+    scope: Scope,
+    status_code: int,
+    response_body: str,
+    started_at: datetime,
+    finished_at: datetime,
+) -> HistoryRecord:
+    """
+    Запись истории запроса
+
+    :param scope: ASGI scope запроса
+    :param status_code: Код ответа
+    :param response_body: Тело ответа (JSON, разбирается в PostgreSQL)
+    :param started_at: Время до запроса
+    :param finished_at: Время после запроса
+
+    :return: Запись истории
+    """
+    # Логирование данных запроса
+    filtered_scope = {}
+    for field in settings.REQUEST_LOGGING_ALLOWED_FILEDS:
+        if field in scope:
+            filtered_scope[field] = scope[field]
+    return HistoryRecord(
+        request=filtered_scope,
+        status_code=status_code,
+        response=response_body,
+        started_at=started_at,
+        finished_at=finished_at,
+        params=dict(QueryParams(scope.get("query_string", b""))),
+    )
+
+
+class EndpointLoggingMiddleware:
+    """
+    Логирование запросов к REQUEST_LOGGING_MIDDLEWARE_ENDPOINTS в таблицу history
+
+    Ответ отправляется клиенту без изменений, тело копируется по мере отправки
+    (не больше REQUEST_LOGGING_MAX_BODY_BYTES). После завершения ответа запись
+    передаётся app.state.history_writer, а если он не запущен (вне lifespan) -
+    сохраняется сразу
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or f"{scope['method']}:{scope['path']}"
+            not in settings.REQUEST_LOGGING_MIDDLEWARE_ENDPOINTS
+        ):
+            await self.app(scope, receive, send)
+            return
+
         start = datetime.now()
-        response: Response = await call_next(request)
-        end = datetime.now()
-        try:
-            if (
-                f"{request.scope['method']}:{request.scope['path']}"
-                in settings.REQUEST_LOGGING_MIDDLEWARE_ENDPOINTS
-            ):
-
-                async def log_endpoint_info_task(
-                    db_session_factory: AsyncSessionFactory,
-                    scope: Scope,
-                    status_code: int,
-                    response_body: bytes,
-                    query_params: Optional[QueryParams] = None,
-                ):
-                    db_session = db_session_factory()
-                    try:
-                        # Логирование данных запроса
-                        filtered_scope = {}
-                        for field in settings.REQUEST_LOGGING_ALLOWED_FILEDS:
-                            if field in scope:
-                                filtered_scope[field] = scope[field]
-                        body = json.loads(response_body.decode("utf-8"))
-                        if body is not None:
-                            history_repo = HistoryRepo(db_session)
-                            await history_repo.create_history(
-                                filtered_scope,
-                                status_code,
-                                body,
-                                start,
-                                end,
-                                (
-                                    dict(query_params)
-                                    if query_params is not None
-                                    else None
-                                ),
-                            )
-                            await db_session.commit()
-                    except Exception as ex:
-                        logger.error(f"Не удалось сохрнаить лог запроса. ({ex})")
-                        if db_session:
-                            await db_session.rollback()
-                    finally:
-                        if db_session:
-                            await db_session.close()
-
-                # Тело ответа для логирования
-                response_body = b""
-                async for chunk in response.body_iterator:
-                    response_body += chunk
-
-                # Создание фоновой задачи
-                response.background = BackgroundTask(
-                    log_endpoint_info_task,
-                    request.app.state.db_session_factory,
-                    request.scope,
-                    response.status_code,
-                    response_body,
-                    request.query_params,
-                )
-                return Response(
-                    content=response_body,
-                    status_code=response.status_code,
-                    headers=dict(response.headers),
-                    media_type=response.media_type,
-                    background=response.background,
-                )
+        end = None
+        status_code = None
+        response_body = ResponseBodyCapture(settings.REQUEST_LOGGING_MAX_BODY_BYTES)
 
-        except Exception as ex:
-            logger.error(
-                f"Не удалось создать задачу для сохранения лога эндпоинта. ({ex})"
+        async def send_wrapper(message: Message) -> None:
+            nonlocal end, status_code
+            if message["type"] == "http.response.start":
+                end = datetime.now()
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+        if status_code is None:
+            return
+        try:
+            record = make_history_record(
+                scope, status_code, response_body.body(), start, end
             )
-        return response
+        except Exception as ex:
+            logger.error(f"Не удалось создать запись лога эндпоинта. ({ex})")
+            return
+        history_writer = getattr(scope["app"].state, "history_writer", None)
+        if history_writer is not None and history_writer.running:
+            history_writer.put(record)
+        else:
+            await write_history(scope["app"].state.db_session_factory, [record])
@@ -4,9 +4,11 @@ from fastapi import APIRouter
 
 from app.api.endpoints.report import router_v1 as report_router_v1
 from app.api.endpoints.report import router_v2 as report_router_v2
+from app.api.endpoints.stats import router as stats_router
 
 router = APIRouter()
 
 # -- API --
 router.include_router(report_router_v1)
 router.include_router(report_router_v2)
+router.include_router(stats_router)
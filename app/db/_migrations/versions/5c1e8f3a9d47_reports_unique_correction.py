@@ -0,0 +1,45 @@
+"""unique reports (organization_id, report_year, present_date)
+
+Revision ID: 5c1e8f3a9d47
+Revises: ddba7a858380
+Create Date: 2026-10-17 12:10:05.412873
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8f3a9d47'
+down_revision: Union[str, None] = 'ddba7a858380'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # удаление дублей корректировок (остаётся последняя запись)
+    op.execute(
+        """
+        DELETE FROM reports AS a
+        USING reports AS b
+        WHERE a.organization_id = b.organization_id
+            AND a.report_year = b.report_year
+            AND a.present_date = b.present_date
+            AND a.id < b.id
+        """
+    )
+    op.create_unique_constraint(
+        'uq_reports_organization_id_report_year_present_date',
+        'reports',
+        ['organization_id', 'report_year', 'present_date'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(
+        'uq_reports_organization_id_report_year_present_date',
+        'reports',
+        type_='unique',
+    )
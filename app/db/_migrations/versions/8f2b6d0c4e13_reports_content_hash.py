@@ -0,0 +1,32 @@
+"""reports content_hash and checked_at
+
+Revision ID: 8f2b6d0c4e13
+Revises: 5c1e8f3a9d47
+Create Date: 2026-10-17 13:02:41.208317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2b6d0c4e13'
+down_revision: Union[str, None] = '5c1e8f3a9d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('reports', sa.Column('checked_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('reports', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    # до этой ревизии каждое обновление из БФО меняло updated_at;
+    # content_hash заполнится при следующем обновлении отчёта
+    op.execute("UPDATE reports SET checked_at = updated_at")
+    op.alter_column('reports', 'checked_at', nullable=False)
+
+
+def downgrade() -> None:
+    op.drop_column('reports', 'content_hash')
+    op.drop_column('reports', 'checked_at')
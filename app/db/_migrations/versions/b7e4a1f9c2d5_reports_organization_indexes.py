@@ -0,0 +1,39 @@
+"""reports index (organization_id, checked_at)
+
+Revision ID: b7e4a1f9c2d5
+Revises: 8f2b6d0c4e13
+Create Date: 2026-10-17 13:40:17.530284
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4a1f9c2d5'
+down_revision: Union[str, None] = '8f2b6d0c4e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # выборки по (organization_id, report_year[, present_date]) обслуживает
+    # uq_reports_organization_id_report_year_present_date (ревизия 5c1e8f3a9d47)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_reports_organization_id_checked_at',
+            'reports',
+            ['organization_id', 'checked_at'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_reports_organization_id_checked_at',
+            table_name='reports',
+            postgresql_concurrently=True,
+        )
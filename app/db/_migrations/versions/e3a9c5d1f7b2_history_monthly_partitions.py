@@ -0,0 +1,121 @@
+"""history partitioned by month of started_at
+
+Revision ID: e3a9c5d1f7b2
+Revises: b7e4a1f9c2d5
+Create Date: 2026-10-17 18:12:44.903215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a9c5d1f7b2'
+down_revision: Union[str, None] = 'b7e4a1f9c2d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# секций вперёд от текущего месяца (дальше их создаёт maintain_history_partitions)
+PARTITIONS_AHEAD = 3
+
+
+def upgrade() -> None:
+    # старая таблица переименовывается, её строки переносятся в секции
+    op.execute("ALTER TABLE history RENAME TO history_old")
+    op.execute("ALTER TABLE history_old RENAME CONSTRAINT pk_history TO pk_history_old")
+    op.execute("ALTER TABLE history_old DROP CONSTRAINT IF EXISTS uq_history_id")
+    op.execute("ALTER SEQUENCE history_id_seq OWNED BY NONE")
+    op.execute(
+        """
+        CREATE TABLE history (
+            id integer NOT NULL DEFAULT nextval('history_id_seq'),
+            request jsonb,
+            params jsonb,
+            status_code integer NOT NULL,
+            response jsonb,
+            started_at timestamp with time zone NOT NULL,
+            finished_at timestamp with time zone NOT NULL,
+            CONSTRAINT pk_history PRIMARY KEY (id, started_at)
+        ) PARTITION BY RANGE (started_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE history_id_seq OWNED BY history.id")
+    op.execute("CREATE TABLE history_default PARTITION OF history DEFAULT")
+    # секции для всех месяцев старых строк и PARTITIONS_AHEAD месяцев вперёд
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT series::date
+                FROM generate_series(
+                    (
+                        SELECT date_trunc('month', coalesce(min(started_at), now()))
+                        FROM history_old
+                    ),
+                    date_trunc('month', now()) + interval '{PARTITIONS_AHEAD} months',
+                    interval '1 month'
+                ) AS series
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF history FOR VALUES FROM (%L) TO (%L)',
+                    'history_p' || to_char(month, 'YYYYMM'),
+                    month,
+                    (month + interval '1 month')::date
+                );
+            END LOOP;
+        END
+        $$
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO history
+            (id, request, params, status_code, response, started_at, finished_at)
+        SELECT id, request, params, status_code, response, started_at, finished_at
+        FROM history_old
+        """
+    )
+    op.execute("DROP TABLE history_old")
+    op.create_index('ix_history_started_at', 'history', ['started_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE history RENAME TO history_partitioned")
+    op.execute(
+        "ALTER TABLE history_partitioned "
+        "RENAME CONSTRAINT pk_history TO pk_history_partitioned"
+    )
+    op.execute(
+        "ALTER INDEX ix_history_started_at RENAME TO ix_history_partitioned_started_at"
+    )
+    op.execute("ALTER SEQUENCE history_id_seq OWNED BY NONE")
+    op.execute(
+        """
+        CREATE TABLE history (
+            id integer NOT NULL DEFAULT nextval('history_id_seq'),
+            request jsonb,
+            params jsonb,
+            status_code integer NOT NULL,
+            response jsonb,
+            started_at timestamp with time zone NOT NULL,
+            finished_at timestamp with time zone NOT NULL,
+            CONSTRAINT pk_history PRIMARY KEY (id),
+            CONSTRAINT uq_history_id UNIQUE (id)
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE history_id_seq OWNED BY history.id")
+    op.execute(
+        """
+        INSERT INTO history
+            (id, request, params, status_code, response, started_at, finished_at)
+        SELECT id, request, params, status_code, response, started_at, finished_at
+        FROM history_partitioned
+        """
+    )
+    # вместе с секционированной таблицей удаляются её секции
+    op.execute("DROP TABLE history_partitioned")
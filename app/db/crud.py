@@ -1,5 +1,6 @@
-from typing import Any, Dict, TypeVar
-from sqlalchemy import delete, insert, select, update, func
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, TypeVar, Union
+from sqlalchemy import delete, insert, select, text, update, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.inspection import inspect
 
 from app.db.sqlalchemy import AsyncSession
@@ -22,6 +23,61 @@ class CRUD:
         res = await self._session.execute(query)
         return res.inserted_primary_key
 
+    async def bulk_create(
+        self, *, models_data: Sequence[Dict[str, Any]], chunk_size: int = 1000
+    ) -> int:
+        """Create objects with one multi-row INSERT per chunk."""
+        count = 0
+        for start in range(0, len(models_data), chunk_size):
+            chunk = models_data[start : start + chunk_size]
+            query = insert(self._cls_model).values(list(chunk))
+            result = await self._session.execute(query)
+            count += result.rowcount
+        return count
+
+    async def bulk_upsert(
+        self,
+        *,
+        models_data: Sequence[Dict[str, Any]],
+        conflict_target: Union[str, Sequence[str]],
+        update_fields: Optional[Sequence[str]] = None,
+        chunk_size: int = 1000,
+    ) -> int:
+        """
+        Create or update objects with INSERT ... ON CONFLICT per chunk.
+
+        conflict_target is a constraint name or a list of unique columns.
+        update_fields defaults to all passed fields except the conflict
+        columns; an empty list means ON CONFLICT DO NOTHING.
+        Rows in one chunk must not conflict with each other.
+        """
+        count = 0
+        for start in range(0, len(models_data), chunk_size):
+            chunk = models_data[start : start + chunk_size]
+            query = pg_insert(self._cls_model).values(list(chunk))
+            target: Dict[str, Any] = (
+                {"constraint": conflict_target}
+                if isinstance(conflict_target, str)
+                else {"index_elements": list(conflict_target)}
+            )
+            fields = update_fields
+            if fields is None:
+                fields = [
+                    field
+                    for field in chunk[0]
+                    if isinstance(conflict_target, str) or field not in conflict_target
+                ]
+            if len(fields) > 0:
+                query = query.on_conflict_do_update(
+                    **target,
+                    set_={field: query.excluded[field] for field in fields},
+                )
+            else:
+                query = query.on_conflict_do_nothing(**target)
+            result = await self._session.execute(query)
+            count += result.rowcount
+        return count
+
     async def update(
         self,
         *,
@@ -67,6 +123,52 @@ class CRUD:
         rows = await self._session.execute(query)
         return rows.scalar()
 
+    async def get_many(self, *, pkey_vals: Sequence[Any]) -> List[Any]:
+        """Get objects by primary keys (missing keys are skipped)."""
+        if len(pkey_vals) == 0:
+            return []
+        primary_key = inspect(self._cls_model).primary_key[0]
+        query = select(self._cls_model).where(primary_key.in_(pkey_vals))
+
+        rows = await self._session.execute(query)
+        return list(rows.scalars().all())
+
+    async def iter_chunks(
+        self, *, chunk_size: int = 1000, server_side: bool = False
+    ) -> AsyncIterator[List[Any]]:
+        """
+        Stream all objects in chunks of chunk_size without loading the table.
+
+        By default uses keyset pagination by primary key (one short query per
+        chunk, safe to commit between chunks). server_side=True reads one query
+        through a server-side cursor instead (needs an open transaction for
+        the whole iteration).
+        """
+        primary_key = inspect(self._cls_model).primary_key[0]
+        if server_side:
+            query = (
+                select(self._cls_model)
+                .order_by(primary_key)
+                .execution_options(yield_per=chunk_size)
+            )
+            result = await self._session.stream_scalars(query)
+            async for partition in result.partitions(chunk_size):
+                yield list(partition)
+            return
+        last_pkey_val = None
+        while True:
+            query = select(self._cls_model).order_by(primary_key).limit(chunk_size)
+            if last_pkey_val is not None:
+                query = query.where(primary_key > last_pkey_val)
+            rows = await self._session.execute(query)
+            chunk = list(rows.scalars().all())
+            if len(chunk) == 0:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_pkey_val = getattr(chunk[-1], primary_key.key)
+
     async def all(
         self,
     ) -> Any:
@@ -123,7 +225,23 @@ class CRUD:
             return True
         return False
 
-    async def get_count(self) -> int:
+    async def get_count(self, *, estimate: bool = False) -> int:
+        """
+        Count objects.
+
+        estimate=True returns the planner estimate (pg_class.reltuples) without
+        scanning the table; falls back to count() if the table was never analyzed.
+        """
+        if estimate:
+            query = text(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"
+            )
+            rows = await self._session.execute(
+                query, {"table": self._cls_model.__tablename__}
+            )
+            reltuples = rows.scalar()
+            if reltuples is not None and reltuples >= 0:
+                return reltuples
         query = select(func.count(self._cls_model.id))
         count = await self._session.execute(query)
         return count.scalar()
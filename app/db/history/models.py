@@ -1,20 +1,39 @@
 from datetime import datetime
 from typing import Optional, Dict, Any
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import DateTime, Integer
+from sqlalchemy import DDL, DateTime, Integer, event
 from sqlalchemy.dialects.postgresql import JSONB
 
 from app.db.sqlalchemy import Base
 
 
 class HistoryModel(Base):
+    """
+    История запросов: таблица секционирована по месяцам started_at
+    (секции history_pYYYYMM создаёт и удаляет maintain_history_partitions)
+    """
+
     __tablename__ = "history"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = {
+        "extend_existing": True,
+        "postgresql_partition_by": "RANGE (started_at)",
+    }
 
-    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, unique=True)
+    # ключ секционированной таблицы должен включать started_at
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     request: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
     params: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
     status_code: Mapped[int] = mapped_column(Integer)
     response: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
-    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    started_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True, index=True
+    )
     finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+# секция для строк вне созданных месяцев (без неё вставка в такие месяцы невозможна)
+event.listen(
+    HistoryModel.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS history_default PARTITION OF history DEFAULT"),
+)
@@ -1,10 +1,13 @@
-from datetime import datetime
-from typing import Any, Dict, Optional
-from sqlalchemy import insert, null
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy import cast, insert, null, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.crud import CRUD
 from app.db.history.models import HistoryModel
+from app.schemas.db.history import HistoryRecord
+from app.settings import settings
 
 
 class HistoryRepo:
@@ -17,7 +20,7 @@ class HistoryRepo:
         self,
         request: Dict[str, Any],
         status_code: int,
-        response: Dict[str, Any],
+        response: Union[Dict[str, Any], str],
         started_at: datetime,
         finished_at: datetime,
         params: Optional[Dict[str, Any]] = None,
@@ -27,7 +30,7 @@ class HistoryRepo:
 
         :param request: Данные из request(отфильтрованные)
         :param status_code: Код ответа
-        :param response: Тело ответа
+        :param response: Тело ответа (строка JSON разбирается в PostgreSQL)
         :param started_at: Время до запроса
         :param finished_at: Время после запроса
         :param params: Параметры запроса
@@ -35,9 +38,124 @@ class HistoryRepo:
         query = insert(HistoryModel).values(
             request=request,
             status_code=status_code,
-            response=response,
+            response=cast(response, JSONB) if isinstance(response, str) else response,
             started_at=started_at,
             finished_at=finished_at,
             params=params if params is not None else null(),
         )
         await self._crud._session.execute(query)
+
+    async def create_histories(self, records: List[HistoryRecord]) -> int:
+        """
+        Создание записей в таблице логирования запросов одним INSERT на пачку
+
+        :param records: Записи истории (тела ответов разбираются в PostgreSQL)
+
+        :return: Количество созданных записей
+        """
+        return await self._crud.bulk_create(
+            models_data=[
+                {
+                    "request": record.request,
+                    "status_code": record.status_code,
+                    "response": cast(record.response, JSONB),
+                    "started_at": record.started_at,
+                    "finished_at": record.finished_at,
+                    "params": record.params if record.params is not None else null(),
+                }
+                for record in records
+            ],
+            chunk_size=settings.REQUEST_HISTORY_BATCH_SIZE,
+        )
+
+    """PARTITIONS"""
+
+    async def get_partitions(self) -> List[str]:
+        """
+        Секции таблицы history
+
+        :return: Имена секций
+        """
+        query = text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = 'history'::regclass "
+            "ORDER BY child.relname"
+        )
+        rows = await self._crud._session.execute(query)
+        return list(rows.scalars().all())
+
+    async def create_partition(self, name: str, start: date, end: date) -> int:
+        """
+        Создание секции history для started_at в [start, end)
+
+        Если в history_default уже есть строки этого диапазона (секция не была
+        создана вовремя), CREATE ... PARTITION OF завершится ошибкой. Тогда
+        секция создаётся отдельной таблицей, строки переносятся в неё из
+        history_default и она присоединяется к history (ATTACH берёт
+        ACCESS EXCLUSIVE только на history_default)
+
+        :param name: Имя секции
+        :param start: Начало диапазона
+        :param end: Конец диапазона (не включается)
+
+        :return: Количество строк, перенесённых из history_default
+        """
+        session = self._crud._session
+        bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        in_range = (
+            f"started_at >= '{start.isoformat()}' AND started_at < '{end.isoformat()}'"
+        )
+        rows = await session.execute(
+            text(f"SELECT EXISTS (SELECT 1 FROM history_default WHERE {in_range})")
+        )
+        if not rows.scalar():
+            await session.execute(
+                text(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF history '
+                    f"FOR VALUES {bounds}"
+                )
+            )
+            return 0
+        await session.execute(
+            text(
+                f'CREATE TABLE "{name}" '
+                "(LIKE history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+        )
+        moved = await session.execute(
+            text(
+                f"WITH moved AS (DELETE FROM history_default WHERE {in_range} "
+                f'RETURNING *) INSERT INTO "{name}" SELECT * FROM moved'
+            )
+        )
+        await session.execute(
+            text(f'ALTER TABLE history ATTACH PARTITION "{name}" FOR VALUES {bounds}')
+        )
+        return moved.rowcount
+
+    async def detach_partition(
+        self, name: str, drop: bool = False, lock_timeout_ms: Optional[int] = None
+    ) -> None:
+        """
+        Отсоединение секции history (строки перестают быть частью таблицы
+        без DELETE)
+
+        DETACH берёт ACCESS EXCLUSIVE на history до конца транзакции: запись
+        истории ждёт его. DETACH ... CONCURRENTLY недоступен, так как у history
+        есть секция по умолчанию, поэтому ожидание блокировки ограничивается
+        lock_timeout (при таймауте - ошибка, вызывающий повторяет позже)
+
+        :param name: Имя секции
+        :param drop: Удалить отсоединённую секцию
+        :param lock_timeout_ms: Максимальное ожидание блокировки (мс)
+        """
+        if lock_timeout_ms is not None:
+            await self._crud._session.execute(
+                text(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)}")
+            )
+        await self._crud._session.execute(
+            text(f'ALTER TABLE history DETACH PARTITION "{name}"')
+        )
+        if drop:
+            await self._crud._session.execute(text(f'DROP TABLE "{name}"'))
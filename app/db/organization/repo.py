@@ -1,9 +1,11 @@
 from typing import Any, Dict, Optional
-from sqlalchemy import insert, select
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.crud import CRUD
 from app.db.organization.models import OrganizationModel
+from app.helpers.organization_cache import organization_cache
 from app.schemas.db.organization import Organization
 
 
@@ -19,16 +21,29 @@ class OrganizationRepo:
         self, organization_id: int, inn: str, info: Dict[str, Any]
     ) -> Organization:
         """
-        Создание записи организации в БД
+        Создание записи организации в БД. В organization_cache организация
+        не сохраняется: вызывающий обновляет кэш после фиксации транзакции
+
+        Один запрос INSERT ... ON CONFLICT DO UPDATE ... RETURNING: если
+        организацию с этим ИНН уже создал параллельный запрос, обновляются её
+        данные и возвращается существующая запись
 
         :param organization_id: id (из БФО) организации
         :param inn: Строка с ИНН организации
 
         :return: Модель организации
         """
-        query = insert(OrganizationModel).values(id=organization_id, inn=inn, info=info)
-        await self._crud._session.execute(query)
-        query = select(OrganizationModel).where(OrganizationModel.id == organization_id)
+        query = pg_insert(OrganizationModel).values(
+            id=organization_id, inn=inn, info=info
+        )
+        query = (
+            query.on_conflict_do_update(
+                index_elements=[OrganizationModel.inn],
+                set_={"info": query.excluded.info},
+            )
+            .returning(OrganizationModel)
+            .execution_options(populate_existing=True)
+        )
         row = await self._crud._session.execute(query)
         return Organization.from_orm_not_none(row.scalar_one())
 
@@ -36,12 +51,19 @@ class OrganizationRepo:
 
     async def get_organization_by_inn(self, inn: str) -> Optional[Organization]:
         """
-        Поиск организации по ИНН
+        Поиск организации по ИНН (сначала в organization_cache)
 
         :param inn: Строка с ИНН организации
 
         :return: Модель организации или None
         """
+        organization = organization_cache.get(inn)
+        if organization is not None:
+            return organization
         query = select(OrganizationModel).where(OrganizationModel.inn == inn)
         row = await self._crud._session.execute(query)
-        return Organization.from_orm(row.scalar_one_or_none())
+        organization = Organization.from_orm(row.scalar_one_or_none())
+        if organization is not None:
+            # отсутствие организации не кэшируется: её может создать другой запрос
+            organization_cache.set(organization)
+        return organization
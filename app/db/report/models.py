@@ -1,8 +1,8 @@
 from datetime import datetime, date
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
-from sqlalchemy import Date, DateTime, Integer, ForeignKey
+from sqlalchemy import Date, DateTime, Index, Integer, ForeignKey, String, UniqueConstraint
 from sqlalchemy.dialects.postgresql import JSONB
 
 from app.db.sqlalchemy import Base
@@ -11,7 +11,19 @@ from app.db.organization.models import OrganizationModel
 
 class ReportModel(Base):
     __tablename__ = "reports"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # одна запись на корректировку отчёта (ключ для upsert)
+        UniqueConstraint(
+            "organization_id",
+            "report_year",
+            "present_date",
+            name="uq_reports_organization_id_report_year_present_date",
+        ),
+        # последний проверенный отчёт организации; выборки по организации,
+        # году и present_date обслуживает индекс уникального ключа выше
+        Index("ix_reports_organization_id_checked_at", "organization_id", "checked_at"),
+        {"extend_existing": True},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, unique=True)
     organization_id: Mapped[int] = mapped_column(
@@ -24,7 +36,13 @@ class ReportModel(Base):
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=func.now(), onupdate=func.now()
     )
+    # последняя проверка отчёта в БФО (updated_at меняется только вместе с данными)
+    checked_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now()
+    )
     present_date: Mapped[date] = mapped_column(Date)
+    # sha256 от содержимого листов отчёта
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     organization_sheet: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=True)
     balance_sheet: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=True)
     financial_sheet: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=True)
@@ -1,21 +1,129 @@
 from datetime import date, datetime, timedelta, timezone
-from typing import List, Optional, Dict, Any
-from sqlalchemy import select, insert, update
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import case, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import func
 
 from app.db.crud import CRUD
 from app.db.report.models import ReportModel
+from app.helpers.functions import report_content_hash
 from app.logger import logger
 from app.schemas.bfo_api import DetailResult
-from app.schemas.db.report import Report
+from app.schemas.db.report import Report, ReportFreshness
+from app.schemas.responses import GET_REPORT_RESPONSE_INFO_FIELDS
 from app.settings import settings
 
+# колонки для проверки актуальности отчётов (без JSONB листов)
+FRESHNESS_COLUMNS = (
+    ReportModel.report_year,
+    ReportModel.present_date,
+    ReportModel.updated_at,
+    ReportModel.checked_at,
+)
+
+# колонки отчёта для ответа (CorrectionForResponse)
+RESPONSE_COLUMNS = (
+    ReportModel.present_date,
+    ReportModel.updated_at,
+    ReportModel.organization_sheet,
+    ReportModel.balance_sheet,
+    ReportModel.financial_sheet,
+)
+# updated_at в формате pydantic: UTC с "Z", доли секунды только ненулевые
+# (json_build_object вывел бы смещение зоны сессии, например +00:00)
+REPORT_RESPONSE_UPDATED_AT_SQL = (
+    "to_char(r.updated_at AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS') "
+    "|| CASE WHEN mod(extract(microseconds FROM r.updated_at)::bigint, 1000000) = 0 "
+    "THEN '' ELSE to_char(r.updated_at, '.US') END || 'Z'"
+)
+# json_* (а не jsonb_*) сохраняют порядок полей как в GetReportResponse
+REPORT_RESPONSE_SQL = """
+SELECT json_build_object(
+    'inn', o.inn,
+    {info_fields},
+    'periods', COALESCE((
+        SELECT json_agg(
+            json_build_object(
+                'year', p.year,
+                'reports', (
+                    SELECT COALESCE(
+                        json_agg(
+                            json_build_object(
+                                'present_date', r.present_date,
+                                'updated_at', {updated_at},
+                                'organization_sheet', r.organization_sheet,
+                                'balance_sheet', r.balance_sheet,
+                                'financial_sheet', r.financial_sheet
+                            )
+                            ORDER BY r.present_date
+                        ),
+                        '[]'
+                    )
+                    FROM reports AS r
+                    WHERE r.organization_id = o.id AND r.report_year = p.year
+                )
+            )
+            ORDER BY p.ord
+        )
+        FROM ({periods}) AS p
+    ), '[]')
+)::text
+FROM organizations AS o
+WHERE o.id = :organization_id
+""".replace("{updated_at}", REPORT_RESPONSE_UPDATED_AT_SQL).replace(
+    "{info_fields}",
+    ",\n    ".join(
+        f"'{field}', o.info -> '{field}'" for field in GET_REPORT_RESPONSE_INFO_FIELDS
+    ),
+)
+# указанные года (в порядке запроса)
+REPORT_RESPONSE_PERIODS_SQL = """
+SELECT year, ord
+FROM unnest(CAST(:periods AS integer[])) WITH ORDINALITY AS u(year, ord)
+"""
+# последний год с отчётами
+REPORT_RESPONSE_MAX_PERIOD_SQL = """
+SELECT max(report_year) AS year, 1 AS ord
+FROM reports
+WHERE organization_id = o.id
+HAVING max(report_year) IS NOT NULL
+"""
+
+
+def get_report_available_since() -> datetime:
+    """Отчёты, проверенные в БФО раньше этого момента, нужно обновить"""
+    return datetime.now(timezone.utc) - timedelta(days=settings.REPORT_AVAILABLE_DAYS)
+
 
 class ReportRepo:
     def __init__(self, session: AsyncSession):
         self._crud = CRUD(session=session, cls_model=ReportModel)
 
+    @staticmethod
+    def _get_upsert_set(query: Any) -> Dict[str, Any]:
+        """
+        Изменения существующего отчёта в INSERT ... ON CONFLICT DO UPDATE
+
+        :param query: Запрос pg_insert(ReportModel)
+
+        :return: Значения колонок для SET
+        """
+        changed = ReportModel.content_hash.is_distinct_from(query.excluded.content_hash)
+        # при неизменном содержимом листы не перезаписываются
+        # (новая версия строки ссылается на уже записанный TOAST)
+        set_ = {
+            column: case(
+                (changed, query.excluded[column]),
+                else_=getattr(ReportModel, column),
+            )
+            for column in ("organization_sheet", "balance_sheet", "financial_sheet")
+        }
+        set_["content_hash"] = query.excluded.content_hash
+        set_["updated_at"] = case((changed, func.now()), else_=ReportModel.updated_at)
+        set_["checked_at"] = func.now()
+        return set_
+
     """CREATE"""
 
     async def create_report(
@@ -28,7 +136,11 @@ class ReportRepo:
         finance: Dict[str, Any],
     ) -> Report:
         """
-        Создание записи организации в БД
+        Создание записи отчёта в БД
+
+        Один запрос INSERT ... ON CONFLICT DO UPDATE ... RETURNING: если
+        корректировка уже записана (например, параллельным запросом),
+        она обновляется так же, как в update_or_create_report_from_bfo
 
         :param organization_id: id (из БФО) организации
         :param year: Год отчёта
@@ -39,16 +151,23 @@ class ReportRepo:
 
         :return: Модель отчёта
         """
-        query = insert(ReportModel).values(
+        query = pg_insert(ReportModel).values(
             organization_id=organization_id,
             report_year=year,
             present_date=present_date,
             organization_sheet=organization,
             balance_sheet=balance,
             financial_sheet=finance,
+            content_hash=report_content_hash(organization, balance, finance),
+        )
+        query = (
+            query.on_conflict_do_update(
+                constraint="uq_reports_organization_id_report_year_present_date",
+                set_=self._get_upsert_set(query),
+            )
+            .returning(ReportModel)
+            .execution_options(populate_existing=True)
         )
-        result = await self._crud._session.execute(query)
-        query = select(ReportModel).where(ReportModel.id==result.inserted_primary_key[0])
         row = await self._crud._session.execute(query)
         return Report.from_orm_not_none(row.scalar_one())
 
@@ -76,6 +195,94 @@ class ReportRepo:
         rows = await self._crud._session.execute(query)
         return [Report.from_orm_not_none(row) for row in rows.scalars().all()]
 
+    async def get_reports_by_organization_id_and_periods(
+        self, organization_id: int, periods: List[int]
+    ) -> Tuple[Dict[int, List[Report]], List[int]]:
+        """
+        Поиск отчётов за несколько лет одним запросом
+
+        :param organization_id: id организации
+        :param periods: Список годов
+
+        :return: Отчёты по годам (для каждого из periods)
+        :return: Список годов, отчётов за которые нет или они старше REPORT_AVAILABLE_DAYS
+        """
+        query = (
+            select(ReportModel)
+            .where(
+                ReportModel.organization_id == organization_id,
+                ReportModel.report_year.in_(periods),
+            )
+            .order_by(ReportModel.report_year, ReportModel.present_date)
+        )
+        rows = await self._crud._session.execute(query)
+        reports: Dict[int, List[Report]] = {period: [] for period in periods}
+        for row in rows.scalars().all():
+            reports[row.report_year].append(Report.from_orm_not_none(row))
+        available_since = get_report_available_since()
+        non_available_periods = [
+            period
+            for period, period_reports in reports.items()
+            if not any(
+                report.checked_at >= available_since for report in period_reports
+            )
+        ]
+        return reports, non_available_periods
+
+    async def get_reports_for_response(
+        self, organization_id: int, periods: Optional[List[int]] = None
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Поля отчётов для ответа по годам (без промежуточных моделей Report)
+
+        :param organization_id: id организации
+        :param periods: Список годов (None - отчёты за последний год)
+
+        :return: Отчёты по годам (для каждого из periods)
+        """
+        if periods is None:
+            year_filter = ReportModel.report_year == self._max_report_year_subquery(
+                organization_id
+            )
+        else:
+            year_filter = ReportModel.report_year.in_(periods)
+        query = (
+            select(ReportModel.report_year, *RESPONSE_COLUMNS)
+            .where(ReportModel.organization_id == organization_id, year_filter)
+            .order_by(ReportModel.report_year, ReportModel.present_date)
+        )
+        rows = await self._crud._session.execute(query)
+        reports: Dict[int, List[Dict[str, Any]]] = {
+            period: [] for period in periods or []
+        }
+        for row in rows.all():
+            report_year, *values = row
+            reports.setdefault(report_year, []).append(
+                {column.key: value for column, value in zip(RESPONSE_COLUMNS, values)}
+            )
+        return reports
+
+    async def get_report_response_json(
+        self, organization_id: int, periods: Optional[List[int]] = None
+    ) -> Optional[str]:
+        """
+        Ответ GetReportResponse, собранный в БД одним запросом (JSON строкой)
+
+        :param organization_id: id организации
+        :param periods: Список годов (None - отчёты за последний год)
+
+        :return: JSON ответа или None, если организации нет в БД
+        """
+        params: Dict[str, Any] = {"organization_id": organization_id}
+        if periods is None:
+            periods_sql = REPORT_RESPONSE_MAX_PERIOD_SQL
+        else:
+            periods_sql = REPORT_RESPONSE_PERIODS_SQL
+            params["periods"] = periods
+        query = text(REPORT_RESPONSE_SQL.replace("{periods}", periods_sql))
+        row = await self._crud._session.execute(query, params)
+        return row.scalar_one_or_none()
+
     async def get_last_report_by_organization_id(
         self, organization_id: int
     ) -> Optional[Report]:
@@ -89,12 +296,20 @@ class ReportRepo:
         query = (
             select(ReportModel)
             .where(ReportModel.organization_id == organization_id)
-            .order_by(ReportModel.updated_at.desc())
+            .order_by(ReportModel.checked_at.desc())
             .limit(1)
         )
         row = await self._crud._session.execute(query)
         return Report.from_orm(row.scalar_one_or_none())
 
+    def _max_report_year_subquery(self, organization_id: int) -> Any:
+        """Подзапрос для поиска максимального года отчёта организации"""
+        return (
+            select(func.max(ReportModel.report_year))
+            .where(ReportModel.organization_id == organization_id)
+            .scalar_subquery()
+        )
+
     async def get_max_reports_by_organization_id(
         self, organization_id: int
     ) -> List[Report]:
@@ -105,23 +320,81 @@ class ReportRepo:
 
         :param: Список отчётов за последний год
         """
-        # подзапрос для поиска максимального года
-        subquery = (
-            select(func.max(ReportModel.report_year))
-            .where(ReportModel.organization_id == organization_id)
-            .scalar_subquery()
-        )
         query = (
             select(ReportModel)
             .where(
                 ReportModel.organization_id == organization_id,
-                ReportModel.report_year == subquery,
+                ReportModel.report_year
+                == self._max_report_year_subquery(organization_id),
             )
             .order_by(ReportModel.present_date)
         )
         rows = await self._crud._session.execute(query)
         return [Report.from_orm_not_none(row) for row in rows.scalars().all()]
 
+    async def get_last_report_freshness_by_organization_id(
+        self, organization_id: int
+    ) -> Optional[ReportFreshness]:
+        """
+        Дата проверки последнего отчёта организации (листы отчёта не загружаются)
+
+        :param organization_id: id организации
+
+        :return: Даты отчёта или None
+        """
+        query = (
+            select(*FRESHNESS_COLUMNS)
+            .where(ReportModel.organization_id == organization_id)
+            .order_by(ReportModel.checked_at.desc())
+            .limit(1)
+        )
+        row = await self._crud._session.execute(query)
+        return ReportFreshness.from_row(row.one_or_none())
+
+    async def get_max_reports_freshness_by_organization_id(
+        self, organization_id: int
+    ) -> List[ReportFreshness]:
+        """
+        Даты проверки отчётов организации за последний год (листы отчёта не загружаются)
+
+        :param organization_id: id организации
+
+        :return: Список дат отчётов за последний год
+        """
+        query = (
+            select(*FRESHNESS_COLUMNS)
+            .where(
+                ReportModel.organization_id == organization_id,
+                ReportModel.report_year
+                == self._max_report_year_subquery(organization_id),
+            )
+            .order_by(ReportModel.present_date)
+        )
+        rows = await self._crud._session.execute(query)
+        return [ReportFreshness.from_row_not_none(row) for row in rows.all()]
+
+    async def get_checked_at_by_organization_id_and_periods(
+        self, organization_id: int, periods: List[int]
+    ) -> Dict[int, datetime]:
+        """
+        Когда последний раз проверялись отчёты за каждый год (листы отчёта не загружаются)
+
+        :param organization_id: id организации
+        :param periods: Список годов
+
+        :return: Дата проверки по годам (только годы, за которые есть отчёты)
+        """
+        query = (
+            select(ReportModel.report_year, func.max(ReportModel.checked_at))
+            .where(
+                ReportModel.organization_id == organization_id,
+                ReportModel.report_year.in_(periods),
+            )
+            .group_by(ReportModel.report_year)
+        )
+        rows = await self._crud._session.execute(query)
+        return {report_year: checked_at for report_year, checked_at in rows.all()}
+
     async def is_all_periods_available(
         self, organization_id: int, periods: List[int]
     ) -> List[int]:
@@ -138,11 +411,7 @@ class ReportRepo:
             .filter(
                 ReportModel.organization_id == organization_id,
                 ReportModel.report_year.in_(periods),
-                ReportModel.updated_at
-                >= (
-                    datetime.now(timezone.utc)
-                    - timedelta(days=settings.REPORT_AVAILABLE_DAYS)
-                ),
+                ReportModel.checked_at >= get_report_available_since(),
             )
             .distinct()
         )
@@ -158,35 +427,44 @@ class ReportRepo:
         """
         Обновить или создать отчёты в БД из результата запроса к БФО
 
+        Один запрос INSERT ... ON CONFLICT DO UPDATE на пачку из
+        REPORT_UPSERT_CHUNK_SIZE корректировок. Если хэш содержимого не
+        изменился, листы отчёта не перезаписываются, обновляется только checked_at
+
         :param organization_id: id организации
         :param details: Список отчётов из БФО
         """
+        # ON CONFLICT не может изменить одну строку дважды за запрос,
+        # поэтому повторы корректировки схлопываются (побеждает последняя)
+        rows: Dict[Tuple[int, date], Dict[str, Any]] = {}
         for detail in details:
             for correction in detail.corrections:
-                # обновляем данные у отчёта
-                query = (
-                    update(ReportModel)
-                    .where(
-                        ReportModel.organization_id == organization_id,
-                        ReportModel.report_year == detail.period,
-                        ReportModel.present_date == correction.date_present,
-                    )
-                    .values(
-                        organization_sheet=correction.organization_info,
-                        balance_sheet=correction.balance,
-                        financial_sheet=correction.financial,
-                    )
-                    .returning(ReportModel.id)
-                )
-                updated_row = await self._crud._session.execute(query)
-                if len(updated_row.scalars().all()) == 0:
-                    # отчёт не найден, создадим новую запись
-                    query = insert(ReportModel).values(
-                        organization_id=organization_id,
-                        report_year=detail.period,
-                        present_date=correction.date_present,
-                        organization_sheet=correction.organization_info,
-                        balance_sheet=correction.balance,
-                        financial_sheet=correction.financial,
-                    )
-                    await self._crud._session.execute(query)
+                rows[(detail.period, correction.date_present)] = {
+                    "organization_id": organization_id,
+                    "report_year": detail.period,
+                    "present_date": correction.date_present,
+                    "organization_sheet": correction.organization_info,
+                    "balance_sheet": correction.balance,
+                    "financial_sheet": correction.financial,
+                    "content_hash": report_content_hash(
+                        correction.organization_info,
+                        correction.balance,
+                        correction.financial,
+                    ),
+                }
+        values = list(rows.values())
+        chunk_size = settings.REPORT_UPSERT_CHUNK_SIZE
+        for start in range(0, len(values), chunk_size):
+            query = pg_insert(ReportModel).values(values[start : start + chunk_size])
+            query = query.on_conflict_do_update(
+                constraint="uq_reports_organization_id_report_year_present_date",
+                set_=self._get_upsert_set(query),
+            )
+            await self._crud._session.execute(query)
+        # INSERT ... ON CONFLICT не синхронизирует уже загруженные в сессию отчёты
+        for instance in list(self._crud._session.identity_map.values()):
+            if (
+                isinstance(instance, ReportModel)
+                and instance.organization_id == organization_id
+            ):
+                self._crud._session.expire(instance)
@@ -1,7 +1,7 @@
 import warnings
 from asyncio import current_task
-from typing import Callable
-from sqlalchemy import MetaData, exc
+from typing import Callable, Dict
+from sqlalchemy import MetaData, event, exc
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -45,6 +45,36 @@ engine: AsyncEngine = create_async_engine(
 )
 
 
+class PoolStats:
+    """Счётчик выдачи соединений из пула (checkout) и возврата в пул (checkin)"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+
+    def watch(self, async_engine: AsyncEngine) -> None:
+        event.listen(async_engine.sync_engine, "checkout", self._on_checkout)
+        event.listen(async_engine.sync_engine, "checkin", self._on_checkin)
+
+    def _on_checkout(self, *args) -> None:
+        self.checkouts += 1
+
+    def _on_checkin(self, *args) -> None:
+        self.checkins += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "checked_out": self.checkouts - self.checkins,
+        }
+
+
+# соединения пула engine
+db_pool_stats = PoolStats()
+db_pool_stats.watch(engine)
+
+
 async def build_db_session_factory() -> AsyncSessionFactory:
     await verify_db_connection(engine)
 
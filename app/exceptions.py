@@ -1,20 +1,44 @@
-from typing import Any
+from typing import Any, Optional
 from fastapi import HTTPException
 
 
 class BfoTooManyRequestsException(HTTPException):
     """Исключение для Too Many Requests"""
 
-    def __init__(self, detail: Any = "Слишком много запросов", headers: dict = None):
+    def __init__(
+        self,
+        detail: Any = "Слишком много запросов",
+        headers: dict = None,
+        proxy: Optional[str] = None,
+        retry_after: Optional[int] = None,
+    ):
         super().__init__(
             status_code=429,
             detail={"detail": detail},
             headers=headers,
         )
+        # имя прокси, через который получен 429 (None - прямое подключение)
+        self.proxy = proxy
+        # Retry-After из ответа БФО (None - заголовка не было)
+        self.retry_after = retry_after
 
 
 class BfoApiException(HTTPException):
     """Базовое исключение для ошибок BFO API"""
 
-    def __init__(self, status_code: int, detail: dict):
+    def __init__(
+        self, status_code: int, detail: dict, retry_after: Optional[int] = None
+    ):
         super().__init__(status_code=status_code, detail=detail)
+        # Retry-After из ответа БФО (None - заголовка не было)
+        self.retry_after = retry_after
+
+
+class BfoOrganizationNotFoundException(HTTPException):
+    """БФО не нашёл организацию по ИНН"""
+
+    def __init__(self, inn: str):
+        super().__init__(
+            status_code=404,
+            detail={"message": f"Организация с ИНН {inn} не найдена"},
+        )
@@ -1,15 +1,49 @@
-from typing import Dict, Any, Literal
-from aiohttp import ClientSession
+import asyncio
+import math
+import time
+from typing import Dict, Any, Literal, Optional
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
 from asyncio_redis import Pool
-from fastapi import HTTPException, status
+from fastapi import HTTPException
 
-from app.exceptions import BfoTooManyRequestsException
+from app.exceptions import (
+    BfoApiException,
+    BfoOrganizationNotFoundException,
+    BfoTooManyRequestsException,
+)
 from app.helpers.decorators import check_bfo_timeout
+from app.helpers.proxy_pool import ProxyState, bfo_proxy_pool
+from app.helpers.redis import adjust_bfo_rate, take_bfo_token
+from app.helpers.retry import backoff_delay, bfo_latency_tracker, parse_retry_after
 from app.logger import logger
 from app.schemas.bfo_api import GetDetailsResult, SearchOrganizationResult
 from app.settings import settings
 
 
+def create_bfo_client_session() -> ClientSession:
+    """
+    Создание общей (на всё приложение) сессии aiohttp для запросов к БФО
+
+    Сессия держит пул keep-alive соединений и кэш DNS, поэтому повторные
+    запросы к БФО (и к прокси) не тратят время на установку TCP/TLS соединения.
+    Закрывается при остановке приложения (см. lifespan)
+
+    :return: Сессия из aiohttp
+    """
+    connector = TCPConnector(
+        limit=settings.BFO_CONNECTION_LIMIT,
+        limit_per_host=settings.BFO_CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=settings.BFO_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=settings.BFO_DNS_CACHE_TTL,
+    )
+    timeout = ClientTimeout(
+        total=settings.BFO_TOTAL_TIMEOUT,
+        connect=settings.BFO_CONNECT_TIMEOUT,
+        sock_read=settings.BFO_SOCK_READ_TIMEOUT,
+    )
+    return ClientSession(connector=connector, timeout=timeout)
+
+
 def get_headers_for_bfo_request(headers: Dict[str, Any] = {}) -> Dict[str, Any]:
     """
     Добавление User-Agent в заголовки для успешного запроса к БФО
@@ -24,6 +58,215 @@ def get_headers_for_bfo_request(headers: Dict[str, Any] = {}) -> Dict[str, Any]:
     return headers
 
 
+async def wait_bfo_token(redis: Pool, proxy: ProxyState) -> None:
+    """
+    Ожидание токена из корзины запросов к БФО (у каждого прокси своя корзина)
+
+    Ждём не дольше BFO_RATE_LIMIT_MAX_WAIT_SECONDS, иначе отвечаем 429,
+    не отправляя запрос в БФО
+
+    :param redis: Пул подключений к redis
+    :param proxy: Выбранный прокси
+    """
+    deadline = time.monotonic() + settings.BFO_RATE_LIMIT_MAX_WAIT_SECONDS
+    while True:
+        state = await take_bfo_token(
+            redis, bucket_key=proxy.bucket_key, rate_key=proxy.rate_key
+        )
+        if state.allowed:
+            return
+        if time.monotonic() + state.wait_seconds > deadline:
+            retry_after = math.ceil(state.wait_seconds)
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "message": f"Превышен лимит запросов к БФО (повторите через {retry_after} секунд)"
+                },
+                headers={"Retry-After": str(retry_after)},
+            )
+        await asyncio.sleep(state.wait_seconds)
+
+
+async def request_bfo_once(
+    redis: Pool,
+    session: ClientSession,
+    proxy: ProxyState,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Одна попытка GET запроса к БФО через выбранный прокси
+
+    Учитывает лимит запросов прокси (token bucket + AIMD), его задержку
+    и ошибки (оценка здоровья, исключение из пула) и таймаут после 429.
+    Таймаут берётся из Retry-After, если БФО его прислал (429 или 503)
+
+    :param redis: Пул подключений к redis
+    :param session: Общая сессия из aiohttp (app.state.bfo_session)
+    :param proxy: Выбранный прокси
+    :param url: Адрес запроса
+    :param params: Параметры запроса
+
+    :return: Тело ответа (json)
+    """
+    started = time.monotonic()
+    try:
+        async with session.get(
+            url,
+            params=params,
+            proxy=proxy.url,
+            headers=get_headers_for_bfo_request(),
+        ) as response:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status == 429 or (
+                response.status == 503 and retry_after is not None
+            ):
+                proxy.on_rate_limited(retry_after or settings.REDIS_BFO_TIMEOUT_SECONDS)
+                await adjust_bfo_rate(redis, decrease=True, rate_key=proxy.rate_key)
+                raise BfoTooManyRequestsException(
+                    detail={"message": "Слишком много запросов"},
+                    proxy=None if proxy.url is None else proxy.name,
+                    retry_after=retry_after,
+                )
+            if response.status != 200:
+                if response.status >= 500:
+                    proxy.on_error()
+                error = await response.text()
+                raise BfoApiException(
+                    status_code=response.status,
+                    detail={"message": error},
+                    retry_after=retry_after,
+                )
+            result = await response.json()
+    except (ClientError, asyncio.TimeoutError):
+        proxy.on_error()
+        raise
+    latency = time.monotonic() - started
+    proxy.on_success(latency)
+    bfo_latency_tracker.add(latency)
+    await adjust_bfo_rate(redis, decrease=False, rate_key=proxy.rate_key)
+    return result
+
+
+async def request_bfo_hedged(
+    redis: Pool,
+    session: ClientSession,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Запрос к БФО с hedging: если ответа нет дольше p95 задержки,
+    отправляется второй запрос через другой прокси (или другое соединение),
+    используется первый успешный ответ
+
+    Второй запрос отправляется, только если в корзине прокси есть токен -
+    hedging не должен сам вызывать 429
+
+    :param redis: Пул подключений к redis
+    :param session: Общая сессия из aiohttp (app.state.bfo_session)
+    :param url: Адрес запроса
+    :param params: Параметры запроса
+
+    :return: Тело ответа (json)
+    """
+    proxy = bfo_proxy_pool.select()
+    await wait_bfo_token(redis, proxy)
+    if not settings.BFO_HEDGE_ENABLED:
+        return await request_bfo_once(redis, session, proxy, url, params)
+    first = asyncio.ensure_future(request_bfo_once(redis, session, proxy, url, params))
+    delay = max(
+        settings.BFO_HEDGE_MIN_DELAY,
+        bfo_latency_tracker.quantile(settings.BFO_HEDGE_QUANTILE) or 0,
+    )
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if len(done) > 0:
+            return first.result()
+        hedge_proxy = bfo_proxy_pool.select(exclude=proxy)
+        state = await take_bfo_token(
+            redis, bucket_key=hedge_proxy.bucket_key, rate_key=hedge_proxy.rate_key
+        )
+        if not state.allowed:
+            return await first
+        logger.info(
+            f"Hedging запроса к БФО: {proxy.name} не ответил за {delay:.2f} с, "
+            f"второй запрос через {hedge_proxy.name}"
+        )
+        tasks.add(
+            asyncio.ensure_future(
+                request_bfo_once(redis, session, hedge_proxy, url, params)
+            )
+        )
+        error = None
+        while len(tasks) > 0:
+            done, tasks = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                if error is None or task is first:
+                    error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def request_bfo(
+    redis: Pool,
+    session: ClientSession,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    GET запрос к БФО с повторами
+
+    Повторяются ошибки соединения, таймауты, ответы из BFO_RETRY_STATUSES
+    и 429 через прокси, если в пуле есть другие доступные прокси.
+    Задержка между попытками - экспоненциальная с джиттером, но не меньше
+    Retry-After. Все попытки укладываются в BFO_RETRY_DEADLINE_SECONDS.
+    429 при прямом подключении не повторяется - это общий таймаут
+
+    :param redis: Пул подключений к redis
+    :param session: Общая сессия из aiohttp (app.state.bfo_session)
+    :param url: Адрес запроса
+    :param params: Параметры запроса
+
+    :return: Тело ответа (json)
+    """
+    deadline = time.monotonic() + settings.BFO_RETRY_DEADLINE_SECONDS
+    attempt = 0
+    while True:
+        try:
+            return await asyncio.wait_for(
+                request_bfo_hedged(redis, session, url, params),
+                timeout=max(0, deadline - time.monotonic()),
+            )
+        except BfoTooManyRequestsException as ex:
+            if ex.proxy is None or not bfo_proxy_pool.has_available():
+                raise
+            error, delay = ex, 0.0
+        except BfoApiException as ex:
+            if ex.status_code not in settings.BFO_RETRY_STATUSES:
+                raise
+            error, delay = ex, max(backoff_delay(attempt), ex.retry_after or 0)
+        except (ClientError, asyncio.TimeoutError) as ex:
+            error, delay = ex, backoff_delay(attempt)
+        attempt += 1
+        if (
+            attempt >= settings.BFO_RETRY_ATTEMPTS
+            or time.monotonic() + delay >= deadline
+        ):
+            raise error
+        logger.warning(
+            f"Повтор запроса к БФО ({attempt}/{settings.BFO_RETRY_ATTEMPTS - 1}) "
+            f"через {delay:.2f} с: {error!r}"
+        )
+        await asyncio.sleep(delay)
+
+
 @check_bfo_timeout
 async def search_organization_by_inn(
     redis: Pool, session: ClientSession, inn: str
@@ -32,33 +275,17 @@ async def search_organization_by_inn(
     Поиск организации по ИНН
 
     :param redis: Пул подключений к redis
-    :param session: Сессия из aiohttp
+    :param session: Общая сессия из aiohttp (app.state.bfo_session)
     :param inn: ИНН организации
 
     :return: Модель результата поиска
     """
     url = f"{settings.BFO_URL}/advanced-search/organizations/search"
     params = {"query": inn, "page": 0, "size": 20}
-    async with session.get(
-        url,
-        params=params,
-        proxy=settings.PROXY_URL,
-        headers=get_headers_for_bfo_request(),
-    ) as response:
-        if response.status == 429:
-            raise BfoTooManyRequestsException(
-                detail={"message": "Слишком много запросов"}
-            )
-        if response.status != 200:
-            error = await response.text()
-            raise HTTPException(status_code=response.status, detail={"message": error})
-        result = await response.json()
-        if len(result["content"]) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail={"message": "Организация с ИНН {inn} не найдена"},
-            )
-        return SearchOrganizationResult.model_validate(result)
+    result = await request_bfo(redis, session, url, params)
+    if len(result["content"]) == 0:
+        raise BfoOrganizationNotFoundException(inn)
+    return SearchOrganizationResult.model_validate(result)
 
 
 @check_bfo_timeout
@@ -69,24 +296,14 @@ async def get_details_by_organization_id(
     Получение списка доступных отчётов
 
     :param redis: Пул подключений к redis
-    :param session: Сессия из aiohttp
+    :param session: Общая сессия из aiohttp (app.state.bfo_session)
     :param organization_id: id организации
 
     :return: Модель результата поиска
     """
     url = f"{settings.BFO_URL}/nbo/organizations/{organization_id}/bfo"
-    async with session.get(
-        url, proxy=settings.PROXY_URL, headers=get_headers_for_bfo_request()
-    ) as response:
-        if response.status == 429:
-            raise BfoTooManyRequestsException(
-                detail={"message": "Слишком много запросов"}
-            )
-        if response.status != 200:
-            error = await response.text()
-            raise HTTPException(status_code=response.status, detail={"message": error})
-        result = await response.json()
-        return GetDetailsResult.model_validate(result)
+    result = await request_bfo(redis, session, url)
+    return GetDetailsResult.model_validate(result)
 
 
 # @check_bfo_timeout
@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from enum import Enum
+from typing import Any, Dict
+import asyncio_redis
+from asyncio_redis import Pool
+from fastapi import HTTPException
+
+from app.helpers.redis import bfo_timeout_left, create_bfo_timeout_flag
+from app.logger import logger
+from app.settings import settings
+
+
+class CircuitState(str, Enum):
+    """Состояние circuit breaker запросов к БФО"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class BfoCircuitBreaker:
+    """
+    Локальное (в памяти процесса) зеркало таймаута запросов к БФО
+
+    Таймаут по-прежнему хранится в redis (REDIS_BFO_TIMEOUT_KEY), но проверка
+    перед запросом к БФО читает только память. Redis используется при смене
+    состояния: открытие публикуется в REDIS_BFO_TIMEOUT_CHANNEL, о закрытии
+    сообщает уведомление об истечении ключа на его канал
+    (--notify-keyspace-events Kx).
+    Если уведомления не доходят, состояние перечитывается из redis не чаще
+    раза в BFO_CIRCUIT_SYNC_SECONDS
+    """
+
+    def __init__(self):
+        self.state = CircuitState.CLOSED
+        self.open_until = 0.0
+        self._synced_at = 0.0
+        self._probe_in_flight = False
+        # счётчики для статистики
+        self.redis_reads = 0
+        self.rejected = 0
+
+    def _open_locally(self, seconds: float) -> None:
+        self.state = CircuitState.OPEN
+        self.open_until = max(self.open_until, time.time() + seconds)
+        self._probe_in_flight = False
+
+    def _reject(self) -> None:
+        self.rejected += 1
+        timeout = max(1, math.ceil(self.open_until - time.time()))
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "message": f"Слишком много запросов к БФО (таймаут {timeout} секунд)"
+            },
+            headers={"Retry-After": str(timeout)},
+        )
+
+    async def sync(self, redis: Pool) -> None:
+        """
+        Перечитать таймаут из redis
+
+        :param redis: Подключение к redis
+        """
+        self.redis_reads += 1
+        self._synced_at = time.monotonic()
+        timeout = await bfo_timeout_left(redis)
+        if timeout is not None:
+            self._open_locally(timeout)
+
+    async def before_call(self, redis: Pool) -> None:
+        """
+        Проверка перед запросом к БФО (при открытом состоянии - 429)
+
+        В полуоткрытом состоянии пропускается один пробный запрос,
+        остальные получают 429 до его завершения
+
+        :param redis: Подключение к redis
+        """
+        if (
+            self.state == CircuitState.CLOSED
+            and time.monotonic() - self._synced_at > settings.BFO_CIRCUIT_SYNC_SECONDS
+        ):
+            await self.sync(redis)
+        if self.state == CircuitState.OPEN:
+            if time.time() < self.open_until:
+                self._reject()
+            self.state = CircuitState.HALF_OPEN
+        if self.state == CircuitState.HALF_OPEN:
+            if self._probe_in_flight:
+                self._reject()
+            self._probe_in_flight = True
+
+    def on_success(self) -> None:
+        """Запрос к БФО завершился без 429"""
+        self._probe_in_flight = False
+        if self.state == CircuitState.HALF_OPEN:
+            self.state = CircuitState.CLOSED
+
+    def on_error(self) -> None:
+        """Запрос к БФО завершился ошибкой, не связанной с лимитом"""
+        self._probe_in_flight = False
+
+    async def open(self, redis: Pool, seconds: int) -> None:
+        """
+        Открыть circuit breaker для всех воркеров (БФО ответил 429)
+
+        :param redis: Подключение к redis
+        :param seconds: Длительность таймаута
+        """
+        self._open_locally(seconds)
+        await create_bfo_timeout_flag(redis, seconds)
+
+    def on_timeout_published(self, seconds: float) -> None:
+        """Другой воркер открыл circuit breaker"""
+        self._open_locally(seconds)
+
+    def on_timeout_expired(self) -> None:
+        """Ключ таймаута истёк в redis - разрешаем пробный запрос"""
+        if self.state == CircuitState.OPEN:
+            self.state = CircuitState.HALF_OPEN
+            self.open_until = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние circuit breaker"""
+        timeout_left = None
+        if self.state == CircuitState.OPEN:
+            timeout_left = max(0, math.ceil(self.open_until - time.time()))
+        return {
+            "state": self.state.value,
+            "timeout_left": timeout_left,
+            "redis_reads": self.redis_reads,
+            "rejected": self.rejected,
+        }
+
+
+bfo_circuit_breaker = BfoCircuitBreaker()
+
+
+def get_bfo_timeout_keyspace_channel() -> str:
+    """Канал уведомлений о событиях ключа таймаута БФО в REDIS_DB"""
+    return f"__keyspace@{settings.REDIS_DB}__:{settings.REDIS_BFO_TIMEOUT_KEY}"
+
+
+async def listen_bfo_circuit_events(breaker: BfoCircuitBreaker) -> None:
+    """
+    Фоновая задача: синхронизация circuit breaker через pub/sub redis
+
+    Слушает публикации об открытии (REDIS_BFO_TIMEOUT_CHANNEL) и уведомления
+    только о ключе таймаута (канал его событий в REDIS_DB, а не истечения
+    всех ключей всех баз). Запускается в lifespan
+
+    :param breaker: Circuit breaker процесса
+    """
+    while True:
+        connection = None
+        try:
+            connection = await asyncio_redis.Connection.create(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+            )
+            subscriber = await connection.start_subscribe()
+            await subscriber.subscribe(
+                [settings.REDIS_BFO_TIMEOUT_CHANNEL, get_bfo_timeout_keyspace_channel()]
+            )
+            while True:
+                reply = await subscriber.next_published()
+                if reply.channel == settings.REDIS_BFO_TIMEOUT_CHANNEL:
+                    breaker.on_timeout_published(float(reply.value))
+                elif reply.value == "expired":
+                    breaker.on_timeout_expired()
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.error(f"Ошибка подписки на события circuit breaker БФО: {ex}")
+            await asyncio.sleep(1)
+        finally:
+            if connection is not None:
+                connection.close()
@@ -1,20 +1,32 @@
-from fastapi import HTTPException
-
-from app.helpers.redis import bfo_timeout_left
+from app.exceptions import BfoTooManyRequestsException
+from app.helpers.circuit_breaker import bfo_circuit_breaker
+from app.settings import settings
 
 
 def check_bfo_timeout(func):
     """Декоратор для проверки таймаута запросов к БФО"""
 
     async def wrapper(*args, **kwargs):
-        timeout = await bfo_timeout_left(args[0])
-        if timeout is not None:
-            raise HTTPException(
-                status_code=429,
-                detail={
-                    "message": f"Слишком много запросов к БФО (таймаут {timeout} секунд)"
-                },
-            )
-        return await func(*args, **kwargs)
+        redis = args[0]
+        # проверка таймаута читает только память процесса
+        await bfo_circuit_breaker.before_call(redis)
+        try:
+            result = await func(*args, **kwargs)
+        except BfoTooManyRequestsException as ex:
+            if ex.proxy is None:
+                # 429 при прямом подключении - таймаут для всех воркеров,
+                # таймаут прокси хранится в пуле прокси.
+                # Длительность - из Retry-After, если БФО его прислал
+                await bfo_circuit_breaker.open(
+                    redis, ex.retry_after or settings.REDIS_BFO_TIMEOUT_SECONDS
+                )
+            else:
+                bfo_circuit_breaker.on_error()
+            raise
+        except BaseException:
+            bfo_circuit_breaker.on_error()
+            raise
+        bfo_circuit_breaker.on_success()
+        return result
 
     return wrapper
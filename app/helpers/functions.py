@@ -1,3 +1,8 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+
 def validate_inn(inn: str) -> tuple[bool, str]:
     """
     Проверка ИНН юридических лиц
@@ -24,3 +29,26 @@ def validate_inn(inn: str) -> tuple[bool, str]:
         return False, "Первая цифра ИНН не может быть нулем"
 
     return True, inn
+
+
+def report_content_hash(
+    organization: Optional[Dict[str, Any]],
+    balance: Optional[Dict[str, Any]],
+    finance: Optional[Dict[str, Any]],
+) -> str:
+    """
+    Хэш содержимого отчёта (не зависит от порядка ключей)
+
+    :param organization: Данные об организации
+    :param balance: Данные из бухгалтерского баланса
+    :param finance: Данные из финансового отчёта
+
+    :return: sha256 в hex
+    """
+    content = json.dumps(
+        [organization, balance, finance],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
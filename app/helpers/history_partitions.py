@@ -0,0 +1,117 @@
+import asyncio
+from datetime import date
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.history.repo import HistoryRepo
+from app.db.sqlalchemy import AsyncSessionFactory
+from app.logger import logger
+from app.settings import settings
+
+PARTITION_PREFIX = "history_p"
+
+
+def add_months(month: date, months: int) -> date:
+    """Первое число месяца через months месяцев (months может быть отрицательным)"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(month: date) -> str:
+    """Имя секции history за месяц"""
+    return f"{PARTITION_PREFIX}{month.year:04d}{month.month:02d}"
+
+
+def get_partition_month(name: str) -> Optional[date]:
+    """Месяц секции history по имени (None - не помесячная секция)"""
+    suffix = name[len(PARTITION_PREFIX) :]
+    if not name.startswith(PARTITION_PREFIX) or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return date(int(suffix[:4]), int(suffix[4:]), 1)
+
+
+async def maintain_history_partitions(
+    db_session: AsyncSession, today: Optional[date] = None
+) -> Dict[str, List[str]]:
+    """
+    Создание секций history на REQUEST_HISTORY_PARTITIONS_AHEAD месяцев вперёд и
+    отсоединение (удаление) секций, которые целиком старше
+    REQUEST_HISTORY_RETENTION_MONTHS месяцев. Вызывающий фиксирует транзакцию
+
+    Выполняется одним воркером: остальные пропускают обслуживание, пока
+    держится транзакционная advisory-блокировка
+
+    :param db_session: Сессия БД
+    :param today: Текущая дата (по умолчанию сегодня)
+
+    :return: Созданные, отсоединённые и удалённые секции
+    """
+    result: Dict[str, List[str]] = {"created": [], "detached": [], "dropped": []}
+    locked = await db_session.execute(
+        text("SELECT pg_try_advisory_xact_lock(hashtext('history_partitions'))")
+    )
+    if not locked.scalar():
+        return result
+    history_repo = HistoryRepo(db_session)
+    partitions = set(await history_repo.get_partitions())
+    current = (today or date.today()).replace(day=1)
+    for months in range(settings.REQUEST_HISTORY_PARTITIONS_AHEAD + 1):
+        month = add_months(current, months)
+        name = get_partition_name(month)
+        if name not in partitions:
+            moved = await history_repo.create_partition(
+                name, month, add_months(month, 1)
+            )
+            if moved:
+                logger.warning(
+                    f"В секцию {name} перенесено строк из history_default: {moved}"
+                )
+            result["created"].append(name)
+    # секция устарела, если её последний месяц раньше срока хранения
+    cutoff = add_months(current, -settings.REQUEST_HISTORY_RETENTION_MONTHS)
+    for name in sorted(partitions):
+        month = get_partition_month(name)
+        if month is None or add_months(month, 1) > cutoff:
+            continue
+        try:
+            # точка сохранения: при таймауте блокировки созданные секции остаются
+            async with db_session.begin_nested():
+                await history_repo.detach_partition(
+                    name,
+                    drop=settings.REQUEST_HISTORY_DROP_EXPIRED,
+                    lock_timeout_ms=settings.REQUEST_HISTORY_DETACH_LOCK_TIMEOUT_MS,
+                )
+        except Exception as ex:
+            logger.error(f"Не удалось отсоединить секцию history {name}: {ex}")
+            continue
+        result["detached"].append(name)
+        if settings.REQUEST_HISTORY_DROP_EXPIRED:
+            result["dropped"].append(name)
+    return result
+
+
+async def run_history_partition_maintenance(
+    db_session_factory: AsyncSessionFactory,
+) -> None:
+    """
+    Фоновая задача: обслуживание секций history раз в
+    REQUEST_HISTORY_MAINTENANCE_INTERVAL_SECONDS. Запускается в lifespan
+
+    :param db_session_factory: Фабрика сессий БД
+    """
+    while True:
+        db_session = db_session_factory()
+        try:
+            result = await maintain_history_partitions(db_session)
+            await db_session.commit()
+            if any(result.values()):
+                logger.info(f"Секции history: {result}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.error(f"Ошибка обслуживания секций history: {ex}")
+            await db_session.rollback()
+        finally:
+            await db_session.close()
+        await asyncio.sleep(settings.REQUEST_HISTORY_MAINTENANCE_INTERVAL_SECONDS)
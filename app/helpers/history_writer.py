@@ -0,0 +1,217 @@
+import asyncio
+import random
+from typing import Any, Dict, List, Optional
+
+from app.db.history.repo import HistoryRepo
+from app.db.sqlalchemy import AsyncSessionFactory
+from app.logger import logger
+from app.schemas.db.history import HistoryRecord
+from app.settings import settings
+
+OVERFLOW_POLICIES = ("drop_new", "drop_oldest", "sample")
+
+
+async def write_history(
+    db_session_factory: AsyncSessionFactory, records: List[HistoryRecord]
+) -> int:
+    """
+    Сохранение записей истории запросов в одной транзакции. Если пачка не
+    сохранилась (например, тело одного ответа - не JSON), записи сохраняются
+    по одной, чтобы одна плохая запись не теряла всю пачку
+
+    :param db_session_factory: Фабрика сессий БД
+    :param records: Записи истории
+
+    :return: Количество сохранённых записей
+    """
+    if await _write_history_batch(db_session_factory, records):
+        return len(records)
+    if len(records) == 1:
+        return 0
+    written = 0
+    for record in records:
+        if await _write_history_batch(db_session_factory, [record]):
+            written += 1
+    return written
+
+
+async def _write_history_batch(
+    db_session_factory: AsyncSessionFactory, records: List[HistoryRecord]
+) -> bool:
+    db_session = db_session_factory()
+    try:
+        await HistoryRepo(db_session).create_histories(records)
+        await db_session.commit()
+        return True
+    except Exception as ex:
+        logger.error(f"Не удалось сохранить лог запросов ({len(records)}). ({ex})")
+        await db_session.rollback()
+        return False
+    finally:
+        await db_session.close()
+
+
+class HistoryWriter:
+    """
+    Фоновая запись истории запросов пачками (создаётся и запускается в
+    lifespan, хранится в app.state.history_writer)
+
+    Запросы кладут записи в ограниченную очередь и не ждут БД. Пачка
+    сохраняется одним INSERT, когда набралось batch_size записей или прошло
+    flush_seconds с первой записи пачки. При переполнении очереди:
+    drop_new - новая запись отбрасывается, drop_oldest - отбрасывается самая
+    старая, sample - когда очередь заполнена больше чем наполовину, принимается
+    только доля sample_rate записей (при полной очереди новая отбрасывается)
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int,
+        batch_size: int,
+        flush_seconds: float,
+        overflow_policy: str = "drop_new",
+        sample_rate: float = 0.1,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Неизвестная политика переполнения очереди истории: {overflow_policy}"
+            )
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.overflow_policy = overflow_policy
+        self.sample_rate = sample_rate
+        # очередь и задача создаются в start() в цикле событий приложения,
+        # None в очереди - сигнал остановки
+        self._queue: "Optional[asyncio.Queue[Optional[HistoryRecord]]]" = None
+        self._task: Optional[asyncio.Task] = None
+        # счётчики для статистики
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db_session_factory: AsyncSessionFactory) -> None:
+        """
+        Запуск фоновой записи
+
+        :param db_session_factory: Фабрика сессий БД
+        """
+        if not self.running:
+            self._queue = asyncio.Queue(self.max_queue_size)
+            self._task = asyncio.create_task(
+                self._run(db_session_factory, self._queue)
+            )
+
+    def put(self, record: HistoryRecord) -> bool:
+        """
+        Добавление записи в очередь (без ожидания)
+
+        :param record: Запись истории
+
+        :return: Принята ли запись (до start() записи не принимаются)
+        """
+        queue = self._queue
+        if queue is None:
+            self.dropped += 1
+            return False
+        if (
+            self.overflow_policy == "sample"
+            and queue.qsize() >= self.max_queue_size // 2
+            and random.random() >= self.sample_rate
+        ):
+            self.dropped += 1
+            return False
+        if queue.full():
+            self.dropped += 1
+            if self.overflow_policy != "drop_oldest":
+                return False
+            queue.get_nowait()
+        queue.put_nowait(record)
+        return True
+
+    async def stop(self, timeout: float) -> None:
+        """
+        Остановка: записи, уже попавшие в очередь, сохраняются
+
+        :param timeout: Максимальное ожидание сохранения (сек)
+        """
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        queue, self._queue = self._queue, None
+        try:
+            await asyncio.wait_for(queue.put(None), timeout)
+            await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Не удалось сохранить лог запросов при остановке ({queue.qsize()})"
+            )
+            task.cancel()
+
+    async def _run(
+        self,
+        db_session_factory: AsyncSessionFactory,
+        queue: "asyncio.Queue[Optional[HistoryRecord]]",
+    ) -> None:
+        # stop() сбрасывает self._queue, задача дочитывает свою очередь
+        loop = asyncio.get_running_loop()
+        while True:
+            record = await queue.get()
+            if record is None:
+                return
+            batch = [record]
+            stopping = False
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        record = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    record = queue.get_nowait()
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            await self._flush(db_session_factory, batch)
+            if stopping:
+                return
+
+    async def _flush(
+        self, db_session_factory: AsyncSessionFactory, batch: List[HistoryRecord]
+    ) -> None:
+        written = await write_history(db_session_factory, batch)
+        self.written += written
+        self.failed += len(batch) - written
+        self.batches += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_size": self.max_queue_size,
+            "overflow_policy": self.overflow_policy,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+
+def create_history_writer() -> HistoryWriter:
+    """Запись истории запросов к REQUEST_LOGGING_MIDDLEWARE_ENDPOINTS по настройкам"""
+    return HistoryWriter(
+        settings.REQUEST_HISTORY_QUEUE_SIZE,
+        settings.REQUEST_HISTORY_BATCH_SIZE,
+        settings.REQUEST_HISTORY_FLUSH_SECONDS,
+        settings.REQUEST_HISTORY_OVERFLOW_POLICY,
+        settings.REQUEST_HISTORY_SAMPLE_RATE,
+    )
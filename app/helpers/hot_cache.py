@@ -0,0 +1,251 @@
+import asyncio
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+import asyncio_redis
+
+from app.helpers.ttl_cache import TTLCache
+from app.logger import logger
+from app.settings import settings
+
+
+class FrequencySketch:
+    """
+    Приблизительные частоты обращений к ключам (count-min sketch, 4-битные
+    счётчики), которые периодически уменьшаются вдвое, чтобы старые обращения
+    переставали учитываться (TinyLFU)
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, width: int):
+        self.width = width
+        self._rows = [[0] * width for _ in range(self.DEPTH)]
+        self._additions = 0
+        self._sample_size = width * 10
+
+    def _indexes(self, key: Hashable) -> List[int]:
+        return [hash((row, key)) % self.width for row in range(self.DEPTH)]
+
+    def increment(self, key: Hashable) -> None:
+        indexes = self._indexes(key)
+        count = min(row[index] for row, index in zip(self._rows, indexes))
+        if count < self.MAX_COUNT:
+            # увеличиваются только минимальные счётчики (conservative update)
+            for row, index in zip(self._rows, indexes):
+                if row[index] == count:
+                    row[index] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._reset()
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def _reset(self) -> None:
+        self._additions //= 2
+        for row in self._rows:
+            for index, count in enumerate(row):
+                row[index] = count // 2
+
+
+class HotResponseCache:
+    """
+    Кэш ответов с отчётами в памяти процесса (сжатые zlib байты ответа)
+
+    Размер ограничен суммой сжатых ответов (REPORT_HOT_CACHE_MAX_BYTES):
+    вытесняются давно использованные записи (LRU), но новая запись принимается,
+    только если к её ключу обращались чаще, чем к вытесняемым (TinyLFU).
+    Записи живут, пока отчёты актуальны, и удаляются при обновлении отчётов
+    организации (в других воркерах - по событию из REDIS_RESPONSE_CACHE_CHANNEL)
+    """
+
+    def __init__(self, max_bytes: int, sketch_width: int = 8192):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # ключ -> (срок жизни, id организации, версия, сжатое тело)
+        self._data: "OrderedDict[Hashable, Tuple[float, int, int, bytes]]" = (
+            OrderedDict()
+        )
+        self._keys_by_organization: Dict[int, Set[Hashable]] = {}
+        # версии из событий об обновлении отчётов: не дают сохранить ответ,
+        # собранный запросом, который начался до обновления
+        self._versions = TTLCache(100_000, 300)
+        self._sketch = FrequencySketch(sketch_width)
+        # счётчики для статистики
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.evictions = 0
+        self.rejected = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """
+        Тело ответа по ключу
+
+        :param key: Ключ ответа
+
+        :return: Тело ответа (JSON) или None
+        """
+        self._sketch.increment(key)
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        if time.monotonic() >= item[0]:
+            self._delete(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        body = zlib.decompress(item[3])
+        self.hits += 1
+        self.bytes_served += len(body)
+        return body
+
+    def set(
+        self,
+        key: Hashable,
+        organization_id: int,
+        version: int,
+        body: bytes,
+        ttl: float,
+    ) -> bool:
+        """
+        Сохранение ответа
+
+        :param key: Ключ ответа
+        :param organization_id: id организации
+        :param version: Версия ответов организации, прочитанная до чтения отчётов
+        :param body: Тело ответа (JSON)
+        :param ttl: Время жизни записи (сек)
+
+        :return: Сохранён ли ответ
+        """
+        if ttl <= 0 or version < self._versions.get(organization_id, 0):
+            # ответ собран до обновления отчётов организации
+            return False
+        compressed = zlib.compress(body, settings.REPORT_HOT_CACHE_COMPRESS_LEVEL)
+        # прежняя запись заменяется, только если новая прошла допуск
+        victims = self._select_victims(key, len(compressed))
+        if victims is None:
+            self.rejected += 1
+            return False
+        self._delete(key)
+        for victim in victims:
+            self._delete(victim)
+            self.evictions += 1
+        self._data[key] = (time.monotonic() + ttl, organization_id, version, compressed)
+        self._keys_by_organization.setdefault(organization_id, set()).add(key)
+        self.size += len(compressed)
+        return True
+
+    def invalidate(self, organization_id: int, version: int) -> None:
+        """
+        Удаление ответов организации
+
+        :param organization_id: id организации
+        :param version: Новая версия ответов организации
+        """
+        if version > self._versions.get(organization_id, 0):
+            self._versions.set(organization_id, version)
+        for key in list(self._keys_by_organization.get(organization_id, ())):
+            if self._data[key][2] < version:
+                self._delete(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._keys_by_organization.clear()
+        self.size = 0
+
+    def _select_victims(self, key: Hashable, size: int) -> Optional[List[Hashable]]:
+        """
+        Записи, которые нужно вытеснить (None - новая запись не принимается).
+        Место прежней записи с этим ключом считается освобождённым
+        """
+        if size > self.max_bytes:
+            return None
+        victims = []
+        current = self._data.get(key)
+        freed = len(current[3]) if current is not None else 0
+        now = time.monotonic()
+        frequency = self._sketch.estimate(key)
+        for victim, (expires_at, _, _, compressed) in self._data.items():
+            if self.size - freed + size <= self.max_bytes:
+                break
+            if victim == key:
+                continue
+            if expires_at > now and self._sketch.estimate(victim) >= frequency:
+                return None
+            victims.append(victim)
+            freed += len(compressed)
+        return victims
+
+    def _delete(self, key: Hashable) -> None:
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        self.size -= len(item[3])
+        keys = self._keys_by_organization.get(item[1])
+        if keys is not None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del self._keys_by_organization[item[1]]
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "bytes_served": self.bytes_served,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "invalidations": self.invalidations,
+        }
+
+
+async def listen_response_cache_events(cache: HotResponseCache) -> None:
+    """
+    Фоновая задача: удаление ответов организаций, отчёты которых обновил
+    другой воркер (REDIS_RESPONSE_CACHE_CHANNEL). Запускается в lifespan
+
+    :param cache: Кэш ответов процесса
+    """
+    while True:
+        connection = None
+        try:
+            connection = await asyncio_redis.Connection.create(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+            )
+            subscriber = await connection.start_subscribe()
+            await subscriber.subscribe([settings.REDIS_RESPONSE_CACHE_CHANNEL])
+            # события могли быть пропущены, пока не было подписки
+            cache.clear()
+            while True:
+                reply = await subscriber.next_published()
+                organization_id, version = reply.value.split(":")
+                cache.invalidate(int(organization_id), int(version))
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.error(f"Ошибка подписки на события кэша ответов: {ex}")
+            await asyncio.sleep(1)
+        finally:
+            if connection is not None:
+                connection.close()
+
+
+# ответы /api/v*/report в памяти воркера
+report_hot_cache = HotResponseCache(settings.REPORT_HOT_CACHE_MAX_BYTES)
@@ -0,0 +1,81 @@
+from typing import Any, Dict, Hashable
+from asyncio_redis import Pool
+
+from app.helpers.ttl_cache import TTLCache
+from app.settings import settings
+
+
+class NegativeCache:
+    """
+    Кэш отрицательных ответов БФО (организация не найдена, у организации нет
+    отчётов), чтобы повторные запросы не расходовали лимит запросов к БФО
+
+    Записи хранятся в redis (общие для всех воркеров) на NEGATIVE_CACHE_TTL_SECONDS
+    и, если включено, в памяти процесса на NEGATIVE_CACHE_LOCAL_TTL_SECONDS
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._local = None
+        if settings.NEGATIVE_CACHE_LOCAL_ENABLED:
+            self._local = TTLCache(
+                settings.NEGATIVE_CACHE_LOCAL_SIZE,
+                settings.NEGATIVE_CACHE_LOCAL_TTL_SECONDS,
+            )
+        # счётчики для статистики
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+
+    def get_key(self, key: Hashable) -> str:
+        """Ключ записи в redis"""
+        return f"{settings.REDIS_NEGATIVE_CACHE_KEY}:{self.name}:{key}"
+
+    async def contains(self, redis: Pool, key: Hashable) -> bool:
+        """
+        Есть ли отрицательный ответ для ключа
+
+        :param redis: Подключение к redis
+        :param key: ИНН или id организации
+
+        :return: Найдена ли запись
+        """
+        if self._local is not None and self._local.get(key) is not None:
+            self.hits += 1
+            self.local_hits += 1
+            return True
+        if await redis.get(self.get_key(key)) is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        if self._local is not None:
+            self._local.set(key, True)
+        return True
+
+    async def add(self, redis: Pool, key: Hashable) -> None:
+        """
+        Сохранение отрицательного ответа
+
+        :param redis: Подключение к redis
+        :param key: ИНН или id организации
+        """
+        await redis.set(
+            self.get_key(key), "1", expire=settings.NEGATIVE_CACHE_TTL_SECONDS
+        )
+        if self._local is not None:
+            self._local.set(key, True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "local_hits": self.local_hits,
+            "misses": self.misses,
+            "local_size": 0 if self._local is None else len(self._local),
+        }
+
+
+# ИНН, по которым БФО не нашёл организацию
+organization_not_found_cache = NegativeCache("organization_not_found")
+# id организаций, у которых в БФО нет отчётов
+organization_no_reports_cache = NegativeCache("no_reports")
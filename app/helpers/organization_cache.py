@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Dict, Optional
+import asyncio_redis
+from asyncio_redis import Pool
+
+from app.helpers.ttl_cache import TTLCache
+from app.logger import logger
+from app.schemas.db.organization import Organization
+from app.settings import settings
+
+
+class OrganizationCache:
+    """
+    Кэш организаций по ИНН в памяти процесса (организация почти не меняется
+    после создания, поэтому запрос к БД в начале каждого запроса не нужен)
+
+    Записи живут ORGANIZATION_CACHE_TTL_SECONDS, размер ограничен
+    ORGANIZATION_CACHE_SIZE (LRU). При ORGANIZATION_CACHE_PUBSUB_ENABLED
+    инвалидация рассылается остальным воркерам через REDIS_ORGANIZATION_CACHE_CHANNEL
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(
+            settings.ORGANIZATION_CACHE_SIZE, settings.ORGANIZATION_CACHE_TTL_SECONDS
+        )
+        # счётчики для статистики
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, inn: str) -> Optional[Organization]:
+        """
+        Организация по ИНН
+
+        :param inn: Строка с ИНН организации
+
+        :return: Модель организации или None
+        """
+        if not settings.ORGANIZATION_CACHE_ENABLED:
+            return None
+        organization = self._cache.get(inn)
+        if organization is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return organization
+
+    def set(self, organization: Organization) -> None:
+        """
+        Сохранение организации
+
+        :param organization: Модель организации
+        """
+        if settings.ORGANIZATION_CACHE_ENABLED:
+            self._cache.set(organization.inn, organization)
+
+    async def invalidate(self, redis: Pool, inn: str) -> None:
+        """
+        Удаление организации из кэша (после изменения записи в БД)
+
+        :param redis: Подключение к redis
+        :param inn: Строка с ИНН организации
+        """
+        self.discard(inn)
+        if settings.ORGANIZATION_CACHE_PUBSUB_ENABLED:
+            await redis.publish(settings.REDIS_ORGANIZATION_CACHE_CHANNEL, inn)
+
+    def discard(self, inn: str) -> None:
+        """Удаление организации только из кэша текущего воркера"""
+        self._cache.delete(inn)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "size": len(self._cache),
+        }
+
+
+async def listen_organization_cache_events(cache: OrganizationCache) -> None:
+    """
+    Фоновая задача: удаление организаций, изменённых другим воркером
+    (REDIS_ORGANIZATION_CACHE_CHANNEL). Запускается в lifespan
+
+    :param cache: Кэш организаций процесса
+    """
+    while True:
+        connection = None
+        try:
+            connection = await asyncio_redis.Connection.create(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+            )
+            subscriber = await connection.start_subscribe()
+            await subscriber.subscribe([settings.REDIS_ORGANIZATION_CACHE_CHANNEL])
+            # события могли быть пропущены, пока не было подписки
+            cache.clear()
+            while True:
+                reply = await subscriber.next_published()
+                cache.discard(reply.value)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.error(f"Ошибка подписки на события кэша организаций: {ex}")
+            await asyncio.sleep(1)
+        finally:
+            if connection is not None:
+                connection.close()
+
+
+# организации по ИНН
+organization_cache = OrganizationCache()
@@ -0,0 +1,145 @@
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from yarl import URL
+
+from app.settings import settings
+
+
+class ProxyState:
+    """
+    Состояние одного прокси (или прямого подключения, url=None)
+
+    У каждого прокси своя корзина токенов в redis, свой таймаут после 429
+    и своя оценка здоровья по задержке и ошибкам
+    """
+
+    # вес нового значения в скользящих средних
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, url: Optional[str]):
+        self.url = url
+        if url is None:
+            self.name = "direct"
+            self.bucket_key = settings.REDIS_BFO_BUCKET_KEY
+            self.rate_key = settings.REDIS_BFO_RATE_KEY
+        else:
+            # имя без логина и пароля - для ключей redis и статистики
+            parsed = URL(url)
+            self.name = f"{parsed.host}:{parsed.port}"
+            self.bucket_key = f"{settings.REDIS_BFO_BUCKET_KEY}:{self.name}"
+            self.rate_key = f"{settings.REDIS_BFO_RATE_KEY}:{self.name}"
+        self.blocked_until = 0.0
+        self.ejected_until = 0.0
+        self.consecutive_errors = 0
+        self.latency_ewma = 0.0
+        self.error_ewma = 0.0
+        # счётчики для статистики
+        self.requests = 0
+        self.successes = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.ejections = 0
+
+    @property
+    def score(self) -> float:
+        """Оценка здоровья прокси (больше - лучше)"""
+        return max(0.01, 1 - self.error_ewma) / (1 + self.latency_ewma)
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.blocked_until and now >= self.ejected_until
+
+    def on_success(self, latency: float) -> None:
+        """Успешный ответ от БФО"""
+        self.successes += 1
+        self.consecutive_errors = 0
+        self.latency_ewma += self.EWMA_ALPHA * (latency - self.latency_ewma)
+        self.error_ewma -= self.EWMA_ALPHA * self.error_ewma
+
+    def on_error(self) -> None:
+        """Ошибка соединения, таймаут или 5xx (после нескольких подряд - исключение из пула)"""
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.error_ewma += self.EWMA_ALPHA * (1 - self.error_ewma)
+        if self.url is not None and self.consecutive_errors >= settings.PROXY_EJECT_ERRORS:
+            self.ejections += 1
+            self.ejected_until = time.time() + settings.PROXY_EJECT_SECONDS
+            # после возвращения в пул прокси получит ещё несколько попыток
+            self.consecutive_errors = 0
+
+    def on_rate_limited(self, seconds: float) -> None:
+        """БФО ответил 429 через этот прокси"""
+        self.rate_limited += 1
+        if self.url is not None:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "name": self.name,
+            "available": self.is_available(now),
+            "blocked_seconds_left": max(0, math.ceil(self.blocked_until - now)),
+            "ejected_seconds_left": max(0, math.ceil(self.ejected_until - now)),
+            "score": round(self.score, 4),
+            "latency_ewma": round(self.latency_ewma, 4),
+            "requests": self.requests,
+            "successes": self.successes,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "ejections": self.ejections,
+        }
+
+
+class ProxyPool:
+    """Выбор прокси для запроса к БФО с учётом здоровья и таймаутов"""
+
+    def __init__(self, urls: List[str]):
+        self.proxies = [ProxyState(url) for url in urls] or [ProxyState(None)]
+
+    def select(self, exclude: Optional[ProxyState] = None) -> ProxyState:
+        """
+        Выбор прокси: случайный среди доступных с весом по оценке здоровья
+
+        Если все прокси исключены из-за ошибок, берётся тот, что вернётся
+        в пул раньше остальных. Если все прокси получили 429 - ответ 429
+
+        :param exclude: Прокси, который по возможности не выбирать (для hedging)
+
+        :return: Состояние выбранного прокси
+        """
+        now = time.time()
+        available = [proxy for proxy in self.proxies if proxy.is_available(now)]
+        if len(available) == 0:
+            not_blocked = [proxy for proxy in self.proxies if now >= proxy.blocked_until]
+            if len(not_blocked) == 0:
+                retry_after = max(
+                    1, math.ceil(min(proxy.blocked_until for proxy in self.proxies) - now)
+                )
+                raise HTTPException(
+                    status_code=429,
+                    detail={
+                        "message": f"Слишком много запросов к БФО через все прокси (таймаут {retry_after} секунд)"
+                    },
+                    headers={"Retry-After": str(retry_after)},
+                )
+            available = [min(not_blocked, key=lambda proxy: proxy.ejected_until)]
+        # если других прокси нет, запрос пойдёт через тот же прокси (по другому соединению)
+        available = [proxy for proxy in available if proxy is not exclude] or available
+        proxy = random.choices(
+            available, weights=[proxy.score for proxy in available]
+        )[0]
+        proxy.requests += 1
+        return proxy
+
+    def has_available(self) -> bool:
+        """Есть ли прокси без таймаута и не исключённые из пула"""
+        now = time.time()
+        return any(proxy.is_available(now) for proxy in self.proxies)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [proxy.stats() for proxy in self.proxies]
+
+
+bfo_proxy_pool = ProxyPool(settings.proxy_urls)
@@ -1,22 +1,128 @@
+import asyncio
+import hashlib
+import math
 import time
-from typing import Optional
+from typing import Any, List, Optional, Set
 from asyncio_redis import Pool
+from asyncio_redis.exceptions import ScriptKilledError
 
 # from app.logger import logger
+from app.schemas.redis import BfoRateLimitState
 from app.settings import settings
 
+# sha1 lua скриптов, уже загруженных в redis этим процессом
+_loaded_scripts: Set[str] = set()
 
-async def create_bfo_timeout_flag(redis: Pool) -> None:
+# Token bucket: пополнение корзины по текущей скорости (rate токенов в секунду,
+# не больше burst) и списание ARGV[3] токенов. Время берётся из redis, чтобы
+# не зависеть от расхождения часов воркеров
+TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(redis.call("get", KEYS[2]) or ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = redis.call("time")
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local state = redis.call("hmget", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now_ms
+tokens = math.min(burst, tokens + math.max(0, now_ms - ts) * rate / 1000)
+local allowed = 0
+local wait_ms = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait_ms = math.ceil((cost - tokens) * 1000 / rate)
+end
+redis.call("hset", KEYS[1], "tokens", tostring(tokens), "ts", now_ms)
+redis.call("pexpire", KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return {allowed, wait_ms, tostring(tokens), tostring(rate)}
+"""
+
+# AIMD: мультипликативное уменьшение скорости после 429 и аддитивное
+# увеличение после успешного запроса
+ADJUST_RATE_SCRIPT = """
+local rate = tonumber(redis.call("get", KEYS[1]) or ARGV[2])
+if ARGV[1] == "decrease" then
+    rate = math.max(tonumber(ARGV[3]), rate * tonumber(ARGV[4]))
+else
+    rate = math.min(tonumber(ARGV[2]), rate + tonumber(ARGV[5]))
+end
+redis.call("set", KEYS[1], tostring(rate))
+return tostring(rate)
+"""
+
+# Захват блокировки обновления: выдаёт монотонно растущий токен (fencing token)
+# и ставит его значением ключа блокировки, если ключ свободен
+ACQUIRE_LOCK_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 1 then
+    return nil
+end
+local token = redis.call("incr", KEYS[2])
+redis.call("set", KEYS[1], token, "PX", ARGV[1])
+return token
+"""
+
+# Проверка, что блокировка принадлежит владельцу токена
+CHECK_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return 1
+end
+return 0
+"""
+
+# Снятие блокировки только её владельцем (по токену)
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+async def run_script(
+    redis: Pool, script: str, keys: List[str], args: List[str]
+) -> Any:
     """
-    Создание временного флага, обозначающего таймаут запросов к БФО
+    Выполнение lua скрипта через EVALSHA
+
+    Скрипт загружается при первом вызове и повторно, если redis потерял кэш
+    скриптов (например, после перезапуска)
 
     :param redis: Подключение к redis
+    :param script: Текст lua скрипта
+    :param keys: Ключи скрипта
+    :param args: Аргументы скрипта
+
+    :return: Результат скрипта
     """
+    sha = hashlib.sha1(script.encode("utf-8")).hexdigest()
+    if sha not in _loaded_scripts:
+        await redis.script_load(script)
+        _loaded_scripts.add(sha)
+    try:
+        reply = await redis.evalsha(sha, keys, args)
+    except ScriptKilledError:
+        # asyncio_redis не различает ошибки EVALSHA, поэтому на любую ошибку
+        # загружаем скрипт заново и повторяем вызов один раз
+        await redis.script_load(script)
+        reply = await redis.evalsha(sha, keys, args)
+    return await reply.return_value()
+
+
+async def create_bfo_timeout_flag(redis: Pool, seconds: Optional[int] = None) -> None:
+    """
+    Создание временного флага, обозначающего таймаут запросов к БФО,
+    и оповещение остальных воркеров (REDIS_BFO_TIMEOUT_CHANNEL)
+
+    :param redis: Подключение к redis
+    :param seconds: Длительность таймаута (по умолчанию REDIS_BFO_TIMEOUT_SECONDS)
+    """
+    if seconds is None:
+        seconds = settings.REDIS_BFO_TIMEOUT_SECONDS
     timestamp = str(int(time.time()))
-    await redis.set(settings.REDIS_BFO_TIMEOUT_KEY, timestamp)
-    await redis.expire(
-        settings.REDIS_BFO_TIMEOUT_KEY, settings.REDIS_BFO_TIMEOUT_SECONDS
-    )
+    await redis.set(settings.REDIS_BFO_TIMEOUT_KEY, timestamp, expire=seconds)
+    await redis.publish(settings.REDIS_BFO_TIMEOUT_CHANNEL, str(seconds))
 
 
 async def bfo_timeout_left(redis: Pool) -> Optional[int]:
@@ -27,7 +133,151 @@ async def bfo_timeout_left(redis: Pool) -> Optional[int]:
 
     :return: Оставшеесяя количество секунд или None(таймаута нет)
     """
-    value = await redis.get(settings.REDIS_BFO_TIMEOUT_KEY)
-    if value is None:
+    milliseconds = await redis.pttl(settings.REDIS_BFO_TIMEOUT_KEY)
+    if milliseconds < 0:
         return None
-    return settings.REDIS_BFO_TIMEOUT_SECONDS - (int(time.time()) - int(value))
+    return math.ceil(milliseconds / 1000)
+
+
+async def take_bfo_token(
+    redis: Pool,
+    cost: int = 1,
+    bucket_key: Optional[str] = None,
+    rate_key: Optional[str] = None,
+) -> BfoRateLimitState:
+    """
+    Списание токена из общей корзины запросов к БФО
+
+    :param redis: Подключение к redis
+    :param cost: Количество токенов (0 - только узнать состояние корзины)
+    :param bucket_key: Ключ корзины (у каждого прокси своя, по умолчанию REDIS_BFO_BUCKET_KEY)
+    :param rate_key: Ключ скорости пополнения (по умолчанию REDIS_BFO_RATE_KEY)
+
+    :return: Состояние лимита (allowed=False - токенов нет, нужно подождать wait_seconds)
+    """
+    allowed, wait_ms, tokens, rate = await run_script(
+        redis,
+        TAKE_TOKEN_SCRIPT,
+        [
+            bucket_key or settings.REDIS_BFO_BUCKET_KEY,
+            rate_key or settings.REDIS_BFO_RATE_KEY,
+        ],
+        [
+            str(settings.BFO_RATE_LIMIT),
+            str(settings.BFO_RATE_LIMIT_BURST),
+            str(cost),
+        ],
+    )
+    return BfoRateLimitState(
+        allowed=bool(allowed),
+        wait_seconds=wait_ms / 1000,
+        tokens=float(tokens),
+        rate=float(rate),
+        burst=settings.BFO_RATE_LIMIT_BURST,
+    )
+
+
+async def adjust_bfo_rate(
+    redis: Pool, decrease: bool, rate_key: Optional[str] = None
+) -> float:
+    """
+    Изменение скорости пополнения корзины запросов к БФО (AIMD)
+
+    :param redis: Подключение к redis
+    :param decrease: True - уменьшить после 429, False - увеличить после успеха
+    :param rate_key: Ключ скорости пополнения (по умолчанию REDIS_BFO_RATE_KEY)
+
+    :return: Новая скорость (токенов в секунду)
+    """
+    rate = await run_script(
+        redis,
+        ADJUST_RATE_SCRIPT,
+        [rate_key or settings.REDIS_BFO_RATE_KEY],
+        [
+            "decrease" if decrease else "increase",
+            str(settings.BFO_RATE_LIMIT),
+            str(settings.BFO_RATE_LIMIT_MIN),
+            str(settings.BFO_RATE_LIMIT_DECREASE_FACTOR),
+            str(settings.BFO_RATE_LIMIT_INCREASE_STEP),
+        ],
+    )
+    return float(rate)
+
+
+def get_refresh_lock_key(organization_id: int) -> str:
+    """Ключ блокировки обновления отчётов организации"""
+    return f"{settings.REDIS_REFRESH_LOCK_KEY}:{organization_id}"
+
+
+async def acquire_refresh_lock(redis: Pool, organization_id: int) -> Optional[int]:
+    """
+    Захват блокировки обновления отчётов организации (общей для всех воркеров)
+
+    Блокировка снимается автоматически через REDIS_REFRESH_LOCK_TTL_SECONDS,
+    если владелец не успел снять её сам
+
+    :param redis: Подключение к redis
+    :param organization_id: id организации
+
+    :return: Токен владельца блокировки или None(блокировка занята)
+    """
+    return await run_script(
+        redis,
+        ACQUIRE_LOCK_SCRIPT,
+        [get_refresh_lock_key(organization_id), settings.REDIS_REFRESH_LOCK_FENCING_KEY],
+        [str(settings.REDIS_REFRESH_LOCK_TTL_SECONDS * 1000)],
+    )
+
+
+async def is_refresh_lock_owner(redis: Pool, organization_id: int, token: int) -> bool:
+    """
+    Проверка, что блокировка всё ещё принадлежит владельцу токена
+    (не истекла и не захвачена другим воркером)
+
+    :param redis: Подключение к redis
+    :param organization_id: id организации
+    :param token: Токен, полученный при захвате блокировки
+
+    :return: Владеет ли токен блокировкой
+    """
+    result = await run_script(
+        redis,
+        CHECK_LOCK_SCRIPT,
+        [get_refresh_lock_key(organization_id)],
+        [str(token)],
+    )
+    return bool(result)
+
+
+async def release_refresh_lock(redis: Pool, organization_id: int, token: int) -> None:
+    """
+    Снятие блокировки обновления (только если она принадлежит владельцу токена)
+
+    :param redis: Подключение к redis
+    :param organization_id: id организации
+    :param token: Токен, полученный при захвате блокировки
+    """
+    await run_script(
+        redis,
+        RELEASE_LOCK_SCRIPT,
+        [get_refresh_lock_key(organization_id)],
+        [str(token)],
+    )
+
+
+async def wait_refresh_lock_released(redis: Pool, organization_id: int) -> bool:
+    """
+    Ожидание снятия блокировки обновления другим воркером
+
+    :param redis: Подключение к redis
+    :param organization_id: id организации
+
+    :return: Была ли блокировка снята за REDIS_REFRESH_LOCK_WAIT_SECONDS
+    """
+    key = get_refresh_lock_key(organization_id)
+    deadline = time.monotonic() + settings.REDIS_REFRESH_LOCK_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        if await redis.get(key) is None:
+            return True
+        await asyncio.sleep(settings.REDIS_REFRESH_LOCK_POLL_SECONDS)
+    return False
@@ -0,0 +1,175 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from asyncio_redis import Pool
+
+from app.helpers.redis import run_script
+from app.schemas.redis import CachedReportResponse
+from app.settings import settings
+
+# Чтение закэшированного ответа: значение ключа - "<id организации>:<версия>:<тело>",
+# ответ (с оставшимся временем жизни) возвращается, только если версия совпадает
+# с текущей версией организации
+GET_RESPONSE_SCRIPT = """
+local value = redis.call("get", KEYS[1])
+if not value then
+    return nil
+end
+local organization_id, version, body = string.match(value, "^(%d+):(%d+):(.*)$")
+if not organization_id then
+    return nil
+end
+local current = redis.call("get", ARGV[1] .. organization_id) or "0"
+if current ~= version then
+    return nil
+end
+return {organization_id, version, redis.call("pttl", KEYS[1]), body}
+"""
+
+
+def response_ttl_seconds(checked_at: Optional[datetime] = None) -> float:
+    """
+    Сколько ещё ответ будет актуален (пока отчёты не старше REPORT_AVAILABLE_DAYS)
+
+    :param checked_at: Когда проверялся самый старый отчёт ответа (None - сейчас)
+
+    :return: Время жизни ответа в кэше (сек)
+    """
+    ttl = settings.REPORT_AVAILABLE_DAYS * 24 * 60 * 60
+    if checked_at is not None:
+        ttl -= (datetime.now(timezone.utc) - checked_at).total_seconds()
+    return ttl
+
+
+class ResponseCache:
+    """
+    Общий для всех воркеров кэш сериализованных ответов GetReportResponse в redis
+
+    Ключ ответа - версия API, ИНН и нормализованный term. Запись действительна,
+    пока не изменилась версия организации (увеличивается после записи отчётов
+    и организации в БД) и не истёк срок актуальности отчётов REPORT_AVAILABLE_DAYS
+    """
+
+    def __init__(self):
+        # счётчики для статистики
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+
+    @staticmethod
+    def get_key(api: str, inn: str, periods: Optional[List[int]]) -> str:
+        """Ключ ответа в redis"""
+        term = "" if periods is None else ",".join(map(str, sorted(set(periods))))
+        return f"{settings.REDIS_RESPONSE_CACHE_KEY}:{api}:{inn}:{term}"
+
+    @staticmethod
+    def get_version_key(organization_id: Optional[int] = None) -> str:
+        """Ключ версии ответов организации (без id - префикс ключей версий)"""
+        prefix = f"{settings.REDIS_RESPONSE_CACHE_KEY}:version:"
+        return prefix if organization_id is None else f"{prefix}{organization_id}"
+
+    async def get(
+        self, redis: Pool, api: str, inn: str, periods: Optional[List[int]]
+    ) -> Optional[CachedReportResponse]:
+        """
+        Поиск ответа в кэше
+
+        :param redis: Подключение к redis
+        :param api: Версия API (v1, v2)
+        :param inn: ИНН организации
+        :param periods: Список годов (None - последний год)
+
+        :return: Ответ или None
+        """
+        reply = await run_script(
+            redis,
+            GET_RESPONSE_SCRIPT,
+            [self.get_key(api, inn, periods)],
+            [self.get_version_key()],
+        )
+        if reply is None:
+            self.misses += 1
+            return None
+        organization_id, version, pttl, body = reply
+        self.hits += 1
+        self.bytes_served += len(body.encode("utf-8"))
+        return CachedReportResponse(
+            organization_id=int(organization_id),
+            version=int(version),
+            ttl_seconds=int(pttl) / 1000,
+            body=body,
+        )
+
+    async def get_version(self, redis: Pool, organization_id: int) -> int:
+        """
+        Текущая версия ответов организации (читается до чтения отчётов из БД)
+
+        :param redis: Подключение к redis
+        :param organization_id: id организации
+
+        :return: Версия
+        """
+        version = await redis.get(self.get_version_key(organization_id))
+        return 0 if version is None else int(version)
+
+    async def set(
+        self,
+        redis: Pool,
+        api: str,
+        inn: str,
+        periods: Optional[List[int]],
+        organization_id: int,
+        version: int,
+        body: bytes,
+        checked_at: Optional[datetime] = None,
+    ) -> None:
+        """
+        Сохранение ответа в кэш
+
+        :param redis: Подключение к redis
+        :param api: Версия API (v1, v2)
+        :param inn: ИНН организации
+        :param periods: Список годов (None - последний год)
+        :param organization_id: id организации
+        :param version: Версия, прочитанная до чтения отчётов из БД
+        :param body: Тело ответа (JSON в UTF-8)
+        :param checked_at: Когда проверялся самый старый отчёт ответа (None - сейчас)
+        """
+        expire = int(response_ttl_seconds(checked_at))
+        if expire <= 0:
+            return
+        await redis.set(
+            self.get_key(api, inn, periods),
+            f"{organization_id}:{version}:{body.decode('utf-8')}",
+            expire=expire,
+        )
+
+    async def invalidate(self, redis: Pool, organization_id: int) -> int:
+        """
+        Инвалидация ответов организации (после фиксации изменений в БД)
+
+        Новая версия публикуется в REDIS_RESPONSE_CACHE_CHANNEL для кэшей
+        ответов в памяти воркеров
+
+        :param redis: Подключение к redis
+        :param organization_id: id организации
+
+        :return: Новая версия ответов организации
+        """
+        version = await redis.incr(self.get_version_key(organization_id))
+        await redis.publish(
+            settings.REDIS_RESPONSE_CACHE_CHANNEL, f"{organization_id}:{version}"
+        )
+        return version
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "bytes_served": self.bytes_served,
+        }
+
+
+# ответы /api/v*/report
+report_response_cache = ResponseCache()
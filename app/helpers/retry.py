@@ -0,0 +1,69 @@
+import random
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Deque, Optional
+
+from app.settings import settings
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[int]:
+    """
+    Разбор заголовка Retry-After (секунды или HTTP дата)
+
+    :param value: Значение заголовка
+
+    :return: Количество секунд или None(заголовка нет или он некорректный)
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0, int((retry_at - datetime.now(timezone.utc)).total_seconds()))
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Задержка перед повторным запросом: экспоненциальная с полным джиттером
+
+    :param attempt: Номер повтора (с 0)
+
+    :return: Задержка в секундах
+    """
+    max_delay = min(
+        settings.BFO_RETRY_MAX_DELAY, settings.BFO_RETRY_BASE_DELAY * 2**attempt
+    )
+    return random.uniform(0, max_delay)
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов (для задержки hedging)"""
+
+    def __init__(self, size: int = 200):
+        self._latencies: Deque[float] = deque(maxlen=size)
+
+    def add(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Квантиль задержки
+
+        :param q: Квантиль (0..1)
+
+        :return: Задержка в секундах или None(замеров нет)
+        """
+        if len(self._latencies) == 0:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+bfo_latency_tracker = LatencyTracker()
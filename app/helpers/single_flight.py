@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Объединение одновременных вызовов с одинаковым ключом (в рамках процесса)
+
+    Первый вызов с ключом выполняет функцию, остальные ждут его результат
+    (или ошибку) вместо того, чтобы повторять ту же работу
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        # счётчики для статистики
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(
+        self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs
+    ) -> Any:
+        """
+        Выполнить функцию или дождаться результата уже выполняющегося вызова
+
+        :param key: Ключ, по которому объединяются вызовы
+        :param func: Асинхронная функция
+        :param args: Аргументы функции
+        :param kwargs: Именованные аргументы функции
+
+        :return: Результат функции
+        """
+        self.calls += 1
+        while key in self._in_flight:
+            future = self._in_flight[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # отменён сам ожидающий запрос
+                    raise
+                # ведущий запрос отменён (клиент отключился), пробуем сами
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as ex:
+            future.set_exception(ex)
+            # ошибка могла никому не понадобиться, помечаем её как полученную
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика объединения вызовов"""
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
+
+
+# создание организации по ИНН (поиск в БФО + запись в БД)
+organization_single_flight = SingleFlight("organization")
+# обновление отчётов организации (запрос в БФО + запись в БД), ключ - id организации
+refresh_single_flight = SingleFlight("refresh")
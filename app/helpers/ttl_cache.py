@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Кэш в памяти процесса с ограничением размера (LRU) и временем жизни записей
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Значение по ключу
+
+        :param key: Ключ
+        :param default: Значение, если записи нет или она устарела
+
+        :return: Значение из кэша или default
+        """
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Сохранение значения (самая давно использованная запись вытесняется)
+
+        :param key: Ключ
+        :param value: Значение
+        :param ttl: Время жизни записи (по умолчанию ttl кэша)
+        """
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
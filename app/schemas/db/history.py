@@ -5,6 +5,17 @@ from pydantic import BaseModel
 from app.db.history.models import HistoryModel
 
 
+class HistoryRecord(BaseModel):
+    """Запись истории запросов для сохранения в БД (ответ - строка JSON)"""
+
+    request: Dict[str, Any]
+    status_code: int
+    response: str
+    started_at: datetime
+    finished_at: datetime
+    params: Optional[Dict[str, Any]] = None
+
+
 class History(BaseModel):
     """Схема истории запросов из БД"""
 
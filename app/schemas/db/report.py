@@ -1,6 +1,7 @@
 from typing import Optional, Dict, Any
 from datetime import datetime, date
 from pydantic import BaseModel
+from sqlalchemy import Row
 
 from app.db.report.models import ReportModel
 
@@ -14,9 +15,11 @@ class Report(BaseModel):
     present_date: date
     created_at: datetime
     updated_at: datetime
+    checked_at: datetime
     organization_sheet: Optional[Dict[str, Any]]
     balance_sheet: Optional[Dict[str, Any]]
     financial_sheet: Optional[Dict[str, Any]]
+    content_hash: Optional[str] = None
 
     @classmethod
     def from_orm_not_none(cls, report: ReportModel) -> "Report":
@@ -27,9 +30,11 @@ class Report(BaseModel):
             present_date=report.present_date,
             created_at=report.created_at,
             updated_at=report.updated_at,
+            checked_at=report.checked_at,
             organization_sheet=report.organization_sheet,
             balance_sheet=report.balance_sheet,
             financial_sheet=report.financial_sheet,
+            content_hash=report.content_hash,
         )
 
     @classmethod
@@ -37,3 +42,27 @@ class Report(BaseModel):
         if report is None:
             return None
         return cls.from_orm_not_none(report)
+
+
+class ReportFreshness(BaseModel):
+    """Дата проверки отчёта из БД (без листов отчёта)"""
+
+    report_year: int
+    present_date: date
+    updated_at: datetime
+    checked_at: datetime
+
+    @classmethod
+    def from_row_not_none(cls, row: Row) -> "ReportFreshness":
+        return cls(
+            report_year=row.report_year,
+            present_date=row.present_date,
+            updated_at=row.updated_at,
+            checked_at=row.checked_at,
+        )
+
+    @classmethod
+    def from_row(cls, row: Optional[Row]) -> Optional["ReportFreshness"]:
+        if row is None:
+            return None
+        return cls.from_row_not_none(row)
@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+
+
+class BfoRateLimitState(BaseModel):
+    """Состояние общего (для всех воркеров) лимита запросов к БФО"""
+
+    allowed: bool
+    wait_seconds: float
+    tokens: float
+    rate: float
+    burst: int
+
+
+class CachedReportResponse(BaseModel):
+    """Ответ с отчётами из кэша в redis"""
+
+    organization_id: int
+    version: int
+    ttl_seconds: float
+    body: str
@@ -2,6 +2,8 @@ from typing import Any, Dict, List, Optional
 from datetime import date, datetime
 from pydantic import BaseModel
 
+from app.schemas.redis import BfoRateLimitState
+
 
 class CorrectionForResponse(BaseModel):
     """Информация из отчёта БФО"""
@@ -36,3 +38,125 @@ class GetReportResponse(BaseModel):
     building: Optional[str] = None
     office: Optional[str] = None
     periods: List[ReportForResponse]
+
+
+# поля GetReportResponse, которые берутся из organizations.info
+GET_REPORT_RESPONSE_INFO_FIELDS = [
+    field for field in GetReportResponse.model_fields if field not in ("inn", "periods")
+]
+
+
+class SingleFlightStats(BaseModel):
+    """Статистика объединения одновременных вызовов"""
+
+    name: str
+    calls: int
+    coalesced: int
+    in_flight: int
+
+
+class CircuitBreakerStats(BaseModel):
+    """Состояние circuit breaker запросов к БФО (в текущем воркере)"""
+
+    state: str
+    timeout_left: Optional[int] = None
+    redis_reads: int
+    rejected: int
+
+
+class ProxyStats(BaseModel):
+    """Состояние прокси (в текущем воркере) и его корзины запросов"""
+
+    name: str
+    available: bool
+    blocked_seconds_left: int
+    ejected_seconds_left: int
+    score: float
+    latency_ewma: float
+    requests: int
+    successes: int
+    errors: int
+    rate_limited: int
+    ejections: int
+    rate_limit: BfoRateLimitState
+
+
+class NegativeCacheStats(BaseModel):
+    """Статистика кэша отрицательных ответов БФО (в текущем воркере)"""
+
+    name: str
+    hits: int
+    local_hits: int
+    misses: int
+    local_size: int
+
+
+class ResponseCacheStats(BaseModel):
+    """Статистика кэша ответов с отчётами (в текущем воркере)"""
+
+    hits: int
+    misses: int
+    hit_ratio: float
+    bytes_served: int
+
+
+class HotCacheStats(BaseModel):
+    """Статистика кэша ответов с отчётами в памяти воркера"""
+
+    entries: int
+    size_bytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+    hit_ratio: float
+    bytes_served: int
+    evictions: int
+    rejected: int
+    invalidations: int
+
+
+class OrganizationCacheStats(BaseModel):
+    """Статистика кэша организаций по ИНН в памяти воркера"""
+
+    hits: int
+    misses: int
+    hit_ratio: float
+    size: int
+
+
+class DbPoolStatsResponse(BaseModel):
+    """Статистика соединений пула БД (в текущем воркере)"""
+
+    checkouts: int
+    checkins: int
+    checked_out: int
+
+
+class HistoryWriterStatsResponse(BaseModel):
+    """Статистика фоновой записи истории запросов (в текущем воркере)"""
+
+    queue_size: int
+    max_queue_size: int
+    overflow_policy: str
+    written: int
+    dropped: int
+    failed: int
+    batches: int
+
+
+class ReportCacheStatsResponse(BaseModel):
+    """Состояние кэшей ответов с отчётами"""
+
+    hot_cache: HotCacheStats
+    response_cache: ResponseCacheStats
+    organization_cache: OrganizationCacheStats
+
+
+class BfoStatsResponse(BaseModel):
+    """Состояние лимитов запросов к БФО"""
+
+    circuit_breaker: CircuitBreakerStats
+    proxies: List[ProxyStats]
+    single_flight: List[SingleFlightStats]
+    negative_cache: List[NegativeCacheStats]
+    response_cache: ResponseCacheStats
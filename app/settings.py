@@ -1,8 +1,15 @@
 """Application settings."""
 
-from typing import Optional, Set
+from typing import List, Optional, Set
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# максимум параметров в одном запросе asyncpg
+ASYNCPG_MAX_QUERY_PARAMETERS = 32767
+# параметров на строку в INSERT ... ON CONFLICT отчётов (organization_id,
+# report_year, present_date, content_hash и три листа отчёта)
+REPORT_UPSERT_ROW_PARAMETERS = 7
+
 
 class AppSettings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -14,12 +21,53 @@ class AppSettings(BaseSettings):
     # APP
     DEBUG: bool
     BFO_URL: str
+    # один прокси или несколько через запятую
     PROXY_URL: Optional[str] = None
+    PROXY_EJECT_ERRORS: int = 3
+    PROXY_EJECT_SECONDS: float = 60
     REPORT_AVAILABLE_DAYS: int = 7
+    # корректировок отчётов в одном INSERT ... ON CONFLICT (7 параметров на
+    # строку, не больше 32767 // 7 = 4681)
+    REPORT_UPSERT_CHUNK_SIZE: int = 1000
+    # ответ с отчётами собирается в БД (json_agg) и отдаётся без валидации pydantic
+    REPORT_DB_SERIALIZATION: bool = False
+    # ответ с отчётами сериализуется один раз (pydantic_core.to_json) без моделей Report
+    REPORT_FAST_SERIALIZATION: bool = False
+    # кэш ответов /api/v*/report в redis (инвалидируется при обновлении отчётов)
+    REPORT_RESPONSE_CACHE_ENABLED: bool = False
+    # кэш сжатых ответов /api/v*/report в памяти воркера
+    REPORT_HOT_CACHE_ENABLED: bool = False
+    REPORT_HOT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    REPORT_HOT_CACHE_COMPRESS_LEVEL: int = 1
+    # кэш организаций по ИНН в памяти воркера
+    ORGANIZATION_CACHE_ENABLED: bool = True
+    ORGANIZATION_CACHE_SIZE: int = 10000
+    ORGANIZATION_CACHE_TTL_SECONDS: float = 60 * 60
+    # рассылка инвалидации кэша организаций остальным воркерам
+    ORGANIZATION_CACHE_PUBSUB_ENABLED: bool = False
     REQUEST_LOGGING_MIDDLEWARE_ENDPOINTS: Set[str] = {
         "GET:/api/v1/report",
         "GET:/api/v2/report",
     }
+    # больший ответ сохраняется в history как размер и sha256 тела
+    REQUEST_LOGGING_MAX_BODY_BYTES: int = 1024 * 1024
+    # фоновая запись history пачками
+    REQUEST_HISTORY_QUEUE_SIZE: int = 10000
+    REQUEST_HISTORY_BATCH_SIZE: int = 500
+    REQUEST_HISTORY_FLUSH_SECONDS: float = 1.0
+    # при переполнении очереди: drop_new, drop_oldest или sample
+    REQUEST_HISTORY_OVERFLOW_POLICY: str = "drop_new"
+    # доля принимаемых записей при sample, когда очередь заполнена больше чем наполовину
+    REQUEST_HISTORY_SAMPLE_RATE: float = 0.1
+    REQUEST_HISTORY_SHUTDOWN_TIMEOUT_SECONDS: float = 10
+    # помесячные секции history: создаются заранее, старше срока хранения
+    # отсоединяются (и удаляются при REQUEST_HISTORY_DROP_EXPIRED)
+    REQUEST_HISTORY_PARTITIONS_AHEAD: int = 3
+    REQUEST_HISTORY_RETENTION_MONTHS: int = 12
+    REQUEST_HISTORY_DROP_EXPIRED: bool = True
+    # DETACH блокирует запись в history, ожидание блокировки ограничено
+    REQUEST_HISTORY_DETACH_LOCK_TIMEOUT_MS: int = 2000
+    REQUEST_HISTORY_MAINTENANCE_INTERVAL_SECONDS: float = 6 * 60 * 60
     REQUEST_LOGGING_ALLOWED_FILEDS: Set[str] = {
         "type",
         "asgi",
@@ -34,11 +82,63 @@ class AppSettings(BaseSettings):
         "path_params",
     }
 
+    # BFO HTTP CLIENT
+    BFO_CONNECTION_LIMIT: int = 100
+    BFO_CONNECTION_LIMIT_PER_HOST: int = 20
+    BFO_KEEPALIVE_TIMEOUT: float = 30
+    BFO_DNS_CACHE_TTL: int = 300
+    BFO_TOTAL_TIMEOUT: Optional[float] = 60
+    BFO_CONNECT_TIMEOUT: Optional[float] = 10
+    BFO_SOCK_READ_TIMEOUT: Optional[float] = 30
+
+    # BFO RATE LIMIT (token bucket + AIMD)
+    BFO_RATE_LIMIT: float = 1.0
+    BFO_RATE_LIMIT_MIN: float = 0.05
+    BFO_RATE_LIMIT_BURST: int = 5
+    BFO_RATE_LIMIT_DECREASE_FACTOR: float = 0.5
+    BFO_RATE_LIMIT_INCREASE_STEP: float = 0.01
+    BFO_RATE_LIMIT_MAX_WAIT_SECONDS: float = 5
+
+    # BFO CIRCUIT BREAKER
+    BFO_CIRCUIT_SYNC_SECONDS: float = 30
+
+    # BFO RETRY
+    BFO_RETRY_ATTEMPTS: int = 3
+    BFO_RETRY_BASE_DELAY: float = 0.5
+    BFO_RETRY_MAX_DELAY: float = 5
+    BFO_RETRY_DEADLINE_SECONDS: float = 30
+    BFO_RETRY_STATUSES: Set[int] = {500, 502, 503, 504}
+    # hedging: второй запрос через другой прокси (соединение),
+    # если первый не ответил за p95 задержки
+    BFO_HEDGE_ENABLED: bool = False
+    BFO_HEDGE_QUANTILE: float = 0.95
+    BFO_HEDGE_MIN_DELAY: float = 1
+
+    # NEGATIVE CACHE (организация не найдена / нет отчётов)
+    NEGATIVE_CACHE_TTL_SECONDS: int = 6 * 60 * 60
+    NEGATIVE_CACHE_LOCAL_ENABLED: bool = True
+    NEGATIVE_CACHE_LOCAL_TTL_SECONDS: float = 60
+    NEGATIVE_CACHE_LOCAL_SIZE: int = 10000
+
     # REDIS
     REDIS_HOST: str
     REDIS_PORT: int
+    REDIS_POOL_SIZE: int = 10
+    REDIS_DB: int = 0
     REDIS_BFO_TIMEOUT_KEY: str = "bfo:timeout"
     REDIS_BFO_TIMEOUT_SECONDS: int = 180
+    REDIS_BFO_TIMEOUT_CHANNEL: str = "bfo:timeout:events"
+    REDIS_BFO_BUCKET_KEY: str = "bfo:bucket"
+    REDIS_BFO_RATE_KEY: str = "bfo:rate"
+    REDIS_REFRESH_LOCK_KEY: str = "bfo:refresh:lock"
+    REDIS_REFRESH_LOCK_FENCING_KEY: str = "bfo:refresh:fencing"
+    REDIS_REFRESH_LOCK_TTL_SECONDS: int = 60
+    REDIS_REFRESH_LOCK_WAIT_SECONDS: float = 30
+    REDIS_REFRESH_LOCK_POLL_SECONDS: float = 0.2
+    REDIS_NEGATIVE_CACHE_KEY: str = "bfo:negative"
+    REDIS_RESPONSE_CACHE_KEY: str = "report:response"
+    REDIS_RESPONSE_CACHE_CHANNEL: str = "report:response:events"
+    REDIS_ORGANIZATION_CACHE_CHANNEL: str = "organization:cache:events"
 
     # DB
     SQL_DEBUG: bool
@@ -51,5 +151,31 @@ class AppSettings(BaseSettings):
 
     # DB TEST
     TEST_POSTGRES_DSN: str
+    # проверка планов запросов к reports на синтетических данных (долгая,
+    # включается явно; для проверки на объёме продакшена - TEST_QUERY_PLAN_ROWS=3000000)
+    TEST_QUERY_PLANS_ENABLED: bool = False
+    TEST_QUERY_PLAN_ROWS: int = 30_000
+    TEST_QUERY_PLAN_BUDGET_MS: float = 50
+    # замеры производительности (@pytest.mark.perf), результаты - в свойствах
+    # отчёта pytest (--junitxml)
+    TEST_BENCHMARKS_ENABLED: bool = False
+
+    @field_validator("REPORT_UPSERT_CHUNK_SIZE")
+    @classmethod
+    def check_report_upsert_chunk_size(cls, value: int) -> int:
+        """Пачка корректировок укладывается в лимит параметров запроса asyncpg"""
+        max_chunk_size = ASYNCPG_MAX_QUERY_PARAMETERS // REPORT_UPSERT_ROW_PARAMETERS
+        if not 1 <= value <= max_chunk_size:
+            raise ValueError(
+                f"REPORT_UPSERT_CHUNK_SIZE должен быть от 1 до {max_chunk_size}"
+            )
+        return value
+
+    @property
+    def proxy_urls(self) -> List[str]:
+        """Список прокси из PROXY_URL"""
+        if not self.PROXY_URL:
+            return []
+        return [url.strip() for url in self.PROXY_URL.split(",") if url.strip()]
 
 settings = AppSettings()
@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from typing import AsyncIterator
 import asyncio_redis
@@ -18,6 +19,18 @@ from app.db.sqlalchemy import (
     close_db_connections,
 )
 from app.exceptions import BfoTooManyRequestsException
+from app.helpers.bfo_api import create_bfo_client_session
+from app.helpers.circuit_breaker import (
+    bfo_circuit_breaker,
+    listen_bfo_circuit_events,
+)
+from app.helpers.history_partitions import run_history_partition_maintenance
+from app.helpers.history_writer import create_history_writer
+from app.helpers.hot_cache import listen_response_cache_events, report_hot_cache
+from app.helpers.organization_cache import (
+    listen_organization_cache_events,
+    organization_cache,
+)
 from app.logger import logger
 from app.settings import settings
 
@@ -35,9 +48,33 @@ async def lifespan(fastapi_app: FastAPI) -> AsyncIterator[None]:
     # -- Redis --
 
     redis_pool = await asyncio_redis.Pool.create(
-        host=settings.REDIS_HOST, port=settings.REDIS_PORT, poolsize=1
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        poolsize=settings.REDIS_POOL_SIZE,
     )
     fastapi_app.state.redis = redis_pool
+    # синхронизация таймаута БФО между воркерами
+    await bfo_circuit_breaker.sync(redis_pool)
+    circuit_events_task = asyncio.create_task(
+        listen_bfo_circuit_events(bfo_circuit_breaker)
+    )
+    # инвалидация кэша ответов в памяти после обновлений в других воркерах
+    response_cache_events_task = None
+    if settings.REPORT_HOT_CACHE_ENABLED:
+        response_cache_events_task = asyncio.create_task(
+            listen_response_cache_events(report_hot_cache)
+        )
+    # инвалидация кэша организаций после изменений в других воркерах
+    organization_cache_events_task = None
+    if settings.ORGANIZATION_CACHE_PUBSUB_ENABLED:
+        organization_cache_events_task = asyncio.create_task(
+            listen_organization_cache_events(organization_cache)
+        )
+
+    # -- BFO HTTP client --
+    bfo_session = create_bfo_client_session()
+    fastapi_app.state.bfo_session = bfo_session
 
     # -- Database --
     try:
@@ -46,19 +83,43 @@ async def lifespan(fastapi_app: FastAPI) -> AsyncIterator[None]:
         logger.error(f"Migration error: {ex}")
 
     fastapi_app.state.db_session_factory = await build_db_session_factory()
+    # запись истории запросов пачками
+    history_writer = create_history_writer()
+    history_writer.start(fastapi_app.state.db_session_factory)
+    fastapi_app.state.history_writer = history_writer
+    # помесячные секции history и срок их хранения
+    history_maintenance_task = asyncio.create_task(
+        run_history_partition_maintenance(fastapi_app.state.db_session_factory)
+    )
 
     yield
 
     # Shutdown logic
     logger.info("Отключение приложения")
 
+    # -- BFO HTTP client --
+    try:
+        await bfo_session.close()
+    except Exception as ex:
+        logger.error(f"BFO session close error: {ex}")
+
     # -- Database --
+    history_maintenance_task.cancel()
+    try:
+        await history_writer.stop(settings.REQUEST_HISTORY_SHUTDOWN_TIMEOUT_SECONDS)
+    except Exception as ex:
+        logger.error(f"History writer stop error: {ex}")
     try:
         await close_db_connections()
     except Exception as ex:
         logger.error(f"Database disconnection error: {ex}")
 
     # -- Redis --
+    circuit_events_task.cancel()
+    if response_cache_events_task is not None:
+        response_cache_events_task.cancel()
+    if organization_cache_events_task is not None:
+        organization_cache_events_task.cancel()
     try:
         async with redis_pool:
             await redis_pool.wait_closed()
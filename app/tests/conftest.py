@@ -19,6 +19,7 @@ from sqlalchemy.ext.asyncio import (
 from app.startup import create_application
 from app.settings import settings
 from app.db.sqlalchemy import Base
+from app.helpers.organization_cache import organization_cache
 
 
 AsyncSessionFactory = Callable[..., AsyncSession]
@@ -43,6 +44,18 @@ async def verify_db_connection(engine: AsyncEngine) -> None:
     await connection.close()
 
 
+def pytest_collection_modifyitems(config, items):
+    """Замеры производительности запускаются только при TEST_BENCHMARKS_ENABLED"""
+    if settings.TEST_BENCHMARKS_ENABLED:
+        return
+    skip_perf = pytest.mark.skip(
+        reason="замеры производительности включаются TEST_BENCHMARKS_ENABLED"
+    )
+    for item in items:
+        if "perf" in item.keywords:
+            item.add_marker(skip_perf)
+
+
 @pytest.fixture
 async def engine():
 
@@ -65,6 +78,8 @@ async def db_session(
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
         await conn.commit()
+    # организации с теми же ИНН создаются заново в каждом тесте
+    organization_cache.clear()
 
     # Для тестов используем простой async_sessionmaker вместо async_scoped_session
     # чтобы избежать проблем с event loop
@@ -97,6 +112,8 @@ async def app():
 def mock_redis():
     """Мок для Redis пула."""
     mock_pool = AsyncMock()
+    # ключей в redis нет (кэш отрицательных ответов пуст)
+    mock_pool.get.return_value = None
     return mock_pool
 
 
@@ -132,6 +149,8 @@ async def client(app: FastAPI, db_session: AsyncSession, mock_redis):
     
     app.state.db_session_factory = TestSessionFactory(db_session)
     app.state.redis = mock_redis
+    # Запросы к БФО в тестах мокаются, реальная сессия aiohttp не нужна
+    app.state.bfo_session = AsyncMock()
     
     # Используем ASGITransport для работы с FastAPI приложением
     from httpx import ASGITransport
@@ -139,12 +139,12 @@ async def test_get_report_v1_old_reports_trigger_update(
         finance={"revenue": 200000},
     )
 
-    # Обновляем updated_at на 8 дней назад
+    # Обновляем checked_at на 8 дней назад
     old_date = datetime.now(timezone.utc) - timedelta(days=8)
     await db_session.execute(
         update(ReportModel)
         .where(ReportModel.organization_id == organization.id)
-        .values(updated_at=old_date)
+        .values(checked_at=old_date)
     )
     await db_session.commit()
 
@@ -275,6 +275,225 @@ async def test_get_report_v2_existing_organization_with_periods(
     assert {p["year"] for p in data["periods"]} == {2022, 2023}
 
 
+def percentile(values, quantile):
+    """Квантиль по отсортированной выборке."""
+    values = sorted(values)
+    return values[min(int(len(values) * quantile), len(values) - 1)]
+
+
+@pytest.mark.asyncio
+async def test_get_report_serialization_modes_match(
+    client: httpx.AsyncClient, db_session, monkeypatch
+):
+    """Тест: ответ, собранный в БД и через to_json, совпадает с ответом pydantic."""
+    from app.db.organization.repo import OrganizationRepo
+    from app.db.report.models import ReportModel
+    from app.db.report.repo import ReportRepo
+    from app.settings import settings
+    from sqlalchemy import update
+
+    organization = await OrganizationRepo(db_session).create_organization(
+        12345,
+        "1234567894",
+        {
+            "short_name": "Test Org",
+            "ogrn": "1234567894123",
+            "index": "123123",
+            "not_in_response": "value",
+        },
+    )
+    report_repo = ReportRepo(db_session)
+    for year, month in ((2022, 3), (2023, 3), (2023, 6)):
+        await report_repo.create_report(
+            organization_id=organization.id,
+            year=year,
+            present_date=date(year + 1, month, 30),
+            organization={"name": "Тестовая организация"},
+            balance={"1600": year},
+            finance={"2110": -year},
+        )
+    # updated_at без долей секунды: pydantic их не выводит
+    await db_session.execute(
+        update(ReportModel)
+        .where(ReportModel.report_year == 2022)
+        .values(updated_at=datetime.now(timezone.utc).replace(microsecond=0))
+    )
+    await db_session.commit()
+
+    for url in (
+        "/api/v1/report?inn=1234567894",
+        "/api/v2/report?inn=1234567894&term=2023,2022",
+    ):
+        responses = {}
+        for mode in ("pydantic", "db", "fast"):
+            monkeypatch.setattr(settings, "REPORT_DB_SERIALIZATION", mode == "db")
+            monkeypatch.setattr(settings, "REPORT_FAST_SERIALIZATION", mode == "fast")
+            response = await client.get(url)
+            assert response.status_code == 200
+            responses[mode] = response.json()
+        assert responses["db"] == responses["pydantic"], url
+        assert responses["fast"] == responses["pydantic"], url
+        assert "not_in_response" not in responses["pydantic"]
+    updated_at = [
+        report["updated_at"]
+        for period in responses["db"]["periods"]
+        for report in period["reports"]
+    ]
+    assert all(value.endswith("Z") for value in updated_at)
+
+
+@pytest.mark.perf
+@pytest.mark.asyncio
+async def test_get_report_db_serialization_benchmark(
+    client: httpx.AsyncClient, db_session, monkeypatch, record_property
+):
+    """Сравнение ответа, собранного в БД, с ответом через pydantic."""
+    import time
+    from app.db.organization.repo import OrganizationRepo
+    from app.db.report.repo import ReportRepo
+    from app.settings import settings
+
+    org_repo = OrganizationRepo(db_session)
+    organization = await org_repo.create_organization(
+        12345,
+        "1234567894",
+        {
+            "short_name": "Test Org",
+            "ogrn": "1234567894123",
+            "index": "123123",
+            "city": "Test City",
+            "not_in_response": "value",
+        },
+    )
+    report_repo = ReportRepo(db_session)
+    for year in range(2015, 2025):
+        for month in (3, 6):
+            await report_repo.create_report(
+                organization_id=organization.id,
+                year=year,
+                present_date=date(year + 1, month, 30),
+                organization={"name": "Test Org", "okved": "62.01"},
+                balance={str(code): code * year for code in range(1100, 1700, 10)},
+                finance={str(code): code * year for code in range(2100, 2500, 10)},
+            )
+    await db_session.commit()
+
+    urls = [
+        "/api/v1/report?inn=1234567894",
+        "/api/v1/report?inn=1234567894&term=2014,2016,2018,2020,2022,2024",
+        "/api/v2/report?inn=1234567894",
+        "/api/v2/report?inn=1234567894&term=2016,2020,2024",
+    ]
+    requests = 50
+    for url in urls:
+        responses = {}
+        for mode in ("pydantic", "db", "fast"):
+            monkeypatch.setattr(settings, "REPORT_DB_SERIALIZATION", mode == "db")
+            monkeypatch.setattr(settings, "REPORT_FAST_SERIALIZATION", mode == "fast")
+            latencies, cpu = [], []
+            for _ in range(requests):
+                started, started_cpu = time.perf_counter(), time.process_time()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+                cpu.append(time.process_time() - started_cpu)
+            assert response.status_code == 200
+            responses[mode] = response.json()
+            record_property(
+                f"{url} {mode}",
+                {
+                    "p50_ms": percentile(latencies, 0.5) * 1000,
+                    "p99_ms": percentile(latencies, 0.99) * 1000,
+                    "cpu_ms": sum(cpu) / requests * 1000,
+                },
+            )
+        assert responses["db"] == responses["pydantic"]
+        assert responses["fast"] == responses["pydantic"]
+        assert "not_in_response" not in responses["db"]
+        assert "not_in_response" not in responses["fast"]
+
+
+@pytest.mark.perf
+def test_report_response_serialization_microbenchmark(record_property):
+    """Сериализация ответа крупной организации: через модели pydantic и через to_json."""
+    import json
+    import time
+    from pydantic_core import to_json
+    from app.schemas.db.report import Report
+    from app.schemas.responses import (
+        GET_REPORT_RESPONSE_INFO_FIELDS,
+        GetReportResponse,
+    )
+
+    now = datetime.now(timezone.utc)
+    info = {"short_name": "Test Org", "ogrn": "1234567894123", "index": "123123"}
+    rows = [
+        {
+            "id": year * 10 + correction,
+            "organization_id": 12345,
+            "report_year": year,
+            "present_date": date(year + 1, 3, 31) + timedelta(days=correction),
+            "created_at": now,
+            "updated_at": now,
+            "checked_at": now,
+            "organization_sheet": {"name": "Test Org", "okved": "62.01"},
+            "balance_sheet": {str(code): code * year for code in range(1100, 1700)},
+            "financial_sheet": {str(code): code * year for code in range(2100, 2500)},
+        }
+        for year in range(2000, 2025)
+        for correction in range(3)
+    ]
+    periods = list(range(2000, 2025))
+
+    def pydantic_path() -> bytes:
+        reports = [Report(**row) for row in rows]
+        result = {
+            "inn": "1234567894",
+            "periods": [
+                {
+                    "year": period,
+                    "reports": [r for r in reports if r.report_year == period],
+                }
+                for period in periods
+            ],
+        }
+        result.update(info)
+        return (
+            GetReportResponse.model_validate(result, from_attributes=True)
+            .model_dump_json()
+            .encode()
+        )
+
+    def fast_path() -> bytes:
+        result = {"inn": "1234567894"}
+        for field in GET_REPORT_RESPONSE_INFO_FIELDS:
+            result[field] = info.get(field)
+        result["periods"] = [
+            {
+                "year": period,
+                "reports": [
+                    {
+                        "present_date": row["present_date"],
+                        "updated_at": row["updated_at"],
+                        "organization_sheet": row["organization_sheet"],
+                        "balance_sheet": row["balance_sheet"],
+                        "financial_sheet": row["financial_sheet"],
+                    }
+                    for row in rows
+                    if row["report_year"] == period
+                ],
+            }
+            for period in periods
+        ]
+        return to_json(result)
+
+    assert json.loads(fast_path()) == json.loads(pydantic_path())
+    for name, path in (("pydantic", pydantic_path), ("fast", fast_path)):
+        started = time.perf_counter()
+        for _ in range(20):
+            path()
+        record_property(f"{name}_ms", (time.perf_counter() - started) / 20 * 1000)
+
+
 @pytest.mark.asyncio
 async def test_get_report_v2_missing_periods_trigger_update(
     client: httpx.AsyncClient, db_session, mock_redis
@@ -378,12 +597,12 @@ async def test_get_report_v2_old_reports_trigger_update(
         finance={"revenue": 200000},
     )
 
-    # Обновляем updated_at на 8 дней назад
+    # Обновляем checked_at на 8 дней назад
     old_date = datetime.now(timezone.utc) - timedelta(days=8)
     await db_session.execute(
         update(ReportModel)
         .where(ReportModel.organization_id == organization.id)
-        .values(updated_at=old_date)
+        .values(checked_at=old_date)
     )
     await db_session.commit()
 
@@ -421,6 +640,75 @@ async def test_get_report_v2_old_reports_trigger_update(
     )
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("serialization", ["pydantic", "fast", "db"])
+async def test_get_report_v2_periods_staleness_boundary(
+    client: httpx.AsyncClient, db_session, mock_redis, monkeypatch, serialization
+):
+    """Тест v2: граница актуальности отчёта не зависит от способа сериализации."""
+    from app.db.organization.repo import OrganizationRepo
+    from app.db.report.repo import ReportRepo
+    from app.db.report.models import ReportModel
+    from app.settings import settings
+    from sqlalchemy import update
+
+    monkeypatch.setattr(
+        settings, "REPORT_FAST_SERIALIZATION", serialization == "fast"
+    )
+    monkeypatch.setattr(settings, "REPORT_DB_SERIALIZATION", serialization == "db")
+    organization = await OrganizationRepo(db_session).create_organization(
+        12345,
+        "1234567894",
+        {"short_name": "Test Org", "ogrn": "1234567894123", "index": "123123"},
+    )
+    await ReportRepo(db_session).create_report(
+        organization_id=organization.id,
+        year=2023,
+        present_date=date(2023, 12, 31),
+        organization={"name": "Test Org"},
+        balance={"assets": 500000},
+        finance={"revenue": 200000},
+    )
+
+    # пустой ответ БФО запомнился бы в кэше организаций без отчётов
+    mock_details_result = GetDetailsResult.model_construct(
+        reports=[
+            DetailResult.model_construct(
+                id=1,
+                period=2023,
+                corrections=[
+                    CorrectionResult.model_construct(
+                        id=1,
+                        date_present=date(2023, 12, 31),
+                        requierd_audit=False,
+                        organization_info={"name": "Test Org"},
+                        balance={"assets": 500000},
+                        financial={"revenue": 200000},
+                    )
+                ],
+            )
+        ]
+    )
+    # на полдня моложе срока - отчёт актуален, на полдня старше - обновляется
+    for hours, refreshed in ((-12, False), (12, True)):
+        checked_at = datetime.now(timezone.utc) - timedelta(
+            days=settings.REPORT_AVAILABLE_DAYS, hours=hours
+        )
+        await db_session.execute(
+            update(ReportModel)
+            .where(ReportModel.organization_id == organization.id)
+            .values(checked_at=checked_at)
+        )
+        await db_session.commit()
+        with patch(
+            "app.api.endpoints.report.get_details_by_organization_id",
+            return_value=mock_details_result,
+        ) as mock_get_details:
+            response = await client.get("/api/v2/report?inn=1234567894&term=2023")
+        assert response.status_code == 200
+        assert mock_get_details.called is refreshed, hours
+
+
 @pytest.mark.asyncio
 async def test_get_report_invalid_inn(client: httpx.AsyncClient):
     """Тест валидации ИНН."""
@@ -435,3 +723,210 @@ async def test_get_report_invalid_period(client: httpx.AsyncClient):
     response = await client.get("/api/v1/report?inn=1234567894&term=1800")
 
     assert response.status_code == 422  # Validation error
+
+
+@pytest.mark.asyncio
+async def test_get_report_v2_waits_for_refresh_by_other_worker(
+    client: httpx.AsyncClient, db_session, mock_redis
+):
+    """Тест v2: отчёты обновляет другой воркер, запрос к БФО не делается."""
+    from app.db.organization.repo import OrganizationRepo
+    from app.db.report.repo import ReportRepo
+
+    org_repo = OrganizationRepo(db_session)
+    await org_repo.create_organization(
+        12345,
+        "1234567894",
+        {"short_name": "Test Org", "ogrn": "1234567894123", "index": "123123"},
+    )
+
+    async def refreshed_by_other_worker(redis, organization_id):
+        # другой воркер записал отчёты, пока запрос ждал блокировку
+        await ReportRepo(db_session).create_report(
+            organization_id=organization_id,
+            year=2022,
+            present_date=date(2023, 3, 31),
+            organization={"name": "Test Org"},
+            balance={},
+            finance={},
+        )
+        return True
+
+    with patch(
+        "app.api.endpoints.report.acquire_refresh_lock", return_value=None
+    ), patch(
+        "app.api.endpoints.report.wait_refresh_lock_released",
+        side_effect=refreshed_by_other_worker,
+    ), patch(
+        "app.api.endpoints.report.get_details_by_organization_id"
+    ) as mock_get_details:
+        response = await client.get("/api/v2/report?inn=1234567894&term=2023")
+
+    assert response.status_code == 200
+    mock_get_details.assert_not_called()
+    data = response.json()
+    assert data["periods"] == [{"year": 2023, "reports": []}]
+
+
+@pytest.mark.asyncio
+async def test_get_report_v2_refreshes_when_other_worker_failed(
+    client: httpx.AsyncClient, db_session, mock_redis
+):
+    """Тест v2: блокировка снята, но отчёты не обновлены - запрос обновляет сам."""
+    from app.db.organization.repo import OrganizationRepo
+
+    org_repo = OrganizationRepo(db_session)
+    await org_repo.create_organization(
+        12345,
+        "1234567894",
+        {"short_name": "Test Org", "ogrn": "1234567894123", "index": "123123"},
+    )
+
+    with patch(
+        "app.api.endpoints.report.acquire_refresh_lock", return_value=None
+    ), patch(
+        "app.api.endpoints.report.wait_refresh_lock_released", return_value=True
+    ), patch(
+        "app.api.endpoints.report.get_details_by_organization_id"
+    ) as mock_get_details:
+        mock_get_details.return_value.reports = []
+        response = await client.get("/api/v2/report?inn=1234567894&term=2023")
+
+    assert response.status_code == 200
+    mock_get_details.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_report_negative_cache(
+    client: httpx.AsyncClient, db_session, mock_redis
+):
+    """Тест: повторные запросы неизвестного ИНН и организации без отчётов не идут в БФО."""
+    from app.exceptions import BfoOrganizationNotFoundException
+    from app.helpers.negative_cache import NegativeCache
+
+    mock_search_result = SearchOrganizationResult.model_construct(
+        id=54321,
+        short_name="Test Organization",
+        ogrn="1234567894123",
+        index="123456",
+    )
+    with patch(
+        "app.api.endpoints.report.organization_not_found_cache",
+        NegativeCache("organization_not_found"),
+    ), patch(
+        "app.api.endpoints.report.organization_no_reports_cache",
+        NegativeCache("no_reports"),
+    ), patch(
+        "app.api.endpoints.report.search_organization_by_inn",
+        side_effect=[
+            BfoOrganizationNotFoundException("7707083893"),
+            mock_search_result,
+        ],
+    ) as mock_search, patch(
+        "app.api.endpoints.report.get_details_by_organization_id",
+        return_value=GetDetailsResult.model_construct(reports=[]),
+    ) as mock_get_details:
+        for _ in range(2):
+            response = await client.get("/api/v2/report?inn=7707083893")
+            assert response.status_code == 404
+        for _ in range(2):
+            response = await client.get("/api/v2/report?inn=1234567894")
+            assert response.status_code == 200
+            assert response.json()["periods"] == []
+
+    assert mock_search.call_count == 2
+    assert mock_get_details.call_count == 1
+    assert mock_redis.set.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_report_response_cache(
+    client: httpx.AsyncClient, db_session, mock_redis, monkeypatch
+):
+    """Тест кэша ответов: промах сохраняет ответ, попадание не обращается к БД."""
+    from app.db.organization.repo import OrganizationRepo
+    from app.db.report.repo import ReportRepo
+    from app.helpers.response_cache import report_response_cache
+    from app.settings import settings
+
+    monkeypatch.setattr(settings, "REPORT_RESPONSE_CACHE_ENABLED", True)
+    org_repo = OrganizationRepo(db_session)
+    organization = await org_repo.create_organization(
+        12345,
+        "1234567894",
+        {"short_name": "Test Org", "ogrn": "1234567894123", "index": "123123"},
+    )
+    await ReportRepo(db_session).create_report(
+        organization_id=organization.id,
+        year=2023,
+        present_date=date(2023, 12, 31),
+        organization={"name": "Test Org"},
+        balance={"assets": 1000000},
+        finance={"revenue": 500000},
+    )
+    await db_session.commit()
+
+    mock_redis.get.return_value = "7"
+    with patch(
+        "app.helpers.response_cache.run_script", return_value=None
+    ):
+        response = await client.get("/api/v2/report?inn=1234567894&term=2023")
+    assert response.status_code == 200
+    key, value = mock_redis.set.call_args.args
+    assert key == report_response_cache.get_key("v2", "1234567894", [2023])
+    assert value == f"{organization.id}:7:{response.text}"
+
+    with patch(
+        "app.helpers.response_cache.run_script",
+        return_value=[str(organization.id), "7", "60000", response.text],
+    ), patch(
+        "app.db.organization.repo.OrganizationRepo.get_organization_by_inn"
+    ) as mock_get_organization:
+        cached_response = await client.get("/api/v2/report?inn=1234567894&term=2023")
+    assert cached_response.status_code == 200
+    assert cached_response.json() == response.json()
+    mock_get_organization.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_bfo_stats(client: httpx.AsyncClient, mock_redis):
+    """Тест эндпоинта состояния лимитов запросов к БФО."""
+    from app.schemas.redis import BfoRateLimitState
+
+    rate_limit = BfoRateLimitState(
+        allowed=True, wait_seconds=0, tokens=3.5, rate=0.5, burst=5
+    )
+    with patch("app.api.endpoints.stats.take_bfo_token", return_value=rate_limit):
+        response = await client.get("/api/stats/bfo")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["circuit_breaker"]["state"] == "closed"
+    assert data["proxies"][0]["name"] == "direct"
+    assert data["proxies"][0]["rate_limit"]["tokens"] == 3.5
+    assert {item["name"] for item in data["single_flight"]} == {
+        "organization",
+        "refresh",
+    }
+    assert {item["name"] for item in data["negative_cache"]} == {
+        "organization_not_found",
+        "no_reports",
+    }
+    assert set(data["response_cache"]) == {
+        "hits",
+        "misses",
+        "hit_ratio",
+        "bytes_served",
+    }
+
+
+@pytest.mark.asyncio
+async def test_get_report_cache_stats(client: httpx.AsyncClient):
+    """Тест эндпоинта состояния кэшей ответов."""
+    response = await client.get("/api/stats/cache")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["hot_cache"]["max_bytes"] > 0
+    assert "hit_ratio" in data["response_cache"]
+    assert "hit_ratio" in data["organization_cache"]
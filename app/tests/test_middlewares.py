@@ -0,0 +1,329 @@
+"""Тесты для middleware."""
+
+import asyncio
+from datetime import date, datetime, timezone
+import hashlib
+import json
+from typing import List
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import text
+
+from app.api.endpoints import report as report_endpoints
+from app.api.middlewares.endpoint_logger import (
+    ResponseBodyCapture,
+    make_history_record,
+)
+from app.db.sqlalchemy import PoolStats
+from app.helpers.history_writer import HistoryWriter, write_history
+from app.helpers.response_cache import report_response_cache
+from app.schemas.db.organization import Organization
+from app.schemas.db.report import Report, ReportFreshness
+from app.settings import settings
+from app.startup import create_application
+
+
+class StubResult:
+    """Результат запроса сессии-заглушки (CRUD.bulk_create читает rowcount)."""
+
+    rowcount = 0
+
+
+class StubSession:
+    """Сессия БД, которая только запоминает вызовы."""
+
+    def __init__(self):
+        self.calls: List[str] = []
+
+    async def execute(self, *args, **kwargs):
+        self.calls.append("execute")
+        return StubResult()
+
+    async def commit(self):
+        self.calls.append("commit")
+
+    async def rollback(self):
+        self.calls.append("rollback")
+
+    async def close(self):
+        self.calls.append("close")
+
+
+class StubSessionFactory:
+    def __init__(self):
+        self.sessions: List[StubSession] = []
+
+    def __call__(self) -> StubSession:
+        session = StubSession()
+        self.sessions.append(session)
+        return session
+
+
+NOW = datetime.now(timezone.utc)
+
+
+class StubOrganizationRepo:
+    def __init__(self, session):
+        pass
+
+    async def get_organization_by_inn(self, inn: str):
+        return Organization(
+            id=12345,
+            inn=inn,
+            created_at=NOW,
+            info={"short_name": "Test Org", "ogrn": "1234567894123", "index": "123456"},
+        )
+
+
+class StubReportRepo:
+    def __init__(self, session):
+        pass
+
+    async def get_last_report_freshness_by_organization_id(self, organization_id):
+        return ReportFreshness(
+            report_year=2023,
+            present_date=date(2024, 3, 31),
+            updated_at=NOW,
+            checked_at=NOW,
+        )
+
+    async def get_max_reports_by_organization_id(self, organization_id):
+        return [
+            Report(
+                id=1,
+                organization_id=organization_id,
+                report_year=2023,
+                present_date=date(2024, 3, 31),
+                created_at=NOW,
+                updated_at=NOW,
+                checked_at=NOW,
+                organization_sheet={"name": "Test Org"},
+                balance_sheet={str(code): code for code in range(1100, 1700, 10)},
+                financial_sheet={str(code): code for code in range(2100, 2500, 10)},
+            )
+        ]
+
+    async def get_reports_for_response(self, organization_id, periods=None):
+        report = (await self.get_max_reports_by_organization_id(organization_id))[0]
+        return {
+            report.report_year: [
+                report.model_dump(
+                    include={
+                        "present_date",
+                        "updated_at",
+                        "organization_sheet",
+                        "balance_sheet",
+                        "financial_sheet",
+                    }
+                )
+            ]
+        }
+
+
+@pytest.fixture
+def stub_repos(monkeypatch):
+    monkeypatch.setattr(report_endpoints, "OrganizationRepo", StubOrganizationRepo)
+    monkeypatch.setattr(report_endpoints, "ReportRepo", StubReportRepo)
+
+
+def make_client(fastapi_app: FastAPI, factory: StubSessionFactory) -> httpx.AsyncClient:
+    fastapi_app.state.db_session_factory = factory
+    fastapi_app.state.redis = AsyncMock()
+    fastapi_app.state.bfo_session = AsyncMock()
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(fastapi_app), base_url="http://test"
+    )
+
+
+@pytest.mark.asyncio
+async def test_middlewares_commit_rollback_and_history(stub_repos):
+    """Тест middleware: commit/rollback по коду ответа и запись в history."""
+    factory = StubSessionFactory()
+    async with make_client(create_application(), factory) as client:
+        response = await client.get("/api/v1/report?inn=1234567894")
+        assert response.status_code == 200
+        assert response.json()["short_name"] == "Test Org"
+        # сессия запроса и сессия записи лога
+        assert factory.sessions[0].calls == ["commit", "close"]
+        assert factory.sessions[1].calls == ["execute", "commit", "close"]
+
+        # отклонённый валидацией запрос не создаёт сессию, логируется только ответ
+        factory.sessions.clear()
+        response = await client.get("/api/v1/report?inn=123")
+        assert response.status_code == 422
+        assert len(factory.sessions) == 1
+        assert factory.sessions[0].calls == ["execute", "commit", "close"]
+
+        # эндпоинты без БД не создают сессию и не логируются
+        factory.sessions.clear()
+        response = await client.get("/api/stats/cache")
+        assert response.status_code == 200
+        assert len(factory.sessions) == 0
+
+
+@pytest.mark.asyncio
+async def test_report_response_cached_with_each_serialization(stub_repos, monkeypatch):
+    """Тест сохранения ответа в кэш ответов при валидации pydantic и при to_json."""
+    monkeypatch.setattr(settings, "REPORT_RESPONSE_CACHE_ENABLED", True)
+    bodies = {}
+    for mode in ("pydantic", "fast"):
+        monkeypatch.setattr(settings, "REPORT_FAST_SERIALIZATION", mode == "fast")
+        fastapi_app = create_application()
+        async with make_client(fastapi_app, StubSessionFactory()) as client:
+            redis = fastapi_app.state.redis
+            redis.get.return_value = None
+            with patch("app.helpers.response_cache.run_script", return_value=None):
+                response = await client.get("/api/v1/report?inn=1234567894")
+        assert response.status_code == 200
+        key, value = redis.set.call_args.args
+        assert key == report_response_cache.get_key("v1", "1234567894", None)
+        assert value == f"12345:0:{response.text}"
+        bodies[mode] = response.json()
+    assert bodies["fast"] == bodies["pydantic"]
+    assert bodies["pydantic"]["periods"][0]["year"] == 2023
+
+
+def test_response_body_capture_limits_size():
+    """Тест копии тела ответа: до лимита тело целиком, после - размер и sha256."""
+    body = json.dumps({"periods": list(range(100))}).encode()
+    chunks = [body[start : start + 16] for start in range(0, len(body), 16)]
+
+    capture = ResponseBodyCapture(len(body))
+    for chunk in chunks:
+        capture.append(chunk)
+    assert capture.truncated is False
+    assert capture.body() == body.decode()
+
+    capture = ResponseBodyCapture(len(body) - 1)
+    for chunk in chunks:
+        capture.append(chunk)
+    assert capture.truncated is True
+    assert json.loads(capture.body()) == {
+        "truncated": True,
+        "size": len(body),
+        "sha256": hashlib.sha256(body).hexdigest(),
+    }
+
+
+def make_record(status_code: int = 200):
+    now = datetime.now()
+    return make_history_record({"type": "http"}, status_code, "{}", now, now)
+
+
+@pytest.mark.asyncio
+async def test_history_writer_batches_and_drains_on_stop():
+    """Тест записи истории: пачки по размеру и времени, сохранение очереди при остановке."""
+    factory = StubSessionFactory()
+    writer = HistoryWriter(100, batch_size=3, flush_seconds=0.05)
+    writer.start(factory)
+
+    for _ in range(4):
+        assert writer.put(make_record()) is True
+    # полная пачка сразу, остаток - по истечении flush_seconds
+    await asyncio.sleep(0.2)
+    assert [session.calls for session in factory.sessions] == [
+        ["execute", "commit", "close"],
+        ["execute", "commit", "close"],
+    ]
+
+    writer.put(make_record())
+    writer.put(make_record())
+    await writer.stop(1)
+    assert writer.running is False
+    assert writer.stats() == {
+        "queue_size": 0,
+        "max_queue_size": 100,
+        "overflow_policy": "drop_new",
+        "written": 6,
+        "dropped": 0,
+        "failed": 0,
+        "batches": 3,
+    }
+
+
+@pytest.mark.asyncio
+async def test_history_writer_overflow_policies():
+    """Тест политик переполнения очереди истории."""
+    records = [make_record(status_code) for status_code in (200, 201, 202)]
+    # до запуска очереди нет, записи не принимаются
+    writer = HistoryWriter(2, batch_size=10, flush_seconds=1)
+    assert writer.put(records[0]) is False
+    assert writer.stats()["queue_size"] == 0
+
+    # задача записи не успевает прочитать очередь до первого await
+    writer.start(StubSessionFactory())
+    assert [writer.put(record) for record in records] == [True, True, False]
+    assert writer._queue.get_nowait().status_code == 200
+    await writer.stop(1)
+    assert writer._queue is None and writer.running is False
+
+    writer = HistoryWriter(2, 10, 1, overflow_policy="drop_oldest")
+    writer.start(StubSessionFactory())
+    assert [writer.put(record) for record in records] == [True, True, True]
+    assert writer._queue.get_nowait().status_code == 201
+    assert writer.stats()["dropped"] == 1
+    await writer.stop(1)
+
+    # при заполненной наполовину очереди принимается только доля sample_rate
+    writer = HistoryWriter(4, 10, 1, overflow_policy="sample", sample_rate=0)
+    writer.start(StubSessionFactory())
+    assert [writer.put(record) for record in records] == [True, True, False]
+    await writer.stop(1)
+
+    with pytest.raises(ValueError):
+        HistoryWriter(2, 10, 1, overflow_policy="block")
+
+
+class FailingSession(StubSession):
+    """Сессия, в которой INSERT пачки из нескольких записей падает."""
+
+    def __init__(self, records_count: int):
+        super().__init__()
+        self.records_count = records_count
+
+    async def execute(self, *args, **kwargs):
+        await super().execute(*args, **kwargs)
+        if self.records_count > 1:
+            raise ValueError("invalid input syntax for type json")
+
+
+@pytest.mark.asyncio
+async def test_write_history_falls_back_to_single_records(monkeypatch):
+    """Тест записи истории: при ошибке пачки записи сохраняются по одной."""
+    from app.db.history.repo import HistoryRepo
+
+    sessions: List[FailingSession] = []
+    batch_sizes: List[int] = []
+
+    async def create_histories(self, records):
+        batch_sizes.append(len(records))
+        await self._crud._session.execute(records)
+
+    def factory() -> FailingSession:
+        session = FailingSession(len(records) if not sessions else 1)
+        sessions.append(session)
+        return session
+
+    monkeypatch.setattr(HistoryRepo, "create_histories", create_histories)
+    records = [make_record() for _ in range(3)]
+    assert await write_history(factory, records) == 3
+    assert batch_sizes == [3, 1, 1, 1]
+    assert sessions[0].calls == ["execute", "rollback", "close"]
+    assert [session.calls for session in sessions[1:]] == [
+        ["execute", "commit", "close"]
+    ] * 3
+
+
+@pytest.mark.asyncio
+async def test_db_pool_stats(db_session):
+    """Тест счётчика выдачи соединений из пула."""
+    pool_stats = PoolStats()
+    pool_stats.watch(db_session.bind)
+
+    await db_session.execute(text("SELECT 1"))
+    assert pool_stats.stats() == {"checkouts": 1, "checkins": 0, "checked_out": 1}
+    await db_session.commit()
+    assert pool_stats.stats() == {"checkouts": 1, "checkins": 1, "checked_out": 0}
@@ -0,0 +1,179 @@
+"""Проверка планов запросов ReportRepo на синтетических данных."""
+import json
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.db.report.repo import ReportRepo
+from app.settings import settings
+
+YEARS = range(2010, 2025)
+CORRECTIONS = 2
+
+pytestmark = pytest.mark.skipif(
+    not settings.TEST_QUERY_PLANS_ENABLED,
+    reason="проверка планов запросов включается TEST_QUERY_PLANS_ENABLED",
+)
+
+
+@contextmanager
+def capture_statements(engine: AsyncEngine) -> Iterator[List[Tuple[str, Any]]]:
+    """Запросы к БД (в формате драйвера), выполненные внутри блока."""
+    statements: List[Tuple[str, Any]] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(
+            engine.sync_engine, "before_cursor_execute", before_cursor_execute
+        )
+
+
+def plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Все узлы плана запроса."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def explain(
+    session: AsyncSession, statement: str, parameters: Any
+) -> Dict[str, Any]:
+    """EXPLAIN (ANALYZE, BUFFERS) запроса."""
+    connection = await session.connection()
+    result = await connection.exec_driver_sql(
+        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters
+    )
+    explained = result.scalar_one()
+    if isinstance(explained, str):
+        explained = json.loads(explained)
+    return explained[0]
+
+
+@pytest.fixture
+async def seeded_reports(db_session: AsyncSession) -> int:
+    """Заполнить reports синтетическими отчётами, вернуть id организации."""
+    organizations = max(
+        settings.TEST_QUERY_PLAN_ROWS // (len(YEARS) * CORRECTIONS), 1
+    )
+    await db_session.execute(
+        text(
+            """
+            INSERT INTO organizations (id, inn, created_at, info)
+            SELECT o, lpad(o::text, 10, '0'), now(), '{}'::jsonb
+            FROM generate_series(1, :organizations) AS o
+            """
+        ),
+        {"organizations": organizations},
+    )
+    await db_session.execute(
+        text(
+            """
+            INSERT INTO reports (
+                organization_id, report_year, present_date,
+                created_at, updated_at, checked_at, content_hash,
+                organization_sheet, balance_sheet, financial_sheet
+            )
+            SELECT
+                o, y, make_date(y + 1, 3, 31) + c,
+                now(), now(), now() - random() * interval '30 days', md5(o::text),
+                '{"name": "Test Org"}'::jsonb, '{"1600": 1000}'::jsonb,
+                '{"2110": 500}'::jsonb
+            FROM generate_series(1, :organizations) AS o,
+                generate_series(:first_year, :last_year) AS y,
+                generate_series(0, :corrections - 1) AS c
+            """
+        ),
+        {
+            "organizations": organizations,
+            "first_year": YEARS[0],
+            "last_year": YEARS[-1],
+            "corrections": CORRECTIONS,
+        },
+    )
+    await db_session.execute(text("ANALYZE organizations, reports"))
+    await db_session.commit()
+    return organizations // 2 or 1
+
+
+@pytest.mark.asyncio
+async def test_report_repo_query_plans(
+    db_session: AsyncSession, engine: AsyncEngine, seeded_reports: int
+):
+    """Запросы ReportRepo используют индексы и укладываются в бюджет времени."""
+    organization_id = seeded_reports
+    report_repo = ReportRepo(db_session)
+    calls = {
+        "get_reports_by_organization_id_and_period": lambda: (
+            report_repo.get_reports_by_organization_id_and_period(
+                organization_id, 2020
+            )
+        ),
+        "get_reports_by_organization_id_and_periods": lambda: (
+            report_repo.get_reports_by_organization_id_and_periods(
+                organization_id, [2015, 2020, 2030]
+            )
+        ),
+        "get_last_report_by_organization_id": lambda: (
+            report_repo.get_last_report_by_organization_id(organization_id)
+        ),
+        "get_max_reports_by_organization_id": lambda: (
+            report_repo.get_max_reports_by_organization_id(organization_id)
+        ),
+        "get_last_report_freshness_by_organization_id": lambda: (
+            report_repo.get_last_report_freshness_by_organization_id(organization_id)
+        ),
+        "get_max_reports_freshness_by_organization_id": lambda: (
+            report_repo.get_max_reports_freshness_by_organization_id(organization_id)
+        ),
+        "get_checked_at_by_organization_id_and_periods": lambda: (
+            report_repo.get_checked_at_by_organization_id_and_periods(
+                organization_id, [2015, 2020, 2030]
+            )
+        ),
+        "is_all_periods_available": lambda: report_repo.is_all_periods_available(
+            organization_id, [2015, 2020, 2030]
+        ),
+        "get_reports_for_response": lambda: report_repo.get_reports_for_response(
+            organization_id, [2015, 2020, 2030]
+        ),
+        "get_reports_for_response (все периоды)": lambda: (
+            report_repo.get_reports_for_response(organization_id)
+        ),
+        "get_report_response_json": lambda: report_repo.get_report_response_json(
+            organization_id, [2015, 2020, 2030]
+        ),
+    }
+
+    errors = []
+    for name, call in calls.items():
+        with capture_statements(engine) as statements:
+            await call()
+        assert len(statements) > 0, name
+        for statement, parameters in statements:
+            explained = await explain(db_session, statement, parameters)
+            seq_scans = [
+                node["Relation Name"]
+                for node in plan_nodes(explained["Plan"])
+                if node["Node Type"] == "Seq Scan"
+            ]
+            elapsed = explained["Execution Time"]
+            print(f"\n{name}: {elapsed:.2f} ms")
+            if seq_scans or elapsed > settings.TEST_QUERY_PLAN_BUDGET_MS:
+                print(json.dumps(explained["Plan"], indent=2))
+            if seq_scans:
+                errors.append(f"{name}: seq scan on {', '.join(seq_scans)}")
+            if elapsed > settings.TEST_QUERY_PLAN_BUDGET_MS:
+                errors.append(
+                    f"{name}: {elapsed:.2f} ms > "
+                    f"{settings.TEST_QUERY_PLAN_BUDGET_MS} ms"
+                )
+
+    assert errors == []
@@ -1,12 +1,23 @@
 """Тесты для репозиториев."""
-from datetime import date
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+import time
+from typing import List
 
 import pytest
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import event, insert, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from app.db.crud import CRUD
+from app.db.history.repo import HistoryRepo
 from app.db.organization.repo import OrganizationRepo
+from app.db.report.models import ReportModel
 from app.db.report.repo import ReportRepo
+from app.helpers.history_partitions import maintain_history_partitions
+from app.helpers.organization_cache import organization_cache
 from app.schemas.bfo_api import DetailResult, CorrectionResult
+from app.schemas.db.history import HistoryRecord
+from app.settings import settings
 
 
 @pytest.mark.asyncio
@@ -64,6 +75,41 @@ async def test_organization_repo_get_organization_by_inn_not_existing(
     assert organization is None
 
 
+@pytest.mark.asyncio
+async def test_organization_repo_get_organization_by_inn_cached(
+    db_session: AsyncSession
+):
+    """Тест получения организации по ИНН из кэша без запроса к БД."""
+    repo = OrganizationRepo(db_session)
+    await repo.create_organization(12345, "1234567894", {"short_name": "Test Org"})
+    await db_session.commit()
+    # создание не кэширует организацию до фиксации, первое чтение - из БД
+    assert organization_cache.get("1234567894") is None
+    await repo.get_organization_by_inn("1234567894")
+    hits = organization_cache.hits
+
+    queries = []
+    engine = db_session.bind.sync_engine
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        organization = await repo.get_organization_by_inn("1234567894")
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    assert organization is not None
+    assert organization.id == 12345
+    assert queries == []
+    assert organization_cache.hits == hits + 1
+
+    # после удаления из кэша организация снова читается из БД
+    organization_cache.discard("1234567894")
+    assert await repo.get_organization_by_inn("1234567894") == organization
+
+
 @pytest.mark.asyncio
 async def test_report_repo_create_report(db_session: AsyncSession):
     """Тест создания отчёта."""
@@ -92,6 +138,53 @@ async def test_report_repo_create_report(db_session: AsyncSession):
     assert report.financial_sheet == {"revenue": 500000}
 
 
+@pytest.mark.asyncio
+async def test_organization_repo_create_organization_concurrently(
+    db_session: AsyncSession
+):
+    """Тест одновременного создания одной организации из разных сессий."""
+    session_maker = async_sessionmaker(bind=db_session.bind, expire_on_commit=False)
+
+    async def create(short_name: str):
+        async with session_maker() as session:
+            organization = await OrganizationRepo(session).create_organization(
+                12345, "1234567894", {"short_name": short_name}
+            )
+            await session.commit()
+            return organization
+
+    first, second = await asyncio.gather(create("First"), create("Second"))
+
+    assert first.id == second.id == 12345
+    assert first.created_at == second.created_at
+    organization_cache.clear()
+    organization = await OrganizationRepo(db_session).get_organization_by_inn(
+        "1234567894"
+    )
+    assert organization is not None
+    assert organization.info["short_name"] in {"First", "Second"}
+
+
+@pytest.mark.asyncio
+async def test_report_repo_create_report_twice(db_session: AsyncSession):
+    """Тест повторного создания той же корректировки отчёта."""
+    await OrganizationRepo(db_session).create_organization(
+        12345, "1234567894", {"short_name": "Test Org"}
+    )
+    report_repo = ReportRepo(db_session)
+    report = await report_repo.create_report(
+        12345, 2023, date(2023, 12, 31), {}, {"assets": 1}, {}
+    )
+
+    updated = await report_repo.create_report(
+        12345, 2023, date(2023, 12, 31), {}, {"assets": 2}, {}
+    )
+
+    assert updated.id == report.id
+    assert updated.balance_sheet == {"assets": 2}
+    assert updated.content_hash != report.content_hash
+
+
 @pytest.mark.asyncio
 async def test_report_repo_get_reports_by_organization_id_and_period(
     db_session: AsyncSession
@@ -186,6 +279,51 @@ async def test_report_repo_get_max_reports_by_organization_id(
     assert all(r.report_year == 2023 for r in reports)
 
 
+@pytest.mark.asyncio
+async def test_report_repo_get_reports_freshness_by_organization_id(
+    db_session: AsyncSession
+):
+    """Тест поиска дат отчётов без загрузки листов."""
+    org_repo = OrganizationRepo(db_session)
+    organization = await org_repo.create_organization(
+        12345, "1234567894", {"short_name": "Test Org"}
+    )
+    report_repo = ReportRepo(db_session)
+    assert (
+        await report_repo.get_last_report_freshness_by_organization_id(
+            organization.id
+        )
+        is None
+    )
+    for year, present_date in (
+        (2022, date(2023, 3, 31)),
+        (2023, date(2024, 3, 31)),
+        (2023, date(2024, 6, 30)),
+    ):
+        await report_repo.create_report(
+            organization_id=organization.id,
+            year=year,
+            present_date=present_date,
+            organization={"name": "Test Org"},
+            balance={},
+            finance={},
+        )
+
+    last = await report_repo.get_last_report_freshness_by_organization_id(
+        organization.id
+    )
+    assert last is not None
+    assert last.checked_at is not None
+
+    freshness = await report_repo.get_max_reports_freshness_by_organization_id(
+        organization.id
+    )
+    assert [(f.report_year, f.present_date) for f in freshness] == [
+        (2023, date(2024, 3, 31)),
+        (2023, date(2024, 6, 30)),
+    ]
+
+
 @pytest.mark.asyncio
 async def test_report_repo_is_all_periods_available(db_session: AsyncSession):
     """Тест проверки доступности периодов."""
@@ -217,6 +355,55 @@ async def test_report_repo_is_all_periods_available(db_session: AsyncSession):
     assert 2024 in non_available
 
 
+@pytest.mark.asyncio
+async def test_report_repo_get_reports_by_organization_id_and_periods(
+    db_session: AsyncSession
+):
+    """Тест поиска отчётов за несколько лет одним запросом."""
+    org_repo = OrganizationRepo(db_session)
+    organization = await org_repo.create_organization(
+        12345, "1234567894", {"short_name": "Test Org"}
+    )
+    report_repo = ReportRepo(db_session)
+    for year, present_date in (
+        (2022, date(2023, 3, 31)),
+        (2023, date(2024, 3, 31)),
+        (2023, date(2024, 6, 30)),
+    ):
+        await report_repo.create_report(
+            organization_id=organization.id,
+            year=year,
+            present_date=present_date,
+            organization={},
+            balance={},
+            finance={},
+        )
+    # отчёт за 2022 год устарел
+    await db_session.execute(
+        update(ReportModel)
+        .where(ReportModel.report_year == 2022)
+        .values(
+            checked_at=datetime.now(timezone.utc)
+            - timedelta(days=settings.REPORT_AVAILABLE_DAYS + 1)
+        )
+    )
+
+    reports, non_available = (
+        await report_repo.get_reports_by_organization_id_and_periods(
+            organization.id, [2022, 2023, 2024]
+        )
+    )
+
+    assert sorted(reports) == [2022, 2023, 2024]
+    assert len(reports[2022]) == 1
+    assert [r.present_date for r in reports[2023]] == [
+        date(2024, 3, 31),
+        date(2024, 6, 30),
+    ]
+    assert reports[2024] == []
+    assert sorted(non_available) == [2022, 2024]
+
+
 @pytest.mark.asyncio
 async def test_report_repo_update_or_create_report_from_bfo(
     db_session: AsyncSession
@@ -311,3 +498,309 @@ async def test_report_repo_update_existing_report_from_bfo(
     assert reports[0].organization_sheet == {"name": "New Name"}
     assert reports[0].balance_sheet == {"assets": 1000000}
 
+
+def make_bfo_details(
+    years: int, corrections: int, name: str = "Test Org"
+) -> List[DetailResult]:
+    """Данные из БФО: years периодов по corrections корректировок."""
+    return [
+        DetailResult.model_construct(
+            id=year,
+            period=2000 + year,
+            corrections=[
+                CorrectionResult.model_construct(
+                    id=correction,
+                    date_present=date(2001 + year, 3, 31)
+                    + timedelta(days=correction),
+                    requierd_audit=False,
+                    organization_info={"name": name},
+                    balance={"assets": correction},
+                    financial={"revenue": correction},
+                )
+                for correction in range(corrections)
+            ],
+        )
+        for year in range(years)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_report_repo_update_or_create_report_from_bfo_chunks(
+    db_session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+):
+    """Тест upsert корректировок несколькими пачками и с повторами."""
+    monkeypatch.setattr(settings, "REPORT_UPSERT_CHUNK_SIZE", 4)
+    org_repo = OrganizationRepo(db_session)
+    organization = await org_repo.create_organization(
+        12345, "1234567894", {"short_name": "Test Org"}
+    )
+
+    details = make_bfo_details(3, 3)
+    # повтор корректировки в одном ответе: побеждает последняя
+    details[0].corrections.append(
+        CorrectionResult.model_construct(
+            id=99,
+            date_present=details[0].corrections[0].date_present,
+            requierd_audit=False,
+            organization_info={"name": "Duplicate"},
+            balance={},
+            financial={},
+        )
+    )
+
+    report_repo = ReportRepo(db_session)
+    await report_repo.update_or_create_report_from_bfo(organization.id, details)
+    await report_repo.update_or_create_report_from_bfo(organization.id, details)
+
+    reports = await report_repo.get_reports_by_organization_id_and_period(
+        organization.id, 2000
+    )
+    assert len(reports) == 3
+    assert {"name": "Duplicate"} in [r.organization_sheet for r in reports]
+    for year in (2001, 2002):
+        reports = await report_repo.get_reports_by_organization_id_and_period(
+            organization.id, year
+        )
+        assert len(reports) == 3
+
+
+async def update_or_create_report_from_bfo_loop(
+    session: AsyncSession, organization_id: int, details: List[DetailResult]
+):
+    """Прежняя реализация: UPDATE и, при необходимости, INSERT на корректировку."""
+    for detail in details:
+        for correction in detail.corrections:
+            query = (
+                update(ReportModel)
+                .where(
+                    ReportModel.organization_id == organization_id,
+                    ReportModel.report_year == detail.period,
+                    ReportModel.present_date == correction.date_present,
+                )
+                .values(
+                    organization_sheet=correction.organization_info,
+                    balance_sheet=correction.balance,
+                    financial_sheet=correction.financial,
+                )
+                .returning(ReportModel.id)
+            )
+            updated_row = await session.execute(query)
+            if len(updated_row.scalars().all()) == 0:
+                query = insert(ReportModel).values(
+                    organization_id=organization_id,
+                    report_year=detail.period,
+                    present_date=correction.date_present,
+                    organization_sheet=correction.organization_info,
+                    balance_sheet=correction.balance,
+                    financial_sheet=correction.financial,
+                )
+                await session.execute(query)
+
+
+@pytest.mark.perf
+@pytest.mark.asyncio
+async def test_report_repo_update_or_create_report_from_bfo_benchmark(
+    db_session: AsyncSession, record_property
+):
+    """Сравнение upsert пачкой с прежним циклом по корректировкам."""
+    org_repo = OrganizationRepo(db_session)
+    loop_organization = await org_repo.create_organization(
+        1, "1234567894", {"short_name": "Loop"}
+    )
+    upsert_organization = await org_repo.create_organization(
+        2, "1234567895", {"short_name": "Upsert"}
+    )
+    report_repo = ReportRepo(db_session)
+    details = make_bfo_details(15, 5)
+
+    # первый проход создаёт отчёты, второй обновляет
+    for name in ("create", "update"):
+        started = time.perf_counter()
+        await update_or_create_report_from_bfo_loop(
+            db_session, loop_organization.id, details
+        )
+        loop_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await report_repo.update_or_create_report_from_bfo(
+            upsert_organization.id, details
+        )
+        upsert_elapsed = time.perf_counter() - started
+        record_property(f"{name}_loop_ms", loop_elapsed * 1000)
+        record_property(f"{name}_upsert_ms", upsert_elapsed * 1000)
+
+    for year in (2000, 2014):
+        loop_reports = await report_repo.get_reports_by_organization_id_and_period(
+            loop_organization.id, year
+        )
+        upsert_reports = await report_repo.get_reports_by_organization_id_and_period(
+            upsert_organization.id, year
+        )
+        assert len(loop_reports) == len(upsert_reports) == 5
+
+
+@pytest.mark.asyncio
+async def test_report_repo_update_unchanged_report_from_bfo(
+    db_session: AsyncSession
+):
+    """Тест повторного обновления из БФО теми же данными."""
+    org_repo = OrganizationRepo(db_session)
+    organization = await org_repo.create_organization(
+        12345, "1234567894", {"short_name": "Test Org"}
+    )
+    report_repo = ReportRepo(db_session)
+    await report_repo.update_or_create_report_from_bfo(
+        organization.id, make_bfo_details(1, 1)
+    )
+    await db_session.commit()
+    (created,) = await report_repo.get_reports_by_organization_id_and_period(
+        organization.id, 2000
+    )
+    assert created.content_hash is not None
+
+    # те же данные: меняется только checked_at
+    await report_repo.update_or_create_report_from_bfo(
+        organization.id, make_bfo_details(1, 1)
+    )
+    await db_session.commit()
+    (unchanged,) = await report_repo.get_reports_by_organization_id_and_period(
+        organization.id, 2000
+    )
+    assert unchanged.updated_at == created.updated_at
+    assert unchanged.checked_at > created.checked_at
+    assert unchanged.content_hash == created.content_hash
+
+    # новые данные перезаписывают листы отчёта
+    await report_repo.update_or_create_report_from_bfo(
+        organization.id, make_bfo_details(1, 1, name="New Name")
+    )
+    await db_session.commit()
+    (changed,) = await report_repo.get_reports_by_organization_id_and_period(
+        organization.id, 2000
+    )
+    assert changed.updated_at > unchanged.updated_at
+    assert changed.organization_sheet == {"name": "New Name"}
+    assert changed.content_hash != unchanged.content_hash
+
+
+@pytest.mark.asyncio
+async def test_crud_bulk_operations_and_iteration(db_session: AsyncSession):
+    """Тест пакетных операций CRUD и потокового чтения по частям."""
+    await OrganizationRepo(db_session).create_organization(
+        12345, "1234567894", {"short_name": "Test Org"}
+    )
+    crud = CRUD(session=db_session, cls_model=ReportModel)
+    rows = [
+        {
+            "organization_id": 12345,
+            "report_year": 2000 + year,
+            "present_date": date(2000 + year, 3, 31),
+            "balance_sheet": {"assets": year},
+        }
+        for year in range(25)
+    ]
+
+    assert await crud.bulk_create(models_data=rows[:20], chunk_size=7) == 20
+    # существующие корректировки обновляются, новые создаются
+    for row in rows:
+        row["balance_sheet"] = {"assets": -row["report_year"]}
+    assert (
+        await crud.bulk_upsert(
+            models_data=rows,
+            conflict_target=["organization_id", "report_year", "present_date"],
+            chunk_size=10,
+        )
+        == 25
+    )
+    assert (
+        await crud.bulk_upsert(
+            models_data=rows,
+            conflict_target="uq_reports_organization_id_report_year_present_date",
+            update_fields=[],
+        )
+        == 0
+    )
+    assert await crud.get_count() == 25
+
+    for server_side in (False, True):
+        chunks = [
+            chunk
+            async for chunk in crud.iter_chunks(chunk_size=10, server_side=server_side)
+        ]
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+        reports = [report for chunk in chunks for report in chunk]
+        assert [report.id for report in reports] == sorted(
+            report.id for report in reports
+        )
+        assert {report.balance_sheet["assets"] for report in reports} == {
+            -year for year in range(2000, 2025)
+        }
+
+    ids = [reports[0].id, reports[-1].id, -1]
+    assert {report.id for report in await crud.get_many(pkey_vals=ids)} == set(
+        ids[:2]
+    )
+
+    await db_session.commit()
+    await db_session.execute(text("ANALYZE reports"))
+    assert await crud.get_count(estimate=True) == 25
+
+
+@pytest.mark.asyncio
+async def test_history_partitions_maintenance(db_session: AsyncSession, monkeypatch):
+    """
+    Тест секций history: создание вперёд (с переносом строк, уже попавших в
+    history_default) и удаление старше срока хранения.
+    """
+    monkeypatch.setattr(settings, "REQUEST_HISTORY_PARTITIONS_AHEAD", 2)
+    monkeypatch.setattr(settings, "REQUEST_HISTORY_RETENTION_MONTHS", 12)
+    history_repo = HistoryRepo(db_session)
+    await history_repo.create_partition(
+        "history_p202409", date(2024, 9, 1), date(2024, 10, 1)
+    )
+    await history_repo.create_partition(
+        "history_p202410", date(2024, 10, 1), date(2024, 11, 1)
+    )
+    # вторая запись - за месяц без секции, попадает в history_default
+    await history_repo.create_histories(
+        [
+            HistoryRecord(
+                request={"type": "http"},
+                status_code=200,
+                response="{}",
+                started_at=started_at,
+                finished_at=started_at,
+            )
+            for started_at in (
+                datetime(2024, 9, 15, tzinfo=timezone.utc),
+                datetime(2025, 11, 5, tzinfo=timezone.utc),
+            )
+        ]
+    )
+
+    result = await maintain_history_partitions(db_session, date(2025, 10, 17))
+
+    assert result == {
+        "created": ["history_p202510", "history_p202511", "history_p202512"],
+        "detached": ["history_p202409"],
+        "dropped": ["history_p202409"],
+    }
+    assert await history_repo.get_partitions() == [
+        "history_default",
+        "history_p202410",
+        "history_p202510",
+        "history_p202511",
+        "history_p202512",
+    ]
+    rows = await db_session.execute(text("SELECT count(*) FROM history"))
+    assert rows.scalar() == 1
+    rows = await db_session.execute(text("SELECT count(*) FROM history_p202511"))
+    assert rows.scalar() == 1
+    rows = await db_session.execute(text("SELECT count(*) FROM history_default"))
+    assert rows.scalar() == 0
+    # повторный запуск ничего не меняет
+    assert await maintain_history_partitions(db_session, date(2025, 10, 17)) == {
+        "created": [],
+        "detached": [],
+        "dropped": [],
+    }